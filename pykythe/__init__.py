@@ -1 +1,8 @@
-# empty
+"""Python indexer for Kythe.
+
+The command line is in __main__; api has the in-process API.
+"""
+
+from .api import index_source, index_source_to
+
+__all__ = ['index_source', 'index_source_to']
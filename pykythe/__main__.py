@@ -1,7 +1,66 @@
 #!/usr/bin/env python3.6
 """Main program for Python parser that outputs JSON facts.
 
-This uses lib2to3, which supports both Python2 and Python3 syntax.
+This uses lib2to3, which supports both Python2 and Python3 syntax;
+alternatively (--front_end=cpython), Python3 source can be parsed
+using CPython's ast module, which is faster (see ast_cpython).
+
+There are three ways of running this:
+  - one-shot: parse --srcpath, writing the results to --out_fqn_expr
+    (or to stdout, if it's "-": this is how pykythe.pl's
+    run_parse_cmd reads the results, through a pipe)
+  - --batch_manifest: parse all the files listed in the manifest, in
+    parallel (see _batch)
+  - --serve: read requests from stdin (one JSON object per line, with
+    the same keys as the command line options, e.g.,
+    {"srcpath": "foo/bar.py", "module": "foo.bar", "kythe_corpus": "",
+    "kythe_root": "", "python_version": 3, "front_end": "lib2to3"})
+    and for each request write a framed result to stdout. The frame
+    is a header line "fqn_expr <length>" or "error <length>", followed
+    by <length> bytes: for "fqn_expr", this is the same as the contents
+    of the --out_fqn_expr file; for "error", it's an error message. This
+    allows a single process to be used for parsing all the modules
+    (see run_parse_cmd in pykythe.pl), avoiding the cost of starting
+    Python and loading the grammar for each file.
+
+With --stream_stmts, the fqn_expr output is a sequence of framed
+records instead of two JSON lines (see _fqn_expr_frames), with one
+record per top-level statement, written as soon as the statement has
+been processed; with --serve, a request with "stream_stmts": true gets
+these records as its response (instead of a single "fqn_expr" frame).
+This lets the reader (read_nodes_stream/4 in pykythe.pl) start
+processing the first statements while the rest are being converted,
+and neither side needs to hold the whole FQN tree at once.
+
+With --parse_cache_dir, the fqn_expr output is cached, keyed by a hash
+of the source and everything else that affects the output (see
+_cache_path), so that unchanged files aren't reprocessed. The cache
+directory can be shared by multiple processes.
+
+With --low_memory, each processing stage's result is released as soon
+as the next stage has consumed it: the FQN tree is written one
+top-level statement at a time (each cooked statement is released once
+its add_fqns has been written), and the source's base64 encoding (for
+Meta.contents_b64) is written in chunks rather than being kept as a
+string. The output is the same. --memory_stats writes the memory use
+of each stage to stderr (see _MemoryStats).
+
+With --prune, subtrees that have no names in them are dropped or
+emptied while converting the parse tree (see ast_raw.PRUNE_KINDS):
+docstrings and other expression statements, the text of strings, and
+the items of lists, dicts, sets and tuples of literals. pykythe.pl
+produces the same Kythe facts from the pruned output, which for
+data-heavy modules (e.g., big constant tables or generated protobuf
+code) is much smaller.
+
+With --out_format=prolog, each item of the fqn_expr output (the
+meta-data, the FQN tree, or a --stream_stmts record's payload) is a
+Prolog term followed by a full stop, instead of a line of JSON. The
+terms are in the form that pykythe.pl uses (see api.write_fqn_expr),
+so pykythe.pl can read them with read_term/3, without a JSON parser.
+scripts/bench_out_format.py compares the two formats.
+
+For debugging, --dump_stage writes the intermediate results to stderr.
 """
 
 # TODO: The code here is temporary scaffolding, and will change
@@ -9,28 +68,36 @@ This uses lib2to3, which supports both Python2 and Python3 syntax.
 
 import argparse
 import base64
-import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import io
 import json
 import logging
+import os
+import resource
 import sys
-from typing import List  # pylint: disable=unused-import
+import time
+import tracemalloc
+from typing import (  # pylint: disable=unused-import
+    IO, Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple)
 from .typing_debug import cast as xcast
 
-from . import ast, ast_raw, ast_cooked
+from . import api, ast_cooked, ast_raw, pod
 
 
 def main() -> int:
     """Main (uses sys.argv)."""
     parser = argparse.ArgumentParser(
         description='Parse Python file, generating Kythe facts')
-    # TODO: allow nargs='+' for multiple inputs?
-    parser.add_argument('--srcpath', required=True, help='Input file')
+    # For multiple inputs, use --batch_manifest.
+    parser.add_argument('--srcpath', help='Input file')
     parser.add_argument(
-        '--module', required=True, help='FQN of module corresponding to --src')
+        '--module', help='FQN of module corresponding to --src')
     parser.add_argument(
         '--out_fqn_expr',
-        required=True,
-        help=('output file for fqn_expr JSON facts. '
+        help=('output file for fqn_expr JSON facts ("-" for stdout). '
               'These are post-processed to further resolve names.'))
     parser.add_argument(
         '--kythe_corpus',
@@ -48,49 +115,814 @@ def main() -> int:
         choices=[2, 3],
         type=int,
         help='Python major version')
+    parser.add_argument(
+        '--front_end',
+        default='lib2to3',
+        choices=['lib2to3', 'cpython'],
+        help=('Parser to use: lib2to3 (Python 2 or 3) or '
+              "CPython's ast module (Python 3 only)"))
+    parser.add_argument(
+        '--dump_stage',
+        action='append',
+        default=[],
+        choices=_DUMP_STAGES,
+        help=('Write a debug dump of a processing stage to stderr '
+              '(may be repeated): raw (parse tree), cooked (cooked nodes), '
+              'json (cooked nodes as JSON), fqn (nodes with FQNs)'))
+    parser.add_argument(
+        '--prune',
+        action='append',
+        default=[],
+        choices=ast_raw.PRUNE_KINDS,
+        help=('Prune subtrees that have no names, to make the output '
+              'smaller (may be repeated; lib2to3 front end only): exprs '
+              '(expression statements, e.g. docstrings), strings (the '
+              'text of strings), containers (the items of lists, dicts, '
+              'sets, tuples). The Kythe facts are unchanged'))
+    parser.add_argument(
+        '--stream_stmts',
+        action='store_true',
+        help=('Write the fqn_expr output as framed records, one per '
+              'top-level statement'))
+    parser.add_argument(
+        '--out_format',
+        default=api.OUT_FORMATS[0],
+        choices=api.OUT_FORMATS,
+        help=('Format of the fqn_expr output: json, or prolog (terms '
+              'that pykythe.pl can read with read_term/3)'))
+    parser.add_argument(
+        '--parse_cache_dir',
+        help=('Directory for caching fqn_expr outputs, keyed by a hash of '
+              'the source and options (created if needed; can be shared '
+              'by concurrent processes)'))
+    parser.add_argument(
+        '--low_memory',
+        action='store_true',
+        help=('Release each stage as soon as it has been consumed, '
+              'writing the output statement by statement'))
+    parser.add_argument(
+        '--memory_stats',
+        action='store_true',
+        help=('Write the memory use (tracemalloc and peak RSS) of each '
+              'processing stage to stderr'))
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help=('Read requests from stdin (one JSON object per line) and '
+              'write framed fqn_expr results to stdout'))
+    parser.add_argument(
+        '--batch_manifest',
+        help=('File with one line per input: srcpath, module, '
+              'out_fqn_expr (tab-separated)'))
+    parser.add_argument(
+        '--jobs',
+        default=0,
+        type=int,
+        help='Number of processes for --batch_manifest (0 means #cores)')
     args = parser.parse_args()
+    dump_stages = frozenset(args.dump_stage)
+    prune = frozenset(args.prune)
+    if args.front_end == 'cpython':
+        # Imported here, as in api.cook_source.
+        from . import ast_cpython  # pylint: disable=import-outside-toplevel
+        try:
+            ast_cpython.check_version()
+        except ValueError as exc:
+            parser.error(str(exc))
 
-    with open(args.srcpath, 'rb') as src_f:
-        src_content = xcast(bytes, src_f.read())
-        # TODO: add to ast.File: args.root, args.corpus (even though in Meta)
-        src_file = ast.make_file(
-            path=args.srcpath, content=src_content, encoding='utf-8'
-        )  # TODO: get encoding from lib2to3.pgen2.tokenize.detect_encoding
-        parse_tree = ast_raw.parse(src_content, args.python_version)
-
-    # b64encode returns bytes, so use decode() to turn it into a
-    # string, because json.dumps can't process bytes.
-    meta = ast_cooked.Meta(
+    if args.serve:
+        return _serve(sys.stdin.buffer, sys.stdout.buffer, dump_stages,
+                      args.parse_cache_dir, prune, args.out_format)
+    if args.batch_manifest:
+        return _batch(
+            args.batch_manifest,
+            kythe_corpus=args.kythe_corpus,
+            kythe_root=args.kythe_root,
+            python_version=args.python_version,
+            front_end=args.front_end,
+            prune=prune,
+            dump_stages=dump_stages,
+            parse_cache_dir=args.parse_cache_dir,
+            stream_stmts=args.stream_stmts,
+            out_format=args.out_format,
+            low_memory=args.low_memory,
+            memory_stats=args.memory_stats,
+            jobs=args.jobs or os.cpu_count() or 1)
+
+    for required in ('srcpath', 'module', 'out_fqn_expr'):
+        if getattr(args, required) is None:
+            parser.error('--{} is required (unless --serve or '
+                         '--batch_manifest)'.format(required))
+    _process_to_file(
+        srcpath=args.srcpath,
+        module=args.module,
+        out_fqn_expr=args.out_fqn_expr,
         kythe_corpus=args.kythe_corpus,
         kythe_root=args.kythe_root,
-        path=args.srcpath,
-        language='python',
-        contents_b64=base64.b64encode(src_content).decode('ascii'),
-        encoding=src_file.encoding)
-
-    logging.debug('RAW= %r', parse_tree)
-    cooked_nodes = ast_raw.cvt_parse_tree(
-        parse_tree, args.python_version, src_file)
-    logging.debug('COOKED= %r', cooked_nodes)
-    cooked_nodes_json_dict = cooked_nodes.as_json_dict()
-    logging.debug('AS_JSON_DICT= %r', cooked_nodes_json_dict)
-    logging.debug('AS_JSON: %s', json.dumps(cooked_nodes_json_dict))
-    fqn_ctx = ast_cooked.FqnCtx(
-        fqn_dot=args.module + '.',
-        bindings=collections.ChainMap(collections.OrderedDict()),
-        class_fqn=None,
-        class_astn=None,
-        python_version=args.python_version)
+        python_version=args.python_version,
+        front_end=args.front_end,
+        prune=prune,
+        dump_stages=dump_stages,
+        parse_cache_dir=args.parse_cache_dir,
+        stream_stmts=args.stream_stmts,
+        out_format=args.out_format,
+        low_memory=args.low_memory,
+        memory_stats=args.memory_stats)
+    logging.debug('Finished')
+    return 0
+
+
+def _process_to_file(*, srcpath: str, module: str, out_fqn_expr: str,
+                     kythe_corpus: str, kythe_root: str, python_version: int,
+                     front_end: str, dump_stages: FrozenSet[str],
+                     parse_cache_dir: Optional[str],
+                     prune: FrozenSet[str] = frozenset(),
+                     stream_stmts: bool = False, out_format: str = 'json',
+                     low_memory: bool = False,
+                     memory_stats: bool = False) -> int:
+    """Parse a source file, writing the results to out_fqn_expr.
+
+    If out_fqn_expr is '-', the results are written to stdout. If
+    stream_stmts, the results are written as framed records (see
+    _fqn_expr_frames). The items are in out_format (see
+    api.write_fqn_expr). If parse_cache_dir is given, the results are
+    copied from there if they've already been computed (unless any
+    stages are to be dumped), and otherwise are added to it. If
+    low_memory, each stage is released as soon as possible (see
+    _write_fqn_expr_low_memory).
+    If memory_stats, the memory use of each stage is written to stderr.
+
+    Returns:
+      The size of the source file (for statistics).
+    """
+    memory = _MemoryStats(srcpath) if memory_stats else None
+    src_content = _read_source(srcpath)
+    src_size = len(src_content)
+    _memory_stage(memory, 'read')
+    cache_path = _cache_path(
+        parse_cache_dir,
+        srcpath=srcpath,
+        src_content=src_content,
+        module=module,
+        kythe_corpus=kythe_corpus,
+        kythe_root=kythe_root,
+        python_version=python_version,
+        front_end=front_end,
+        prune=prune,
+        stream_stmts=stream_stmts,
+        out_format=out_format)
+    if cache_path and not dump_stages:
+        cached = _cache_get(cache_path)
+        if cached is not None:
+            logging.debug('Cache hit for %r: %r', srcpath, cache_path)
+            if out_fqn_expr == '-':
+                sys.stdout.buffer.write(cached)
+                sys.stdout.flush()
+            else:
+                with open(out_fqn_expr, 'wb') as out_fqn_expr_file:
+                    out_fqn_expr_file.write(cached)
+            _memory_stage(memory, 'cached')
+            return src_size
+    if stream_stmts:
+        meta, cooked_nodes, fqn_ctx = _cook_content(
+            srcpath=srcpath,
+            src_content=src_content,
+            module=module,
+            kythe_corpus=kythe_corpus,
+            kythe_root=kythe_root,
+            python_version=python_version,
+            front_end=front_end,
+            prune=prune,
+            dump_stages=dump_stages,
+            memory=memory,
+            low_memory=low_memory)
+        if low_memory:
+            del src_content
+        with _open_out_fqn_expr(out_fqn_expr,
+                                cache_path) as out_fqn_expr_file:
+            logging.debug('Output fqn= %r', out_fqn_expr_file)
+            for frame in _fqn_expr_frames(
+                    meta, cooked_nodes, fqn_ctx, dump_stages,
+                    release=low_memory, out_format=out_format):
+                out_fqn_expr_file.write(frame.decode('utf-8'))
+        _memory_stage(memory, 'fqn+write')
+    elif low_memory:
+        meta, cooked_nodes, fqn_ctx = _cook_content(
+            srcpath=srcpath,
+            src_content=src_content,
+            module=module,
+            kythe_corpus=kythe_corpus,
+            kythe_root=kythe_root,
+            python_version=python_version,
+            front_end=front_end,
+            prune=prune,
+            dump_stages=dump_stages,
+            memory=memory,
+            low_memory=True,
+            encode_contents=False)
+        with _open_out_fqn_expr(out_fqn_expr,
+                                cache_path) as out_fqn_expr_file:
+            logging.debug('Output fqn= %r', out_fqn_expr_file)
+            _write_meta_low_memory(meta, src_content, out_fqn_expr_file,
+                                   out_format)
+            del src_content
+            _memory_stage(memory, 'meta')
+            _write_fqn_expr_low_memory(cooked_nodes, fqn_ctx, dump_stages,
+                                       out_fqn_expr_file, out_format)
+        _memory_stage(memory, 'fqn+write')
+    else:
+        meta, add_fqns = _process_content(
+            srcpath=srcpath,
+            src_content=src_content,
+            module=module,
+            kythe_corpus=kythe_corpus,
+            kythe_root=kythe_root,
+            python_version=python_version,
+            front_end=front_end,
+            prune=prune,
+            dump_stages=dump_stages,
+            memory=memory)
+        with _open_out_fqn_expr(out_fqn_expr,
+                                cache_path) as out_fqn_expr_file:
+            logging.debug('Output fqn= %r', out_fqn_expr_file)
+            api.write_fqn_expr(meta, add_fqns, out_fqn_expr_file,
+                               out_format)
+        _memory_stage(memory, 'write')
+    _memory_stage(memory, 'done')
+    return src_size
+
+
+@contextlib.contextmanager
+def _open_out_fqn_expr(out_fqn_expr: str,
+                       cache_path: Optional[str]) -> Iterator[IO[str]]:
+    """Open out_fqn_expr ('-' for stdout) for writing.
+
+    If cache_path is given, the contents are added to the cache after
+    they've been written. For stdout, they're collected in a buffer
+    for this (stdout can't be read back).
+    """
+    if out_fqn_expr != '-':
+        with open(out_fqn_expr, 'w', encoding='utf-8') as out_fqn_expr_file:
+            yield out_fqn_expr_file
+        if cache_path:
+            with open(out_fqn_expr, 'rb') as out_fqn_expr_file:
+                _cache_put(cache_path, out_fqn_expr_file.read())
+    elif cache_path:
+        with io.StringIO() as out_fqn_expr_buf:
+            yield out_fqn_expr_buf
+            content = out_fqn_expr_buf.getvalue().encode('utf-8')
+        _cache_put(cache_path, content)
+        sys.stdout.buffer.write(content)
+        sys.stdout.flush()
+    else:
+        yield sys.stdout
+        sys.stdout.flush()
+
+
+def _read_source(srcpath: str) -> bytes:
+    with open(srcpath, 'rb') as src_f:
+        return xcast(bytes, src_f.read())
+
+
+def _process(*, srcpath: str, module: str, kythe_corpus: str,
+             kythe_root: str, python_version: int, front_end: str,
+             dump_stages: FrozenSet[str], prune: FrozenSet[str] = frozenset()
+             ) -> Tuple[ast_cooked.Meta, ast_cooked.Base]:
+    """Parse a source file, returning the meta-data and the FQN tree.
+
+    The stages in dump_stages are written to stderr (see _dump).
+    """
+    return _process_content(
+        srcpath=srcpath,
+        src_content=_read_source(srcpath),
+        module=module,
+        kythe_corpus=kythe_corpus,
+        kythe_root=kythe_root,
+        python_version=python_version,
+        front_end=front_end,
+        prune=prune,
+        dump_stages=dump_stages)
+
+
+def _process_content(*, srcpath: str, src_content: bytes, module: str,
+                     kythe_corpus: str, kythe_root: str, python_version: int,
+                     front_end: str, dump_stages: FrozenSet[str],
+                     prune: FrozenSet[str] = frozenset(),
+                     memory: Optional['_MemoryStats'] = None
+                     ) -> Tuple[ast_cooked.Meta, ast_cooked.Base]:
+    """Parse a source file's contents (see _process)."""
+    meta, cooked_nodes, fqn_ctx = _cook_content(
+        srcpath=srcpath,
+        src_content=src_content,
+        module=module,
+        kythe_corpus=kythe_corpus,
+        kythe_root=kythe_root,
+        python_version=python_version,
+        front_end=front_end,
+        prune=prune,
+        dump_stages=dump_stages,
+        memory=memory)
     add_fqns = cooked_nodes.add_fqns(fqn_ctx)
+    _memory_stage(memory, 'fqn')
+    _dump(dump_stages, 'fqn', lambda: repr(add_fqns))
+    return meta, add_fqns
 
-    with open(args.out_fqn_expr, 'w') as out_fqn_expr_file:
-        logging.debug('Output fqn= %r', out_fqn_expr_file)
-        print(meta.as_json_str(), file=out_fqn_expr_file)
-        print(add_fqns.as_json_str(), file=out_fqn_expr_file)
-    logging.debug('Finished')
+
+def _cook_content(*,
+                  srcpath: str,
+                  src_content: bytes,
+                  module: str,
+                  kythe_corpus: str,
+                  kythe_root: str,
+                  python_version: int,
+                  front_end: str,
+                  dump_stages: FrozenSet[str],
+                  prune: FrozenSet[str] = frozenset(),
+                  memory: Optional['_MemoryStats'] = None,
+                  low_memory: bool = False,
+                  encode_contents: bool = True
+                  ) -> Tuple[ast_cooked.Meta, ast_cooked.Base, ast_cooked.
+                             FqnCtx]:
+    """Parse a source file's contents, up to (but not including) add_fqns.
+
+    This is api.cook_source, with the dumps and memory statistics. If
+    low_memory, the parse tree is garbage collected as soon as it has
+    been converted (see api.cook_source for this and for
+    encode_contents).
+
+    Returns:
+      The meta-data, the cooked nodes, and the context for add_fqns.
+    """
+
+    def on_stage(stage: str, value: Any) -> None:
+        _memory_stage(memory, stage)
+        if stage == 'parse':
+            _dump(dump_stages, 'raw', lambda: repr(value))
+        else:
+            _dump(dump_stages, 'cooked', lambda: repr(value))
+            _dump(dump_stages, 'json', value.as_json_str)
+
+    return api.cook_source(
+        src_content,
+        path=srcpath,
+        module=module,
+        corpus=kythe_corpus,
+        root=kythe_root,
+        python_version=python_version,
+        front_end=front_end,
+        prune=prune,
+        encode_contents=encode_contents,
+        collect_parse_tree=low_memory,
+        on_stage=on_stage)
+
+
+_DUMP_STAGES = ('raw', 'cooked', 'json', 'fqn')
+
+
+def _dump(dump_stages: FrozenSet[str], stage: str,
+          value: Callable[[], str]) -> None:
+    """Write a debug dump of a processing stage to stderr, if requested.
+
+    value() is called only if the stage is in dump_stages, so there's
+    no cost when dumps aren't requested. The "raw" stage is only
+    available with the lib2to3 front end.
+    """
+    if stage in dump_stages:
+        print('{}= {}'.format(stage.upper(), value()), file=sys.stderr)
+
+
+def _cache_path(parse_cache_dir: Optional[str], *, srcpath: str,
+                src_content: bytes, module: str, kythe_corpus: str,
+                kythe_root: str, python_version: int, front_end: str,
+                prune: FrozenSet[str] = frozenset(),
+                stream_stmts: bool = False,
+                out_format: str = 'json') -> Optional[str]:
+    """Get the path of the cache entry for a source file's fqn_expr output.
+
+    The key is a hash of everything that the output depends on: the
+    source, the options, and the pykythe sources (so that changing
+    pykythe invalidates the cache).
+
+    Returns:
+      None if there's no parse_cache_dir; otherwise the path in
+      parse_cache_dir (which might not exist).
+    """
+    if not parse_cache_dir:
+        return None
+    key = hashlib.sha256()
+    key.update(_pykythe_sources_hash())
+    key_options = [
+        srcpath, module, kythe_corpus, kythe_root, python_version, front_end
+    ]  # type: List[Any]
+    if prune:
+        key_options.append(sorted(prune))
+    if stream_stmts:
+        key_options.append('stream_stmts')
+    if out_format != 'json':
+        key_options.append(out_format)
+    key.update(json.dumps(key_options).encode('utf-8'))
+    key.update(b'\0')
+    key.update(src_content)
+    key_hex = key.hexdigest()
+    return os.path.join(parse_cache_dir, key_hex[:2], key_hex + '.fqn-json')
+
+
+@functools.lru_cache(maxsize=None)
+def _pykythe_sources_hash() -> bytes:
+    """Get a hash of the pykythe sources (computed once)."""
+    sources_hash = hashlib.sha256()
+    pykythe_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(pykythe_dir)):
+        if name.endswith('.py'):
+            sources_hash.update(name.encode('utf-8') + b'\0')
+            with open(os.path.join(pykythe_dir, name), 'rb') as source_f:
+                sources_hash.update(
+                    hashlib.sha256(source_f.read()).digest())
+    return sources_hash.digest()
+
+
+def _cache_get(cache_path: str) -> Optional[bytes]:
+    """Get a cache entry, or None if it doesn't exist."""
+    try:
+        with open(cache_path, 'rb') as cache_f:
+            return xcast(bytes, cache_f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _cache_put(cache_path: str, content: bytes) -> None:
+    """Add a cache entry.
+
+    The content is written to a temporary file in the same directory,
+    which is then renamed, so that other processes never see a
+    partially written entry (if two processes write the same entry,
+    the contents are the same, so it doesn't matter which one wins).
+    """
+    # tempfile is imported here because it's slow to import and it's
+    # only needed with --parse_cache_dir.
+    import tempfile  # pylint: disable=import-outside-toplevel
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_f:
+            tmp_f.write(content)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _fqn_expr_frames(meta: ast_cooked.Meta,
+                     cooked_nodes: ast_cooked.Base,
+                     fqn_ctx: ast_cooked.FqnCtx,
+                     dump_stages: FrozenSet[str],
+                     release: bool = False,
+                     out_format: str = 'json') -> Iterator[bytes]:
+    """Generate the fqn_expr output as framed records (--stream_stmts).
+
+    Each record is a header line "<kind> <length>" followed by <length>
+    bytes of UTF-8 (pykythe.pl reads them as bytes): an item in
+    out_format (see api.write_fqn_expr_item). The records are:
+      meta: the ast_cooked.Meta
+      file_input: the ast_cooked.FileInput, with empty stmts
+      stmt: add_fqns of a top-level statement (repeated)
+      end: (length 0) end of the output
+    Each statement's record is generated as soon as its add_fqns is
+    done, and isn't kept after that. If release, the cooked statements
+    are also released as they're processed (see
+    ast_cooked.FileInput.add_fqns_stmts).
+    """
+    if not isinstance(cooked_nodes, ast_cooked.FileInput):
+        raise TypeError('Expected FileInput, not {}'.format(  # pragma: no cover
+            cooked_nodes.__class__.__name__))
+    yield _frame('meta', meta, out_format)
+    yield _frame(
+        'file_input',
+        ast_cooked.FileInput(
+            path=cooked_nodes.path,
+            stmts=[],
+            scope_bindings=cooked_nodes.scope_bindings), out_format)
+    for stmt in cooked_nodes.add_fqns_stmts(fqn_ctx, release=release):
+        _dump(dump_stages, 'fqn', functools.partial(repr, stmt))
+        yield _frame('stmt', stmt, out_format)
+    yield b'end 0\n'
+
+
+# For each out_format: the output for the contents_b64 slot of a
+# Meta, with an empty value, and for the stmts slot of a FileInput,
+# with no statements, and the separator between list items. There's no
+# ambiguity in finding these in the output for the whole node, because
+# any quote in a string value is escaped.
+_EMPTY_CONTENTS_B64 = {
+    'json': '"contents_b64": {"kind": "str", "value": ""}',
+    'prolog': "'contents_b64':str(\"\")",
+}
+_EMPTY_STMTS = {'json': '"stmts": []', 'prolog': "'stmts':[]"}
+_LIST_SEP = {'json': ', ', 'prolog': ','}
+
+# The size of the chunks for base64 encoding. This must be a multiple
+# of 3, so that the encoded chunks can be concatenated.
+_BASE64_CHUNK = 3 * 64 * 1024
+
+
+def _write_meta_low_memory(meta: ast_cooked.Meta, src_content: bytes,
+                           out: IO[str], out_format: str = 'json') -> None:
+    """Write the meta-data item of the fqn_expr output (--low_memory).
+
+    meta.contents_b64 must be empty; it's written from src_content,
+    encoding a chunk at a time. The output is the same as from
+    api.write_fqn_expr.
+    """
+    head, sep, tail = _fqn_expr_item(meta, out_format).partition(
+        _EMPTY_CONTENTS_B64[out_format])
+    assert sep, meta
+    out.write(head)
+    out.write(sep[:-2])
+    for start in range(0, len(src_content), _BASE64_CHUNK):
+        out.write(
+            base64.b64encode(
+                src_content[start:start + _BASE64_CHUNK]).decode('ascii'))
+    out.write(sep[-2:])
+    out.write(tail)
+
+
+def _write_fqn_expr_low_memory(cooked_nodes: ast_cooked.Base,
+                               fqn_ctx: ast_cooked.FqnCtx,
+                               dump_stages: FrozenSet[str],
+                               out: IO[str],
+                               out_format: str = 'json') -> None:
+    """Write the FQN tree item of the fqn_expr output (--low_memory).
+
+    Each top-level statement is written as soon as its add_fqns is
+    done, and the cooked statement is released (so cooked_nodes can't
+    be used afterwards). The output is the same as from
+    api.write_fqn_expr.
+    """
+    if not isinstance(cooked_nodes, ast_cooked.FileInput):
+        raise TypeError('Expected FileInput, not {}'.format(  # pragma: no cover
+            cooked_nodes.__class__.__name__))
+    head, sep, tail = _fqn_expr_item(
+        ast_cooked.FileInput(
+            path=cooked_nodes.path,
+            stmts=[],
+            scope_bindings=cooked_nodes.scope_bindings),
+        out_format).partition(_EMPTY_STMTS[out_format])
+    assert sep, cooked_nodes.path
+    out.write(head)
+    out.write(sep[:-1])
+    item_sep = ''
+    for stmt in cooked_nodes.add_fqns_stmts(fqn_ctx, release=True):
+        _dump(dump_stages, 'fqn', functools.partial(repr, stmt))
+        out.write(item_sep)
+        if out_format == 'prolog':
+            stmt.write_prolog(out)
+        else:
+            stmt.write_json(out)
+        item_sep = _LIST_SEP[out_format]
+    out.write(sep[-1:])
+    out.write(tail)
+
+
+class _MemoryStats:
+    """Memory use of each processing stage (--memory_stats).
+
+    tracemalloc is started when this is created, if it isn't already
+    running, and isn't stopped (it slows things down considerably, so
+    --memory_stats is only for measurements). At the end of each
+    stage, a line is written to stderr with the memory allocated by
+    Python (from tracemalloc) now and its high-water mark during the
+    stage (or since the start, if tracemalloc.reset_peak isn't
+    available, before Python 3.9), and the peak RSS of the process so
+    far.
+    """
+
+    __slots__ = ['srcpath']
+
+    def __init__(self, srcpath: str) -> None:
+        self.srcpath = srcpath
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, stage: str) -> None:
+        """Report the memory use at the end of a stage."""
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()  # pylint: disable=no-member
+        # ru_maxrss is in KB (Linux)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(
+            'MEMORY {} {:<9s} traced: {:8.1f} MB  traced peak: {:8.1f} MB  '
+            'peak RSS: {:8.1f} MB'.format(self.srcpath, stage,
+                                          current / 1024 / 1024,
+                                          peak / 1024 / 1024, max_rss / 1024),
+            file=sys.stderr)
+
+
+def _memory_stage(memory: Optional[_MemoryStats], stage: str) -> None:
+    """Report the memory use at the end of a stage, if requested."""
+    if memory:
+        memory.stage(stage)
+
+
+def _frame(kind: str, node: pod.PlainOldDataExtended,
+           out_format: str = 'json') -> bytes:
+    """Make a framed record (see _fqn_expr_frames).
+
+    The header's length is of the UTF-8 encoded payload, not of the
+    str (they differ if the payload has any non-ASCII characters).
+    """
+    payload = _fqn_expr_item(node, out_format).encode('utf-8')
+    return b'%s %d\n' % (kind.encode('ascii'), len(payload)) + payload
+
+
+def _fqn_expr_item(node: pod.PlainOldDataExtended, out_format: str) -> str:
+    """Get an item of the fqn_expr output (see api.write_fqn_expr_item)."""
+    with io.StringIO() as out:
+        api.write_fqn_expr_item(node, out, out_format)
+        return out.getvalue()
+
+
+def _batch(manifest_path: str, *, kythe_corpus: str, kythe_root: str,
+           python_version: int, front_end: str,
+           dump_stages: FrozenSet[str], parse_cache_dir: Optional[str],
+           jobs: int, prune: FrozenSet[str] = frozenset(),
+           stream_stmts: bool = False, out_format: str = 'json',
+           low_memory: bool = False, memory_stats: bool = False) -> int:
+    """Process all the files in a manifest, using multiple processes.
+
+    Each line of the manifest has srcpath, module, out_fqn_expr
+    (separated by tabs); blank lines and lines starting with "#" are
+    ignored. A failure in one file doesn't stop the other files from
+    being processed; a summary of throughput and failures is written
+    to stderr at the end.
+
+    Returns:
+      0 if all the files were successfully processed; 1 otherwise.
+    """
+    with open(manifest_path) as manifest_f:
+        entries = [
+            line.rstrip('\n').split('\t') for line in manifest_f
+            if line.strip() and not line.startswith('#')
+        ]
+    for entry in entries:
+        if len(entry) != 3:
+            raise ValueError('Invalid manifest line in {}: {!r}'.format(
+                manifest_path, '\t'.join(entry)))
+    start_time = time.perf_counter()
+    total_bytes = 0
+    failures = []  # type: List[Tuple[str, str]]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                _process_to_file,
+                srcpath=srcpath,
+                module=module,
+                out_fqn_expr=out_fqn_expr,
+                kythe_corpus=kythe_corpus,
+                kythe_root=kythe_root,
+                python_version=python_version,
+                front_end=front_end,
+                prune=prune,
+                dump_stages=dump_stages,
+                parse_cache_dir=parse_cache_dir,
+                stream_stmts=stream_stmts,
+                out_format=out_format,
+                low_memory=low_memory,
+                memory_stats=memory_stats): srcpath
+            for srcpath, module, out_fqn_expr in entries
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                total_bytes += future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                failures.append((futures[future], '{}: {}'.format(
+                    type(exc).__name__, exc)))
+    elapsed = time.perf_counter() - start_time
+    for srcpath, failure in sorted(failures):
+        print('FAILED {}: {}'.format(srcpath, failure), file=sys.stderr)
+    print(
+        'Processed {} files ({} failed), {:.0f} KB in {:.2f} sec '
+        'with {} processes: {:.1f} files/sec, {:.1f} KB/sec'.format(
+            len(entries), len(failures), total_bytes / 1024, elapsed, jobs,
+            len(entries) / elapsed if elapsed else 0.0,
+            total_bytes / 1024 / elapsed if elapsed else 0.0),
+        file=sys.stderr)
+    return 1 if failures else 0
+
+
+def _serve(in_f: IO[bytes],
+           out_f: IO[bytes],
+           dump_stages: FrozenSet[str],
+           parse_cache_dir: Optional[str],
+           prune: FrozenSet[str] = frozenset(),
+           out_format: str = 'json') -> int:
+    """Process requests from in_f, writing framed results to out_f.
+
+    See the module docstring for the request and result formats (prune
+    and out_format are the defaults for requests without "prune" or
+    "out_format"). A failure in processing a request is reported as an
+    "error" frame (for a "stream_stmts" request, possibly after some of
+    its records); the server then continues with the next request.
+    """
+    for line in in_f:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line.decode('utf-8'))
+            request.setdefault('prune', sorted(prune))
+            request.setdefault('out_format', out_format)
+            if request.get('stream_stmts'):
+                _serve_stream_request(request, out_f, dump_stages,
+                                      parse_cache_dir)
+                continue
+            payload = _serve_request(request, dump_stages, parse_cache_dir)
+            status = b'fqn_expr'
+        except Exception as exc:  # pylint: disable=broad-except
+            logging.exception('Failed request: %r', line)
+            status = b'error'
+            payload = '{}: {}'.format(type(exc).__name__, exc).encode(
+                'ascii', 'backslashreplace')
+        out_f.write(b'%s %d\n' % (status, len(payload)))
+        out_f.write(payload)
+        out_f.flush()
+    logging.debug('Finished serving')
     return 0
 
 
+def _serve_request(request: Dict[str, Any], dump_stages: FrozenSet[str],
+                   parse_cache_dir: Optional[str]) -> bytes:
+    """Process a single --serve request, returning the fqn_expr output."""
+    options = _serve_options(request)
+    out_format = request.get('out_format', 'json')
+    src_content = _read_source(options['srcpath'])
+    cache_path = _cache_path(
+        parse_cache_dir,
+        src_content=src_content,
+        out_format=out_format,
+        **options)
+    if cache_path and not dump_stages:
+        cached = _cache_get(cache_path)
+        if cached is not None:
+            return cached
+    meta, add_fqns = _process_content(
+        src_content=src_content, dump_stages=dump_stages, **options)
+    with io.StringIO() as result_io:
+        api.write_fqn_expr(meta, add_fqns, result_io, out_format)
+        payload = result_io.getvalue().encode('utf-8')
+    if cache_path:
+        _cache_put(cache_path, payload)
+    return payload
+
+
+def _serve_stream_request(request: Dict[str, Any], out_f: IO[bytes],
+                          dump_stages: FrozenSet[str],
+                          parse_cache_dir: Optional[str]) -> None:
+    """Process a "stream_stmts" --serve request, writing its records.
+
+    Each record (see _fqn_expr_frames) is flushed as soon as it's
+    available.
+    """
+    options = _serve_options(request)
+    out_format = request.get('out_format', 'json')
+    src_content = _read_source(options['srcpath'])
+    cache_path = _cache_path(
+        parse_cache_dir,
+        src_content=src_content,
+        stream_stmts=True,
+        out_format=out_format,
+        **options)
+    if cache_path and not dump_stages:
+        cached = _cache_get(cache_path)
+        if cached is not None:
+            out_f.write(cached)
+            out_f.flush()
+            return
+    meta, cooked_nodes, fqn_ctx = _cook_content(
+        src_content=src_content, dump_stages=dump_stages, **options)
+    frames = []  # type: List[bytes]
+    for frame in _fqn_expr_frames(
+            meta, cooked_nodes, fqn_ctx, dump_stages, out_format=out_format):
+        out_f.write(frame)
+        out_f.flush()
+        if cache_path:
+            frames.append(frame)
+    if cache_path:
+        _cache_put(cache_path, b''.join(frames))
+
+
+def _serve_options(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the processing options from a --serve request."""
+    return dict(
+        srcpath=request['srcpath'],
+        module=request['module'],
+        kythe_corpus=request.get('kythe_corpus', ''),
+        kythe_root=request.get('kythe_root', ''),
+        python_version=int(request.get('python_version', 3)),
+        front_end=request.get('front_end', 'lib2to3'),
+        prune=frozenset(request.get('prune', ())))
+
+
 if __name__ == '__main__':
     if sys.version_info < (3, 6):
         # Can't use f'...' because that requires 3.6:
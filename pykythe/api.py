@@ -0,0 +1,193 @@
+"""In-process API for the front end: source content to fqn_expr.
+
+This does the same processing as the command line (see __main__), but
+from a memory buffer, without any files:
+
+    fqn_expr = pykythe.index_source(
+        content, path='foo/bar.py', module='foo.bar')
+
+`fqn_expr` is the same as the contents of the --out_fqn_expr file: a
+JSON line with the ast_cooked.Meta, followed by a JSON line with the
+FQN tree (or, with out_format='prolog', the same as Prolog terms; see
+write_fqn_expr). index_source_to writes the same output to a stream.
+
+cook_source and write_fqn_expr are the steps that these are made
+from; they're also used by __main__.
+"""
+
+import base64
+import gc
+import io
+from typing import IO, Any, Callable, FrozenSet, Optional, Tuple
+
+from . import ast, ast_cooked, ast_raw, pod
+
+# Called after each stage of cook_source, with the stage's name and
+# result: 'parse' (the lib2to3 parse tree; not with the cpython front
+# end) and 'cvt' (the cooked nodes).
+StageCallback = Callable[[str, Any], None]
+
+
+def index_source(content: bytes,
+                 *,
+                 path: str,
+                 module: str,
+                 corpus: str = '',
+                 root: str = '',
+                 python_version: int = 3,
+                 front_end: str = 'lib2to3',
+                 prune: FrozenSet[str] = frozenset(),
+                 out_format: str = 'json') -> bytes:
+    """Parse a source file's contents, returning the fqn_expr output.
+
+    Args:
+      content: the source
+      path: the source's path (for Meta.path and error messages)
+      module: the FQN of the module
+      corpus: Kythe corpus (for Meta.kythe_corpus)
+      root: Kythe root (for Meta.kythe_root)
+      python_version: 2 or 3
+      front_end: 'lib2to3' or 'cpython' (Python 3 only)
+      prune: the kinds of subtrees to prune, from ast_raw.PRUNE_KINDS
+        (lib2to3 front end only). These don't affect the Kythe facts
+        that pykythe.pl produces, but they make the output smaller.
+      out_format: 'json' or 'prolog' (see write_fqn_expr)
+    """
+    with io.StringIO() as out:
+        index_source_to(
+            out,
+            content,
+            path=path,
+            module=module,
+            corpus=corpus,
+            root=root,
+            python_version=python_version,
+            front_end=front_end,
+            prune=prune,
+            out_format=out_format)
+        return out.getvalue().encode('utf-8')
+
+
+def index_source_to(out: IO[str],
+                    content: bytes,
+                    *,
+                    path: str,
+                    module: str,
+                    corpus: str = '',
+                    root: str = '',
+                    python_version: int = 3,
+                    front_end: str = 'lib2to3',
+                    prune: FrozenSet[str] = frozenset(),
+                    out_format: str = 'json') -> None:
+    """Parse a source file's contents, writing the fqn_expr output to out.
+
+    See index_source for the arguments.
+    """
+    meta, cooked_nodes, fqn_ctx = cook_source(
+        content,
+        path=path,
+        module=module,
+        corpus=corpus,
+        root=root,
+        python_version=python_version,
+        front_end=front_end,
+        prune=prune)
+    write_fqn_expr(meta, cooked_nodes.add_fqns(fqn_ctx), out, out_format)
+
+
+def cook_source(content: bytes,
+                *,
+                path: str,
+                module: str,
+                corpus: str,
+                root: str,
+                python_version: int,
+                front_end: str,
+                prune: FrozenSet[str] = frozenset(),
+                encode_contents: bool = True,
+                collect_parse_tree: bool = False,
+                on_stage: Optional[StageCallback] = None
+                ) -> Tuple[ast_cooked.Meta, ast_cooked.Base, ast_cooked.
+                           FqnCtx]:
+    """Parse a source file's contents, up to (but not including) add_fqns.
+
+    If not encode_contents, the meta-data's contents_b64 is left empty
+    (the caller can write it separately; see
+    __main__._write_meta_low_memory). If collect_parse_tree, the parse
+    tree is garbage collected as soon as it has been converted (it has
+    reference cycles, so it isn't freed when it's no longer
+    referenced).
+
+    Returns:
+      The meta-data, the cooked nodes, and the context for add_fqns.
+    """
+    # TODO: add to ast.File: args.root, args.corpus (even though in Meta)
+    src_file = ast.make_file(
+        path=path, content=content, encoding='utf-8'
+    )  # TODO: get encoding from lib2to3.pgen2.tokenize.detect_encoding
+
+    # b64encode returns bytes, so use decode() to turn it into a
+    # string, because json.dumps can't process bytes.
+    meta = ast_cooked.Meta(
+        kythe_corpus=corpus,
+        kythe_root=root,
+        path=path,
+        language='python',
+        contents_b64=(base64.b64encode(content).decode('ascii')
+                      if encode_contents else ''),
+        encoding=src_file.encoding)
+
+    if front_end == 'cpython':
+        if prune:
+            raise ValueError(
+                'prune is only supported by the lib2to3 front end')
+        # Imported here, so that it doesn't add to the start-up time
+        # when it isn't used.
+        from . import ast_cpython  # pylint: disable=import-outside-toplevel
+        cooked_nodes = ast_cpython.cvt_file(src_file, python_version)
+    else:
+        parse_tree = ast_raw.parse(content, python_version)
+        if on_stage:
+            on_stage('parse', parse_tree)
+        cooked_nodes = ast_raw.cvt_parse_tree(parse_tree, python_version,
+                                              src_file, prune)
+        del parse_tree  # not needed by the following stages
+        if collect_parse_tree:
+            gc.collect()
+    if on_stage:
+        on_stage('cvt', cooked_nodes)
+    fqn_ctx = ast_cooked.FqnCtx.for_module(module, python_version)
+    return meta, cooked_nodes, fqn_ctx
+
+
+def write_fqn_expr(meta: ast_cooked.Meta,
+                   add_fqns: ast_cooked.Base,
+                   out: IO[str],
+                   out_format: str = 'json') -> None:
+    """Write the fqn_expr output (meta-data item, then FQN tree item).
+
+    With out_format 'json', each item is a line of JSON; with 'prolog',
+    each is a Prolog term followed by a full stop and newline, in the
+    form that pykythe.pl makes from the JSON (see
+    pod.PlainOldDataExtended.write_prolog), so that pykythe.pl can read
+    it with read_term/3.
+    """
+    write_fqn_expr_item(meta, out, out_format)
+    write_fqn_expr_item(add_fqns, out, out_format)
+
+
+def write_fqn_expr_item(node: pod.PlainOldDataExtended, out: IO[str],
+                        out_format: str) -> None:
+    """Write a single item of the fqn_expr output (see write_fqn_expr)."""
+    if out_format == 'json':
+        node.write_json(out)
+        out.write('\n')
+    elif out_format == 'prolog':
+        node.write_prolog(out)
+        out.write('.\n')
+    else:
+        raise ValueError('Unknown out_format: {!r}'.format(out_format))
+
+
+# The values of out_format (the first is the default).
+OUT_FORMATS = ('json', 'prolog')
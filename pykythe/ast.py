@@ -1,6 +1,8 @@
 """AST node operations."""
 
-import codecs
+import array
+import re
+import sys
 from dataclasses import dataclass
 from lib2to3 import pytree
 from typing import Text
@@ -21,38 +23,92 @@ class Astn(pod.PlainOldDataExtended):
 
 @dataclass(frozen=True)
 class File(pod.PlainOldData):
-    """Encapsulate a file for offsets, etc."""
+    """Encapsulate a file for offsets, etc.
+
+    Attributes:
+      path: the file's path
+      content: the file's contents (bytes)
+      encoding: the encoding of content (e.g., 'utf-8')
+      line_offsets: line_offsets[lineno] is the byte offset of the
+          start of line `lineno` (1-origin: line_offsets[0] is not
+          used); there is an extra item at the end, with the length of
+          content.
+      numlines: number of lines (line terminators) in content
+      is_ascii: True if content is ASCII, so that lib2to3's columns
+          (which are character offsets) are the same as byte offsets.
+    """
 
     path: Text
     content: bytes
     encoding: Text
-    line_offsets: dict
+    line_offsets: 'array.array[int]'
     numlines: int
+    is_ascii: bool
 
-    __slots__ = ['path', 'content', 'line_offsets', 'encoding', 'numlines']
+    __slots__ = [
+        'path', 'content', 'line_offsets', 'encoding', 'numlines', 'is_ascii'
+    ]
 
     def astn_to_range(self, astn: pytree.Base) -> Astn:
-        """Get the Kythe anchor range from an AST leaf node."""
+        """Get the Kythe anchor range from an AST leaf node.
+
+        Names are interned, so that all the Astns for a name share a
+        single string.
+        """
         astn = xcast(pytree.Leaf, astn)
-        offset = self.line_offsets[astn.lineno] + astn.column
+        value = astn.value
+        if value.isidentifier():
+            value = sys.intern(value)
+        if self.is_ascii:
+            start = self.line_offsets[astn.lineno] + astn.column
+            return Astn(value=value, start=start, end=start + len(value))
+        start = self.offset(astn.lineno, astn.column)
         return Astn(
-            value=astn.value, start=offset, end=offset + len(astn.value))
-
-
-def make_file(path: Text, content: Text, encoding: Text) -> File:
-    line_offsets = {1: 0}
-    # TODO: this only works with ASCII right now ... need to instead
-    #       use a decoding iterator to get bytes that correspond to
-    #       (unicode) characters
-    lineno = 1
-    for offset, char in enumerate(codecs.decode(content, encoding)):
-        # TODO: make this work with Windows '\r\n', Mac '\r'
-        if char == '\n':
-            lineno += 1
-            line_offsets[lineno] = offset + 1
+            value=value,
+            start=start,
+            end=start + len(value.encode(self.encoding)))
+
+    def offset(self, lineno: int, column: int) -> int:
+        """Get the byte offset of a (lineno, column) position.
+
+        `column` is a character offset within the line (as given by
+        lib2to3 or the tokenize module).
+        """
+        line_offset = self.line_offsets[lineno]
+        if self.is_ascii:
+            return line_offset + column
+        line = self.content[line_offset:self.line_offsets[lineno + 1]]
+        if line.isascii():
+            return line_offset + column
+        return line_offset + len(
+            line.decode(self.encoding)[:column].encode(self.encoding))
+
+
+def make_file(path: Text, content: bytes, encoding: Text) -> File:
+    """Create a File, with the offsets of the start of each line.
+
+    Lines can end with '\\n', '\\r\\n', or '\\r'.
+    """
+    line_offsets = array.array('q', [0, 0])
+    if b'\r' in content:
+        line_offsets.extend(
+            match.end() for match in _NEWLINE_RE.finditer(content))
+    else:
+        append = line_offsets.append
+        find = content.find
+        offset = find(b'\n')
+        while offset >= 0:
+            append(offset + 1)
+            offset = find(b'\n', offset + 1)
+    numlines = len(line_offsets) - 2
+    line_offsets.append(len(content))
     return File(
         path=path,
         content=content,
         encoding=encoding,
         line_offsets=line_offsets,
-        numlines=lineno - 1)
+        numlines=numlines,
+        is_ascii=content.isascii())
+
+
+_NEWLINE_RE = re.compile(rb'\r\n?|\n')
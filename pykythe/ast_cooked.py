@@ -49,16 +49,14 @@ we can therefore deduce that `c` is also of type `class(C)`.
 """
 
 from __future__ import annotations
-import collections
 import dataclasses
 from dataclasses import dataclass
 import functools
 import logging  # pylint: disable=unused-import
 from typing import (  # pylint: disable=unused-import
-    Any, Mapping, MutableMapping, Iterable, List, Optional, Sequence, Text,
-    TypeVar)
+    Any, Dict, Generator, Mapping, MutableMapping, Iterable, Iterator, List,
+    Optional, Sequence, Text, Tuple, TypeVar)
 import typing
-from mypy_extensions import Arg  # pylint: disable=unused-import
 
 from . import ast, pod, typing_debug
 from .typing_debug import cast as xcast
@@ -68,6 +66,65 @@ from .typing_debug import cast as xcast
 # pylint: disable=too-many-lines
 
 
+class ScopeTable:
+    """Mapping of names to FQNs for a scope and its enclosing scopes.
+
+    This is used like collections.ChainMap: new_child() makes the
+    table for a nested scope, and new names are added to the innermost
+    scope. But a name that's found in an enclosing scope is also added
+    to the table of the scope where it was looked up, so that further
+    lookups of the name there don't search the enclosing scopes -- in
+    deeply nested code (e.g., comprehensions inside methods inside
+    classes), most names are looked up in O(1) time instead of time
+    proportional to the nesting depth.
+
+    This gives the same results as ChainMap because a name is only
+    added to a scope (by NameBindsNode.add_fqns, NameRefNode.add_fqns,
+    CompForNode.add_fqns) while that scope is the innermost one being
+    processed, or if it's not found in any enclosing scope -- so a
+    name that has been found in an enclosing scope can't later be
+    shadowed by an intermediate scope while the nested scope is still
+    being processed.
+
+    Attributes:
+      fqns: the names bound in this scope (initially, from the
+          scope_bindings computed by ast_raw.cvt) and the names found
+          in enclosing scopes, mapped to their FQNs.
+      parent: the table for the enclosing scope, or None.
+    """
+
+    __slots__ = ['fqns', 'parent']
+
+    def __init__(self,
+                 fqns: Optional[Dict[Text, Text]] = None,
+                 parent: Optional['ScopeTable'] = None) -> None:
+        self.fqns = {} if fqns is None else fqns
+        self.parent = parent
+
+    def new_child(self, fqns: Dict[Text, Text]) -> 'ScopeTable':
+        """Make a table for a nested scope, with `fqns` as its bindings."""
+        return ScopeTable(fqns, self)
+
+    def get(self, name: Text) -> Optional[Text]:
+        """Look up the FQN for a name (None if it's not bound)."""
+        fqn = self.fqns.get(name)
+        if fqn is None:
+            scope = self.parent
+            while scope is not None:
+                fqn = scope.fqns.get(name)
+                if fqn is not None:
+                    self.fqns[name] = fqn
+                    break
+                scope = scope.parent
+        return fqn
+
+    def __setitem__(self, name: Text, fqn: Text) -> None:
+        self.fqns[name] = fqn
+
+    def update(self, items: Iterable[Tuple[Text, Text]]) -> None:
+        self.fqns.update(items)
+
+
 @dataclass(frozen=True)
 class FqnCtx(pod.PlainOldData):
     """Context for computing FQNs (fully qualified names).
@@ -75,7 +132,7 @@ class FqnCtx(pod.PlainOldData):
     Attributes:
       fqn_dot: The Fully Qualifed Name of this scope
                (module/function/class), followed by a '.'
-      bindings: mappings of names to FQNs at this scope
+      bindings: mappings of names to FQNs at this scope (see ScopeTable)
       class_fqn: either None if not within a class or the
                  FQN of the enclosing class.
       class_astn: class name's ASTN or None (if not within a class).
@@ -83,7 +140,7 @@ class FqnCtx(pod.PlainOldData):
     """
 
     fqn_dot: Text
-    bindings: typing.ChainMap[Text, Text]  # pylint: disable=no-member
+    bindings: ScopeTable
     class_fqn: Optional[Text]
     class_astn: Optional[ast.Astn]
     python_version: int
@@ -94,6 +151,44 @@ class FqnCtx(pod.PlainOldData):
     def __post__init(self) -> None:
         assert self.python_version in (2, 3)
 
+    @classmethod
+    def for_module(cls, module: Text, python_version: int) -> FqnCtx:
+        """The FqnCtx for the top level of a module."""
+        return cls(
+            fqn_dot=module + '.',
+            bindings=ScopeTable(),
+            class_fqn=None,
+            class_astn=None,
+            python_version=python_version)
+
+
+class NodeError(RuntimeError):
+    """An exception from processing a node (add_fqns or ast_raw.cvt).
+
+    The message has the original exception (which is also the
+    __cause__) and the innermost node that was being processed; the
+    enclosing nodes don't add to it.
+    """
+
+    @classmethod
+    def wrap(cls, exc: Exception, node_description: Text) -> NodeError:
+        """Create a NodeError for exc (the caller raises it from exc).
+
+        The message doesn't use repr() of a node or of an exception
+        with a node in its args (e.g., `assert ..., [node]`): repr()
+        recurses over the whole subtree, which fails with a
+        RecursionError for a deep tree (hiding the original exception).
+        Instead, node_description describes the node without its
+        subtree, and exc is only shown by its class name if its args
+        aren't simple values.
+        """
+        if all(isinstance(arg, (str, bytes, int, float, type(None)))
+               for arg in exc.args):
+            exc_description = repr(exc)
+        else:
+            exc_description = exc.__class__.__name__ + '(...)'
+        return cls('{} node={}'.format(exc_description, node_description))
+
 
 class Base(pod.PlainOldDataExtended):
     """Base class for data from AST nodes.
@@ -121,8 +216,9 @@ class Base(pod.PlainOldDataExtended):
         """Generate a new tree with FQNs filled in.
 
         This code defines the generic form of the `add_fqns` method,
-        using self.__slots__.  In a few cases (e.g., those that have
-        an attr that is Sequence[Base]), this method is overriden.
+        using self._all_slots (see _add_fqns_recursive). In a few cases
+        (e.g., those that bind names or create a new scope), this
+        method is overriden.
 
         A Kythe "anchor" is a pointer to a piece of source code
         (typically, a "name" of some kind in Python) to which semantic
@@ -130,7 +226,10 @@ class Base(pod.PlainOldDataExtended):
 
         In most cases, `add_fqns` simply recursively calls `add_fqns`
         on its contents and returns a new node that combines the
-        results of the recursive calls to the contents.
+        results of the recursive calls to the contents. If none of
+        the contents changed (there are no names in the subtree), the
+        node itself is returned, so that the subtree is shared
+        between the input and output trees.
 
         A few nodes are special, such as `FuncDefStmt` and
         `NameRefNode`. These generate fully qualified names (FQNs)
@@ -153,25 +252,140 @@ class Base(pod.PlainOldDataExtended):
           NameBindsNode), something different is returned (e.g.,
           NameBindsFqn).
         """
-        attr_values = {
-            attr: self._attr_add_fqns(attr, ctx)
-            for attr in self.__slots__}
+        return self._add_fqns_recursive(ctx, 0)
+
+    def _add_fqns_recursive(self, ctx: FqnCtx, depth: int) -> Base:
+        """Generic add_fqns, recursively for "generic" children.
+
+        A "generic" node is one whose class doesn't override
+        add_fqns. The tree can be very deep (e.g., a long chain of
+        `+`), so at _MAX_ADD_FQNS_DEPTH, this switches to
+        _add_fqns_stack, which doesn't use recursion. (Children are
+        processed in the same order either way; see _add_fqns_slots.)
+        """
+        if depth >= _MAX_ADD_FQNS_DEPTH:
+            return self._add_fqns_stack(ctx)
+        attr_values = {}  # type: Dict[str, Any]
+        changed = False
+        attr = ''
+        try:
+            for attr in self._all_slots:
+                value = getattr(self, attr)
+                if isinstance(value, Base):
+                    if value.__class__.add_fqns is _BASE_ADD_FQNS:
+                        value_add_fqns = value._add_fqns_recursive(
+                            ctx, depth + 1)
+                    else:
+                        value_add_fqns = value.add_fqns(ctx)
+                    changed = changed or value_add_fqns is not value
+                    attr_values[attr] = value_add_fqns
+                elif isinstance(value, list):
+                    items_add_fqns = []  # type: List[Any]
+                    for item in value:
+                        if isinstance(item, Base):
+                            if item.__class__.add_fqns is _BASE_ADD_FQNS:
+                                item_add_fqns = item._add_fqns_recursive(
+                                    ctx, depth + 1)
+                            else:
+                                item_add_fqns = item.add_fqns(ctx)
+                            changed = changed or item_add_fqns is not item
+                            items_add_fqns.append(item_add_fqns)
+                        else:
+                            items_add_fqns.append(item)
+                    attr_values[attr] = items_add_fqns
+                else:
+                    attr_values[attr] = value
+        except NodeError:
+            raise
+        except Exception as exc:
+            raise NodeError.wrap(
+                exc, '{}.{}'.format(self.__class__.__name__, attr)) from exc
+        if not changed:  # No names in this subtree: reuse it
+            return self
         # TODO: https://github.com/python/mypy/issues/4602
         #       and then use self.__class__(**attr_values)
         return type(self)(**attr_values)
 
-    def _attr_add_fqns(self, attr: Text, ctx: FqnCtx) -> Base:
-        # TODO: inline this when fully debugged
+    def _add_fqns_stack(self, ctx: FqnCtx) -> Base:
+        """Generic add_fqns, using an explicit stack instead of recursion.
+
+        The stack has a _add_fqns_slots generator for each "generic"
+        node that's being processed.
+        """
+        stack = [self._add_fqns_slots(ctx)]
+        result = None  # type: Optional[Base]
+        while stack:
+            try:
+                child = stack[-1].send(result)
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+            else:
+                stack.append(child._add_fqns_slots(ctx))  # pylint: disable=protected-access
+                result = None
+        return typing.cast(Base, result)
+
+    def _add_fqns_slots(self, ctx: FqnCtx
+                        ) -> Generator[Base, Optional[Base], Base]:
+        """Generate the "generic" children, for _add_fqns_stack.
+
+        This is the same as _add_fqns_recursive, except that each
+        "generic" child is yielded and its result is sent back. The
+        children (Base slot values and Base items in list slots) are
+        processed left-to-right (the order matters because add_fqns
+        can modify the bindings in ctx). The generator's value is the
+        new node.
+        """
+        attr_values = {}  # type: Dict[str, Any]
+        changed = False
+        attr = ''
         try:
-            return xcast(Base, getattr(self, attr).add_fqns(ctx))
+            for attr in self._all_slots:
+                value = getattr(self, attr)
+                if isinstance(value, Base):
+                    if value.__class__.add_fqns is _BASE_ADD_FQNS:
+                        value_add_fqns = yield value
+                    else:
+                        value_add_fqns = value.add_fqns(ctx)
+                    changed = changed or value_add_fqns is not value
+                    attr_values[attr] = value_add_fqns
+                elif isinstance(value, list):
+                    items_add_fqns = []  # type: List[Any]
+                    for item in value:
+                        if isinstance(item, Base):
+                            if item.__class__.add_fqns is _BASE_ADD_FQNS:
+                                item_add_fqns = yield item
+                            else:
+                                item_add_fqns = item.add_fqns(ctx)
+                            changed = changed or item_add_fqns is not item
+                            items_add_fqns.append(item_add_fqns)
+                        else:
+                            items_add_fqns.append(item)
+                    attr_values[attr] = items_add_fqns
+                else:
+                    attr_values[attr] = value
+        except NodeError:
+            raise
         except Exception as exc:
-            raise RuntimeError(
-                '%r node=%r:%r' % (exc, attr, getattr(self, attr))) from exc
+            raise NodeError.wrap(
+                exc, '{}.{}'.format(self.__class__.__name__, attr)) from exc
+        if not changed:  # No names in this subtree: reuse it
+            return self
+        # TODO: https://github.com/python/mypy/issues/4602
+        #       and then use self.__class__(**attr_values)
+        return type(self)(**attr_values)
+
+
+_BASE_ADD_FQNS = Base.add_fqns
+
+_MAX_ADD_FQNS_DEPTH = 100
 
 
 class BaseNoOutput(Base):
     """Base that is never output for further processing."""
 
+    __slots__ = []
+
     def as_json_str(self) -> Text:
         return _not_implemeted(self, '***ERROR***')
 
@@ -186,6 +400,8 @@ class BaseNoFqnProcessing(Base):
     example, it's created by a `add_fqns` method solely for output.
     """
 
+    __slots__ = []
+
     def add_fqns(self, ctx: FqnCtx) -> Base:
         return _not_implemented(self, self)
 
@@ -196,6 +412,8 @@ class BaseNoFqnProcessingNoOutput(BaseNoOutput):
     For example, the node is only used internally within as_raw.
     """
 
+    __slots__ = []
+
     def add_fqns(self, ctx: FqnCtx) -> Base:
         return _not_implemented(self, self)
 
@@ -218,12 +436,14 @@ class BaseAtomTrailer(BaseNoFqnProcessingNoOutput):
     [AWAIT] atom trailer* ['**' factor]`.
     """
 
+    __slots__ = []
+
     def atom_trailer_node(self, atom: Base) -> Base:
         """For processing atom, trailer part of power (in ast_raw)."""
         raise NotImplementedError(self)  # pragma: no cover
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ListBase(Base):
     """A convenience class for AST nodes (expr) that contain a single list.
 
@@ -242,14 +462,8 @@ class ListBase(Base):
         assert type(self) is not ListBase, (
             "Must not directly instantiate ast_cooked.ListBase")
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        # TODO: https://github.com/python/mypy/issues/4602
-        #       and then use self.__class__(**attr_values)
-        return type(self)(
-            items=[_add_fqns_wrap(item, ctx) for item in self.items])
 
-
-@dataclass(frozen=True)
+@pod.frozen_class
 class EmptyBase(Base):
     """A convenience class for AST nodes (expr) that contain nothing."""
 
@@ -259,15 +473,7 @@ class EmptyBase(Base):
         return self
 
 
-def _add_fqns_wrap(item: Base, ctx: FqnCtx) -> Base:
-    # TODO: inline this when fully debugged
-    try:
-        return xcast(Base, item.add_fqns(ctx))
-    except Exception as exc:
-        raise RuntimeError('%r node=%r' % (exc, item)) from exc
-
-
-@dataclass(frozen=True)
+@pod.frozen_class
 class RawAnnAssignNode(BaseNoFqnProcessingNoOutput):
     """Corresponds to `annassign` (expr can be OmittedNode).
 
@@ -286,7 +492,7 @@ class RawAnnAssignNode(BaseNoFqnProcessingNoOutput):
     __slots__ = ['left_annotation', 'expr']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AnnAssignStmt(Base):
     """Corresponds to `expr_stmt: testlist_star_expr annassign`.
 
@@ -303,7 +509,7 @@ class AnnAssignStmt(Base):
     __slots__ = ['left_annotation', 'expr', 'left']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class RawArgListNode(BaseAtomTrailer):
     """Corresponds to `arglist`.
 
@@ -319,7 +525,7 @@ class RawArgListNode(BaseAtomTrailer):
         return AtomCallNode(atom=atom, args=self.args)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ArgumentNode(Base):
     """Corresponds to `argument: test '=' test`.
 
@@ -332,11 +538,8 @@ class ArgumentNode(Base):
 
     __slots__ = ['name', 'arg']
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        return ArgumentNode(name=self.name, arg=_add_fqns_wrap(self.arg, ctx))
-
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AsNameNode(Base):
     """Corresponds to `import_as_name`."""
 
@@ -346,7 +549,7 @@ class AsNameNode(Base):
     __slots__ = ['name', 'as_name']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AssignExprStmt(BaseNoFqnProcessing):
     """Corresponds to a single assignment from AssignMultipleExprStmt (q.v.).
 
@@ -360,7 +563,7 @@ class AssignExprStmt(BaseNoFqnProcessing):
     __slots__ = ['left', 'expr']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AssignMultipleExprStmt(Base):
     """Corresponds to `expr_stmt: testlist_star_expr ('=' (yield_expr|testlist_star_expr))*`.
 
@@ -384,12 +587,12 @@ class AssignMultipleExprStmt(Base):
     __slots__ = ['expr', 'left_list']
 
     def add_fqns(self, ctx: FqnCtx) -> Base:
-        expr = _add_fqns_wrap(self.expr, ctx)
+        expr = self.expr.add_fqns(ctx)
         # add_fqns(ctx) can modify the bindings in ctx, so order of
         # processing matters.
         left_add_fqns = list(
             reversed([
-                _add_fqns_wrap(item, ctx)
+                item.add_fqns(ctx)
                 for item in reversed(self.left_list)]))
         if len(left_add_fqns) == 1:
             return AssignExprStmt(left=left_add_fqns[0], expr=expr)
@@ -402,6 +605,8 @@ class AssignMultipleExprStmt(Base):
 class AssertStmt(ListBase):
     """Corresponds to `assert_stmt`."""
 
+    __slots__ = []
+
 
 def atom_trailer_node(atom: Base, trailers: Sequence[BaseAtomTrailer]) -> Base:
     """Create the appropriate AtomXXX nodes."""
@@ -409,7 +614,7 @@ def atom_trailer_node(atom: Base, trailers: Sequence[BaseAtomTrailer]) -> Base:
         lambda atom, trailer: trailer.atom_trailer_node(atom), trailers, atom)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AtomCallNode(Base):
     """Corresponds to `atom '(' [arglist] ')'`."""
 
@@ -418,13 +623,8 @@ class AtomCallNode(Base):
 
     __slots__ = ['atom', 'args']
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        return AtomCallNode(
-            atom=_add_fqns_wrap(self.atom, ctx),
-            args=[_add_fqns_wrap(arg, ctx) for arg in self.args])
-
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AtomDotNode(Base):
     """Corresponds to `atom '.' NAME`."""
 
@@ -435,14 +635,8 @@ class AtomDotNode(Base):
     # TODO: is `binds` needed or can it be inferred?
     __slots__ = ['atom', 'attr_name', 'binds']
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        return AtomDotNode(
-            atom=_add_fqns_wrap(self.atom, ctx),
-            attr_name=self.attr_name,
-            binds=self.binds)
 
-
-@dataclass(frozen=True)
+@pod.frozen_class
 class AtomSubscriptNode(Base):
     """Corresponds to `atom '[' [subscriptist] ']'`."""
 
@@ -451,15 +645,8 @@ class AtomSubscriptNode(Base):
 
     __slots__ = ['atom', 'subscripts']
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        return AtomSubscriptNode(
-            atom=_add_fqns_wrap(self.atom, ctx),
-            subscripts=[
-                _add_fqns_wrap(subscript, ctx)
-                for subscript in self.subscripts])
-
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AugAssignNode(BaseNoFqnProcessing):
     """Corresponds to `augassign`."""
 
@@ -468,7 +655,7 @@ class AugAssignNode(BaseNoFqnProcessing):
     __slots__ = ['op']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class AugAssignStmt(Base):
     """Corresponds to expr_stmt: augassign (yield_expr|testlist).
 
@@ -485,15 +672,17 @@ class AugAssignStmt(Base):
     def add_fqns(self, ctx: FqnCtx) -> Base:
         return AugAssignStmt(
             augassign=self.augassign,
-            expr=_add_fqns_wrap(self.expr, ctx),
-            left=_add_fqns_wrap(self.left, ctx))
+            expr=self.expr.add_fqns(ctx),
+            left=self.left.add_fqns(ctx))
 
 
 class BreakStmt(EmptyBase):
     """Corresponds to `break_stmt`."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class Class(BaseNoFqnProcessing):
     """Created by ClassDefStmt.add_fqns()."""
 
@@ -504,7 +693,7 @@ class Class(BaseNoFqnProcessing):
     __slots__ = ['fqn', 'name', 'bases']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ClassDefStmt(Base):
     """Corresponds to `classdef`."""
 
@@ -519,26 +708,26 @@ class ClassDefStmt(Base):
         # Similar to FuncDefStmt.add_fqns
         class_fqn = ctx.fqn_dot + self.name.name.value
         class_fqn_dot = class_fqn + '.'
-        name_add_fqns = xcast(NameBindsFqn, _add_fqns_wrap(
-            self.name, ctx))  # already in bindings
+        # self.name is already in bindings
+        name_add_fqns = xcast(NameBindsFqn, self.name.add_fqns(ctx))
         class_ctx = dataclasses.replace(
             ctx,
             fqn_dot=class_fqn_dot,
             bindings=ctx.bindings.new_child(
-                collections.OrderedDict((name, class_fqn_dot + name)
-                                        for name in self.scope_bindings)),
+                {name: class_fqn_dot + name
+                 for name in self.scope_bindings}),
             class_fqn=class_fqn,
             class_astn=self.name.name)
         class_add_fqns = Class(
             fqn=class_fqn,
             name=name_add_fqns.name,
-            bases=[_add_fqns_wrap(base, ctx) for base in self.bases])
+            bases=[base.add_fqns(ctx) for base in self.bases])
         return make_stmts([
             class_add_fqns,
-            _add_fqns_wrap(self.suite, class_ctx)])
+            self.suite.add_fqns(class_ctx)])
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class CompForNode(Base):
     """Corresponds to `comp_for`.
 
@@ -573,7 +762,7 @@ class CompForNode(Base):
             dataclasses.replace(
                 ctx,
                 fqn_dot=for_fqn_dot,
-                bindings=ctx.bindings.new_child(collections.OrderedDict())))
+                bindings=ctx.bindings.new_child({})))
 
     def add_fqns(self, ctx: FqnCtx) -> Base:
         # Assume that the caller has created a new child in the
@@ -584,11 +773,11 @@ class CompForNode(Base):
         #    x for x in [1,x]  # `x` in `[1,x]` is outer scope
         #    (x, y) for x in [1,2] for y in range(x)  # `x` in `range(x)` is from `for x`
         # [(x, y) for x in [1,2,x] for y in range(x)]  # error: y undefined
-        in_testlist_add_fqns = _add_fqns_wrap(self.in_testlist, ctx)
+        in_testlist_add_fqns = self.in_testlist.add_fqns(ctx)
         ctx.bindings.update((name, ctx.fqn_dot + name)
                             for name in self.scope_bindings)
-        for_exprlist_add_fqns = _add_fqns_wrap(self.for_exprlist, ctx)
-        comp_iter_add_fqns = _add_fqns_wrap(self.comp_iter, ctx)
+        for_exprlist_add_fqns = self.for_exprlist.add_fqns(ctx)
+        comp_iter_add_fqns = self.comp_iter.add_fqns(ctx)
         return CompFor(
             for_astn=self.for_astn,
             for_exprlist=for_exprlist_add_fqns,
@@ -596,7 +785,7 @@ class CompForNode(Base):
             comp_iter=comp_iter_add_fqns)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class CompFor(BaseNoFqnProcessing):
     """Created by CompForNode."""
 
@@ -608,7 +797,7 @@ class CompFor(BaseNoFqnProcessing):
     __slots__ = ['for_astn', 'for_exprlist', 'in_testlist', 'comp_iter']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class CompIfCompIterNode(Base):
     """Corresponds to `comp_if` with `comp_iter`."""
 
@@ -621,24 +810,32 @@ class CompIfCompIterNode(Base):
 class ContinueStmt(EmptyBase):
     """Corresponds to `continue_stmt`."""
 
+    __slots__ = []
+
 
 class DecoratorsNode(ListBase):
     """Corresponds to `decorators`."""
 
+    __slots__ = []
+
 
 class DecoratedStmt(ListBase):
     """Corresponds to `decorated`."""
 
+    __slots__ = []
+
 
 class DecoratorDottedNameNode(ListBase):
     """Corresponds to `dotted_name` in `decorator` (see also DottedNameNode)."""
 
+    __slots__ = []
+
     def __post_init__(self) -> None:
         # self.items = typing.cast(Sequence[NameRawNode], items)
         typing_debug.assert_all_isinstance(NameRawNode, self.items)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class DecoratorNode(Base):
     """Corresponds to `decorator`.
 
@@ -654,23 +851,29 @@ class DecoratorNode(Base):
 
     def add_fqns(self, ctx: FqnCtx) -> Base:
         return AtomCallNode(
-            atom=_add_fqns_wrap(self.name, ctx),
-            args=[_add_fqns_wrap(arg, ctx) for arg in self.args])
+            atom=self.name.add_fqns(ctx),
+            args=[arg.add_fqns(ctx) for arg in self.args])
 
 
 class DelStmt(ListBase):
     """Corresponds to `del_stmt`."""
 
+    __slots__ = []
+
 
 class DictKeyValue(ListBase):
     """Corresponds to `test ':' test` in DictGenListSetMakerCompForNode."""
 
+    __slots__ = []
+
 
 class DictSetMakerNode(ListBase):
     """Corresponds to `dictsetmaker` without `comp_for`."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class DictGenListSetMakerCompFor(BaseNoFqnProcessing):
     """Created by DictGenListSetMakerCompForNode.add_fqns()."""
 
@@ -680,7 +883,7 @@ class DictGenListSetMakerCompFor(BaseNoFqnProcessing):
     __slots__ = ['value_expr', 'comp_for']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class DictGenListSetMakerCompForNode(Base):
     """Corresponds to {`dict_set_maker', `listmaker`, testlist_gexp`} with
     `comp_for`. For our purposes, it's not important to know whether
@@ -700,7 +903,7 @@ class DictGenListSetMakerCompForNode(Base):
             value_expr=value_expr, comp_for=comp_for)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class DotNameTrailerNode(BaseAtomTrailer):
     """Corresponds to '.' NAME in trailer.
 
@@ -724,6 +927,8 @@ class DotNameTrailerNode(BaseAtomTrailer):
 class DottedNameNode(ListBase):
     """Corresponds to `dotted_name`."""
 
+    __slots__ = []
+
     def __post_init__(self) -> None:
         # self.items = typing.cast(Sequence[NameRawNode], items)
         typing_debug.assert_all_isinstance(NameRawNode, self.items)
@@ -732,10 +937,14 @@ class DottedNameNode(ListBase):
 class EllipsisNode(EmptyBase):
     """Corresponds to `...`."""
 
+    __slots__ = []
+
 
 class ExecStmt(ListBase):
     """Corresponds to `exec_stmt`."""
 
+    __slots__ = []
+
 
 class ExprListNode(ListBase):
     """Corresponds to `exprlist`, `testlist`, `testlist1`, `testlist_gexp`
@@ -746,8 +955,10 @@ class ExprListNode(ListBase):
     list ends with `,`).
     """
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class ExprStmt(BaseNoFqnProcessing):
     """Corresponds an expr-only from AssignMultipleExprStmt (q.v.).
 
@@ -759,7 +970,7 @@ class ExprStmt(BaseNoFqnProcessing):
     __slots__ = ['expr']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ExceptClauseNode(Base):
     """Corresponds to `except_clause`."""
 
@@ -769,7 +980,7 @@ class ExceptClauseNode(Base):
     __slots__ = ['expr', 'as_item']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class FileInput(Base):
     """Corresponds to `file_input`."""
 
@@ -780,17 +991,47 @@ class FileInput(Base):
     __slots__ = ['path', 'stmts', 'scope_bindings']
 
     def add_fqns(self, ctx: FqnCtx) -> Base:
+        return FileInput(
+            path=self.path,
+            stmts=list(self.add_fqns_stmts(ctx)),
+            scope_bindings=self.scope_bindings)
+
+    def add_fqns_stmts(self, ctx: FqnCtx,
+                       release: bool = False) -> Iterator[Base]:
+        """Generate add_fqns for each statement, in order.
+
+        This allows each statement to be output as soon as it's done
+        (see __main__._fqn_expr_frames), without building the whole
+        tree. If `release` is true, each statement is also removed
+        from self.stmts (which must be a list), so that it can be
+        freed once the caller is done with its add_fqns; self.stmts is
+        empty afterwards.
+        """
         file_ctx = dataclasses.replace(
             ctx,
             bindings=ctx.bindings.new_child(
-                collections.OrderedDict((name, ctx.fqn_dot + name)
-                                        for name in self.scope_bindings)))
-        stmts = [_add_fqns_wrap(stmt, file_ctx) for stmt in self.stmts]
-        return FileInput(
-            path=self.path, stmts=stmts, scope_bindings=self.scope_bindings)
+                {name: ctx.fqn_dot + name
+                 for name in self.scope_bindings}))
+        if release:
+            stmts = xcast(list, self.stmts)
+            stmts.reverse()
+            while stmts:
+                yield _add_fqns_stmt(stmts.pop(), file_ctx)
+        else:
+            for stmt in self.stmts:
+                yield _add_fqns_stmt(stmt, file_ctx)
 
 
-@dataclass(frozen=True)
+def _add_fqns_stmt(stmt: Base, ctx: FqnCtx) -> Base:
+    try:
+        return stmt.add_fqns(ctx)
+    except NodeError:
+        raise
+    except Exception as exc:
+        raise NodeError.wrap(exc, stmt.__class__.__name__) from exc
+
+
+@pod.frozen_class
 class ForStmt(Base):
     """Corresponds to `for_stmt`.
 
@@ -810,17 +1051,17 @@ class ForStmt(Base):
         # for_exprlist adds to bindings, suite and else_suite use the
         # additional bindings (and also the bindings "leak" outside
         # the for-loop).
-        in_testlist_add_fqns = _add_fqns_wrap(self.in_testlist, ctx)
+        in_testlist_add_fqns = self.in_testlist.add_fqns(ctx)
         # for_exprlist adds to bindings
-        for_exprlist_add_fqns = _add_fqns_wrap(self.for_exprlist, ctx)
+        for_exprlist_add_fqns = self.for_exprlist.add_fqns(ctx)
         return ForStmt(
             for_exprlist=for_exprlist_add_fqns,
             in_testlist=in_testlist_add_fqns,
-            suite=_add_fqns_wrap(self.suite, ctx),
-            else_suite=_add_fqns_wrap(self.else_suite, ctx))
+            suite=self.suite.add_fqns(ctx),
+            else_suite=self.else_suite.add_fqns(ctx))
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class Func(BaseNoFqnProcessing):
     """Created by FuncDefStmt.add_fqns()."""
 
@@ -832,7 +1073,7 @@ class Func(BaseNoFqnProcessing):
     __slots__ = ['fqn', 'name', 'parameters', 'return_type']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class FuncDefStmt(Base):
     """Corresponds to `funcdef` / `async_funcdef` or lambdadef.
 
@@ -863,20 +1104,20 @@ class FuncDefStmt(Base):
             func_fqn = '{}{}'.format(ctx.fqn_dot, self.name.name.value)
         func_fqn_dot = func_fqn + '.<local>.'
         # self.name is already in bindings
-        name_add_fqns = xcast(NameBindsFqn, _add_fqns_wrap(self.name, ctx))
+        name_add_fqns = xcast(NameBindsFqn, self.name.add_fqns(ctx))
         func_ctx = dataclasses.replace(
             ctx,
             fqn_dot=func_fqn_dot,
             bindings=ctx.bindings.new_child(
-                collections.OrderedDict((name, func_fqn_dot + name)
-                                        for name in self.scope_bindings)),
+                {name: func_fqn_dot + name
+                 for name in self.scope_bindings}),
             class_fqn=None,
             class_astn=None)
         # parameters require special handling because the type+default
         # are evaluated in ctx but the name is evaluated in
         # func_ctx. We can assume that the type+default have already
         # been added to the bindings at ctx (or an outer scope, via
-        # the ChainMap). Also, if this is a method, we need to
+        # the ScopeTable). Also, if this is a method, we need to
         # specially handle the type for the first parameter if it
         # doesn't have a type annotation or default value.
         if (ctx.class_fqn and ctx.class_astn and self.parameters and
@@ -887,40 +1128,45 @@ class FuncDefStmt(Base):
                         OmittedNode)):
             param0 = TypedArgNode(
                 tname=TnameNode(
-                    name=_add_fqns_wrap(
-                        xcast(TypedArgNode, self.parameters[0]).tname.name,
-                        func_ctx),
+                    name=xcast(TypedArgNode, self.parameters[0])
+                    .tname.name.add_fqns(func_ctx),
                     type_expr=NameRefGenerated(fqn=ctx.class_fqn)),
                 expr=OMITTED_NODE)
             parameters = [param0] + [
-                xcast(TypedArgNode, _add_fqns_wrap(parameter, func_ctx))
+                xcast(TypedArgNode, parameter.add_fqns(func_ctx))
                 for parameter in self.parameters[1:]]
         else:
             parameters = [
-                xcast(TypedArgNode, _add_fqns_wrap(parameter, func_ctx))
+                xcast(TypedArgNode, parameter.add_fqns(func_ctx))
                 for parameter in self.parameters]
         func_add_fqns = Func(
             fqn=func_fqn,
             name=name_add_fqns.name,
             parameters=parameters,
-            return_type=_add_fqns_wrap(self.return_type, ctx))
+            return_type=self.return_type.add_fqns(ctx))
         return make_stmts([
-            func_add_fqns, _add_fqns_wrap(self.suite, func_ctx)])
+            func_add_fqns, self.suite.add_fqns(func_ctx)])
 
 
 class GlobalStmt(ListBase):
     """Corresponds to `global_stmt`."""
 
+    __slots__ = []
+
 
 class IfStmt(ListBase):
     """Corresponds to `if_stmt`."""
 
+    __slots__ = []
+
 
 class ImportAsNamesNode(ListBase):
     """Corresponds to `import_as_names`."""
 
+    __slots__ = []
+
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportDotNode(Base):
     """Corresponds to a DOT in `import_from`.
 
@@ -936,7 +1182,7 @@ class ImportDotNode(Base):
         return self
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportDottedAsNameFqn(Base):
     """Created by ImportDottedAsNameNode.add_fqns (when there's an 'as').
 
@@ -952,7 +1198,7 @@ class ImportDottedAsNameFqn(Base):
         return self  # The components have already been processed
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportDottedAsNameNode(Base):
     """Corresponds to `dotted_as_name` (from `import_name`). """
 
@@ -965,20 +1211,22 @@ class ImportDottedAsNameNode(Base):
 
     def add_fqns(self, ctx: FqnCtx) -> Base:
         dotted_name = xcast(DottedNameNode,
-                            _add_fqns_wrap(self.dotted_name, ctx))
+                            self.dotted_name.add_fqns(ctx))
         if self.as_name:
             return ImportDottedAsNameFqn(
                 dotted_name=dotted_name,
-                as_name=xcast(NameBindsFqn, _add_fqns_wrap(self.as_name, ctx)))
+                as_name=xcast(NameBindsFqn, self.as_name.add_fqns(ctx)))
         return ImportDottedFqn(
             dotted_name=dotted_name,
-            top_name=_add_fqns_wrap(
-                NameBindsNode(name=self.dotted_name.items[0].name), ctx))
+            top_name=NameBindsNode(
+                name=self.dotted_name.items[0].name).add_fqns(ctx))
 
 
 class ImportDottedAsNamesFqn(ListBase):
     """Corresponds to `dotted_as_names`."""
 
+    __slots__ = []
+
     def __post_init__(self) -> None:
         # self.items = typing.cast(Sequence[ImportDottedAsNameFqn], items)
         typing_debug.assert_all_isinstance(
@@ -992,6 +1240,8 @@ class ImportDottedAsNamesFqn(ListBase):
 class ImportDottedAsNamesNode(ListBase):
     """Created by ImportDottedAsNamesNode.add_fqns."""
 
+    __slots__ = []
+
     def __post_init__(self) -> None:
         # self.items = typing.cast(Sequence[ImportDottedAsNameNode], items)
         typing_debug.assert_all_isinstance(
@@ -999,10 +1249,10 @@ class ImportDottedAsNamesNode(ListBase):
 
     def add_fqns(self, ctx: FqnCtx) -> Base:
         return ImportDottedAsNamesFqn(
-            items=[_add_fqns_wrap(item, ctx) for item in self.items])
+            items=[item.add_fqns(ctx) for item in self.items])
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportDottedFqn(Base):
     """Created by ImportDottedAsNameNode.add_fqns (when there's no 'as').
 
@@ -1021,7 +1271,7 @@ class ImportDottedFqn(Base):
         return self  # The components have already been processed
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportFromStmt(Base):
     """Corresponds to `import_name`."""
 
@@ -1049,13 +1299,13 @@ class ImportFromStmt(Base):
         # anything special about them.
         # TODO: don't need add_fqns (nor for ImportDotNode, DottedNameNode)
         return ImportFromStmt(
-            from_dots=[_add_fqns_wrap(dot, ctx) for dot in self.from_dots],
-            from_name=_add_fqns_wrap(self.from_name, ctx)
+            from_dots=[dot.add_fqns(ctx) for dot in self.from_dots],
+            from_name=self.from_name.add_fqns(ctx)
             if self.from_name else self.from_name,
-            import_part=_add_fqns_wrap(self.import_part, ctx))
+            import_part=self.import_part.add_fqns(ctx))
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportNameFqn(Base):
     """Created by ImportNameNode.add_fqns."""
 
@@ -1067,7 +1317,7 @@ class ImportNameFqn(Base):
         return self  # The components have already been processed
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class ImportNameNode(Base):
     """Corresponds to `import_name`."""
 
@@ -1082,14 +1332,16 @@ class ImportNameNode(Base):
     def add_fqns(self, ctx: FqnCtx) -> Base:
         return ImportNameFqn(
             dotted_as_names=xcast(ImportDottedAsNamesFqn,
-                                  _add_fqns_wrap(self.dotted_as_names, ctx)))
+                                  self.dotted_as_names.add_fqns(ctx)))
 
 
 class ListMakerNode(ListBase):
     """Corresponds to `listmaker` without `comp_for`."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class NameBindsFqn(BaseNoFqnProcessing):
     """Created by NameBindsNode.add_fqns."""
 
@@ -1099,7 +1351,7 @@ class NameBindsFqn(BaseNoFqnProcessing):
     __slots__ = ['name', 'fqn']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class NameBindsNode(Base):
     """Corresponds to a NAME node, in binding context.
 
@@ -1118,15 +1370,14 @@ class NameBindsNode(Base):
         # in, typically due to the grammar accepting an illegal Python
         # program (e.g., the grammar allows test=test for an arg, but
         # it should be NAME=test)
-        if name in ctx.bindings:
-            fqn = ctx.bindings[name] or ''
-        else:
+        fqn = ctx.bindings.get(name)
+        if fqn is None:
             fqn = ctx.fqn_dot + name
             ctx.bindings[name] = fqn
         return NameBindsFqn(name=self.name, fqn=fqn)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class NameRawNode(Base):
     """Corresponds to a NAME node that doesn't get a FQN.
 
@@ -1147,7 +1398,7 @@ class NameRawNode(Base):
         return self
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class NameRefNode(Base):
     """Corresponds to a NAME node, in ref context.
 
@@ -1166,15 +1417,14 @@ class NameRefNode(Base):
         # in, typically due to the grammar accepting an illegal Python
         # program (e.g., the grammar allows test=test for an arg, but
         # it should be NAME=test)
-        if name in ctx.bindings:
-            fqn = ctx.bindings[name] or ''
-        else:
+        fqn = ctx.bindings.get(name)
+        if fqn is None:
             fqn = ctx.fqn_dot + name
             ctx.bindings[name] = fqn
         return NameRefFqn(name=self.name, fqn=fqn)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class NameRefFqn(BaseNoFqnProcessing):
     """Created by NameRefNode.add_fqns."""
 
@@ -1184,7 +1434,7 @@ class NameRefFqn(BaseNoFqnProcessing):
     __slots__ = ['name', 'fqn']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class NameRefGenerated(BaseNoFqnProcessing):
     """Like NameRef, but for `self` type nodes.
 
@@ -1201,8 +1451,10 @@ class NameRefGenerated(BaseNoFqnProcessing):
 class NonLocalStmt(ListBase):
     """Corresponds to "nonlocal" variant of `global_stmt`."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class NumberNode(Base):
     """Corresponds to a NUMBER node.
 
@@ -1221,6 +1473,8 @@ class NumberNode(Base):
 class OmittedNode(EmptyBase):
     """An item that is omitted (e.g., bases for a class)."""
 
+    __slots__ = []
+
 
 # Singleton OmittedNode, to avoid creating many of them.
 OMITTED_NODE = OmittedNode()
@@ -1237,25 +1491,26 @@ class OpNode(Base):
     def __post_init__(self) -> None:
         typing_debug.assert_all_isinstance(ast.Astn, self.op_astns)
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        return OpNode(
-            op_astns=self.op_astns,
-            args=[_add_fqns_wrap(arg, ctx) for arg in self.args])
-
 
 class PassStmt(EmptyBase):
     """Corresponds to `pass_stmt`."""
 
+    __slots__ = []
+
 
 class PrintStmt(ListBase):
     """Corresponds to `print_stmt`."""
 
+    __slots__ = []
+
 
 class RaiseStmt(ListBase):
     """Corresponds to `raise_stmt`."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class StarFqn(Base):
     """Created by StarNode.add_fqns."""
 
@@ -1268,7 +1523,7 @@ class StarFqn(Base):
         return self
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class StarNode(Base):
     """Corresponds to `'*' (in from...import)`."""
 
@@ -1286,6 +1541,8 @@ class Stmts(ListBase):
     Should never be created directly, but through the `make_stmts` factory.
     """
 
+    __slots__ = []
+
 
 def make_stmts(items: Iterable[Base]) -> Stmts:
     """Create Stmts node, flattening any Stmts in items."""
@@ -1298,7 +1555,7 @@ def make_stmts(items: Iterable[Base]) -> Stmts:
     return Stmts(items=flattened_items)
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class StringNode(Base):
     """Corresponds to a STRING node.
 
@@ -1314,7 +1571,7 @@ class StringNode(Base):
         return self
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class SubscriptNode(Base):
     """Corresponds to `subscript`."""
 
@@ -1325,7 +1582,7 @@ class SubscriptNode(Base):
     __slots__ = ['expr1', 'expr2', 'expr3']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class RawSubscriptListNode(BaseAtomTrailer):
     """Corresponds to `subscript_list`.
 
@@ -1348,8 +1605,10 @@ class RawSubscriptListNode(BaseAtomTrailer):
 class TestListNode(ListBase):
     """Corresponds to ."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class TnameNode(Base):
     """Corresponds to `tname`."""
 
@@ -1362,14 +1621,18 @@ class TnameNode(Base):
 class TfpListNode(ListBase):
     """Corresponds to `tfplist`."""
 
+    __slots__ = []
+
     # TODO: test case (see ast_raw.cvt_tfplist)
 
 
 class TryStmt(ListBase):
     """Corresponds to `try_stmt`."""
 
+    __slots__ = []
 
-@dataclass(frozen=True)
+
+@pod.frozen_class
 class TypedArgNode(Base):
     """Corresponds to `typedargslist` `tfpdef ['=' test]` and similar."""
 
@@ -1379,7 +1642,7 @@ class TypedArgNode(Base):
     __slots__ = ['tname', 'expr']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class RawTypedArgsListNode(BaseNoFqnProcessingNoOutput):
     """Corresponds to `typedargslist`.
 
@@ -1392,7 +1655,7 @@ class RawTypedArgsListNode(BaseNoFqnProcessingNoOutput):
     __slots__ = ['args']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class WhileStmt(Base):
     """Corresponds to `while_stmt`."""
 
@@ -1403,7 +1666,7 @@ class WhileStmt(Base):
     __slots__ = ['test', 'suite', 'else_suite']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class WithItemNode(Base):
     """Corresponds to `with_item`."""
 
@@ -1413,7 +1676,7 @@ class WithItemNode(Base):
     __slots__ = ['item', 'as_item']
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class WithStmt(Base):
     """Corresponds to `with_stmt`."""
 
@@ -1427,22 +1690,19 @@ class WithStmt(Base):
         typing_debug.assert_all_isinstance(WithItemNode, self.items)
         # self.items = typing.cast(Sequence[WithItemNode], items)
 
-    def add_fqns(self, ctx: FqnCtx) -> Base:
-        return WithStmt(
-            items=[_add_fqns_wrap(item, ctx) for item in self.items],
-            suite=_add_fqns_wrap(self.suite, ctx))
-
 
 class YieldNode(ListBase):
     """Corresponds to `yield_expr`."""
 
+    __slots__ = []
+
     # TODO: test case (see ast_raw.cvt_yield_expr, ast_raw.cvt_yield_stmt)
 
 
 # === other facts that are output as JSON
 
 
-@dataclass(frozen=True)
+@pod.frozen_class
 class Meta(pod.PlainOldDataExtended):
     """Information about the file."""
 
@@ -0,0 +1,1140 @@
+"""Alternative to ast_raw, using CPython's ast module.
+
+ast_raw converts the concrete syntax tree from lib2to3 (a pure Python
+tokenizer and parser) into ast_cooked nodes. This module produces the
+same ast_cooked nodes (with the same binding marks and byte offsets)
+from the C-implemented `ast.parse`, which is considerably faster. The
+abstract syntax tree doesn't have all the positions that are needed
+(e.g., for operators, keywords, attribute names), so the source is
+also tokenized (with the tokenize module) and these positions are
+recovered from the tokens.
+
+ast_raw is the reference implementation: the output of this module is
+intended to be identical, including ast_raw's quirks (for example,
+only the first of a sequence of concatenated strings gets an Astn, a
+set comprehension becomes a DictSetMakerNode, and only the first
+alternative of `x if c else y` is kept). Where ast_raw fails with an
+exception (e.g., for slices with a step, or `[a, *b] = ...`), this
+module returns the obvious result instead.
+
+Only Python 3 is supported, using the ast module's node types for
+Python 3.6 and 3.7 (e.g., Num, Str, Index), so this module only runs
+with those versions of Python (see check_version).
+
+The basic usage is:
+    cooked_nodes = ast_cpython.cvt_file(src_file, python_version)
+which is equivalent to:
+    parse_tree = ast_raw.parse(src_file.content, python_version)
+    cooked_nodes = ast_raw.cvt_parse_tree(parse_tree, python_version, src_file)
+"""
+
+# pylint: disable=too-many-lines
+# pylint: disable=too-many-public-methods
+
+import ast as py_ast
+import codecs
+from dataclasses import dataclass
+import dataclasses
+import collections
+import io
+import re
+import sys
+import tokenize
+from typing import Any, Callable, Dict, List, Optional, Sequence, Text, Tuple, Union  # pylint: disable=unused-import
+
+from . import ast, ast_cooked, pod
+from .ast_raw import NameCtx
+from .typing_debug import cast as xcast
+
+
+# The versions of Python whose ast module this module handles. Python
+# 3.8 replaced Num, Str, etc. by Constant (and changed some positions),
+# and Python 3.9 removed Index and ExtSlice.
+_SUPPORTED_VERSIONS = ((3, 6), (3, 7))
+
+
+def check_version() -> None:
+    """Raise ValueError if this Python's ast module isn't supported."""
+    if sys.version_info[:2] not in _SUPPORTED_VERSIONS:
+        raise ValueError(
+            'cpython front end requires Python {}, not {}.{}'.format(
+                ' or '.join('{}.{}'.format(*version)
+                            for version in _SUPPORTED_VERSIONS),
+                *sys.version_info[:2]))
+
+
+def cvt_file(src_file: ast.File, python_version: int) -> ast_cooked.Base:
+    """Parse src_file.content and convert it to ast_cooked.Base."""
+    check_version()
+    if python_version != 3:
+        raise ValueError(
+            'cpython front end requires python_version=3, not {!r}'.format(
+                python_version))
+    with io.BytesIO(src_file.content) as src_f:
+        encoding, _ = tokenize.detect_encoding(src_f.readline)
+    src_str = codecs.decode(src_file.content, encoding)
+    if '\r' in src_str:
+        # Same as ast_raw.parse: changing a lone '\r' to '\n' doesn't
+        # change any offsets.
+        src_str = _LONE_CR_RE.sub('\n', src_str)
+    module = py_ast.parse(src_str, filename=src_file.path)
+    return cvt(module, new_ctx(Tokens(src_str, src_file)))
+
+
+# pylint: disable=too-few-public-methods
+# pylint: disable=no-else-return
+
+
+class Tokens:
+    """The significant tokens of the source, with their positions.
+
+    The ast module gives only the start position of most nodes, and
+    none for some nodes (e.g., `keyword`, `alias`), so Tokens provides
+    methods for finding a node's first and last token (by index in
+    `values`), from which the other tokens can be found (for example,
+    the operator in `a + b` is the token after the last token of `a`).
+
+    Comments, NEWLINE, NL, INDENT, and DEDENT tokens are omitted (the
+    ENDMARKER is kept, so that there's always a token following the
+    last token of a node).
+
+    Attributes:
+      types: the type of each token (e.g., tokenize.NAME).
+      values: the value of each token (names are interned).
+      starts: the byte offset of each token.
+      match: for a bracket ('(', '[', '{' and their closing
+          counterparts), the index of the matching bracket; otherwise -1.
+      by_pos: maps (lineno, col_offset) to the index of the token
+          starting there. col_offset is in bytes (UTF-8), which is
+          what the ast module uses.
+      multiline_strings: maps the end line of a multi-line string
+          token that starts a concatenation of strings to the index of
+          the token. This is needed because the ast module (before
+          Python 3.8) sets col_offset=-1 for such strings, and lineno
+          to the end line of the first token.
+      src_file: the source and offset information.
+    """
+
+    __slots__ = [
+        'types', 'values', 'starts', 'match', 'by_pos', 'multiline_strings',
+        'src_file', '_first', '_last']
+
+    def __init__(self, src_str: Text, src_file: ast.File) -> None:
+        self.types = []  # type: List[int]
+        self.values = []  # type: List[Text]
+        self.starts = []  # type: List[int]
+        self.match = []  # type: List[int]
+        self.by_pos = {}  # type: Dict[Tuple[int, int], int]
+        self.multiline_strings = {}  # type: Dict[int, int]
+        self.src_file = src_file
+        self._first = {}  # type: Dict[py_ast.AST, int]
+        self._last = {}  # type: Dict[py_ast.AST, int]
+        open_brackets = []  # type: List[int]
+        for tok in tokenize.generate_tokens(io.StringIO(src_str).readline):
+            if tok.type in _IGNORED_TOKENS:
+                continue
+            lineno, column = tok.start
+            i = len(self.values)
+            self.types.append(tok.type)
+            self.values.append(
+                sys.intern(tok.string)
+                if tok.type == tokenize.NAME else tok.string)
+            self.starts.append(src_file.offset(lineno, column))
+            self.match.append(-1)
+            if tok.line.isascii():
+                self.by_pos[lineno, column] = i
+            else:
+                self.by_pos[lineno, len(
+                    tok.line[:column].encode('utf-8'))] = i
+            if tok.string in _OPEN_BRACKETS:
+                open_brackets.append(i)
+            elif tok.string in _CLOSE_BRACKETS:
+                open_i = open_brackets.pop()
+                self.match[open_i] = i
+                self.match[i] = open_i
+            elif (tok.type == tokenize.STRING and tok.end[0] != lineno and
+                  (i == 0 or self.types[i - 1] != tokenize.STRING)):
+                self.multiline_strings[tok.end[0]] = i
+
+    def astn(self, i: int) -> ast.Astn:
+        """Get the Astn for token i."""
+        value = self.values[i]
+        start = self.starts[i]
+        return ast.Astn(
+            value=value,
+            start=start,
+            end=start + len(value.encode(self.src_file.encoding)))
+
+    def at(self, node: Any) -> int:
+        """Get the index of the token at node's position.
+
+        node is any node with a position (lineno, col_offset), such as
+        py_ast.expr or py_ast.stmt.
+        """
+        if node.col_offset < 0:  # multi-line string: see multiline_strings
+            return self.multiline_strings[node.lineno]
+        return self.by_pos[node.lineno, node.col_offset]
+
+    def first(self, node: py_ast.AST) -> int:
+        """Get the index of node's first token, not including parentheses."""
+        # A node's position isn't always its first token (e.g., for
+        # `(a).b`, it's the '(', which is outside `a`; for `a.b` and
+        # `(a, b)`, it's `a`).
+        try:
+            return self._first[node]
+        except KeyError:
+            pass
+        if isinstance(node, (py_ast.Attribute, py_ast.Subscript)):
+            result = self.outer_first(node.value)
+        elif isinstance(node, py_ast.Call):
+            result = self.outer_first(node.func)
+        elif isinstance(node, (py_ast.BinOp, py_ast.Compare)):
+            result = self.outer_first(node.left)
+        elif isinstance(node, py_ast.BoolOp):
+            result = self.outer_first(node.values[0])
+        elif isinstance(node, py_ast.IfExp):
+            result = self.outer_first(node.body)
+        elif isinstance(node, py_ast.GeneratorExp):
+            result = self.outer_first(node.elt)
+        elif isinstance(node, py_ast.ListComp):
+            result = self.at(node) - 1  # positioned after the '['
+        elif isinstance(node, py_ast.Tuple) and node.elts:
+            result = self.outer_first(node.elts[0])
+        else:
+            result = self.at(node)
+        self._first[node] = result
+        return result
+
+    def last(self, node: py_ast.AST) -> int:
+        """Get the index of node's last token, not including parentheses."""
+        try:
+            return self._last[node]
+        except KeyError:
+            pass
+        if isinstance(node, py_ast.Attribute):
+            result = self.outer_last(node.value) + 2  # '.' NAME
+        elif isinstance(node, py_ast.Subscript):
+            result = self.match[self.outer_last(node.value) + 1]
+        elif isinstance(node, py_ast.Call):
+            result = self.match[self.outer_last(node.func) + 1]
+        elif isinstance(node, py_ast.BinOp):
+            result = self.outer_last(node.right)
+        elif isinstance(node, py_ast.BoolOp):
+            result = self.outer_last(node.values[-1])
+        elif isinstance(node, py_ast.Compare):
+            result = self.outer_last(node.comparators[-1])
+        elif isinstance(node, py_ast.IfExp):
+            result = self.outer_last(node.orelse)
+        elif isinstance(node, py_ast.Lambda):
+            result = self.outer_last(node.body)
+        elif isinstance(node, py_ast.UnaryOp):
+            result = self.outer_last(node.operand)
+        elif isinstance(node,
+                        (py_ast.Starred, py_ast.Await, py_ast.Yield,
+                         py_ast.YieldFrom)):
+            result = (self.outer_last(node.value)
+                      if node.value else self.first(node))
+        elif isinstance(node, py_ast.GeneratorExp):
+            generator = node.generators[-1]
+            result = self.outer_last(
+                generator.ifs[-1] if generator.ifs else generator.iter)
+        elif isinstance(node, py_ast.Tuple) and node.elts:
+            result = self.outer_last(node.elts[-1])
+            if self.values[result + 1] == ',':
+                result += 1
+        elif isinstance(node, (py_ast.Str, py_ast.Bytes, py_ast.JoinedStr)):
+            result = self.first(node)
+            while (result + 1 < len(self.types) and
+                   self.types[result + 1] == tokenize.STRING):
+                result += 1
+        elif self.match[self.first(node)] >= 0:  # (), [...], {...}
+            result = self.match[self.first(node)]
+        else:
+            result = self.first(node)  # NAME, NUMBER, etc.
+        self._last[node] = result
+        return result
+
+    def outer_span(self, node: py_ast.AST) -> Tuple[int, int]:
+        """Get the indexes of node's first and last tokens, with parentheses."""
+        first = self.first(node)
+        last = self.last(node)
+        while (first > 0 and self.values[first - 1] == '(' and
+               self.match[first - 1] == last + 1):
+            first -= 1
+            last += 1
+        return first, last
+
+    def outer_first(self, node: py_ast.AST) -> int:
+        return self.outer_span(node)[0]
+
+    def outer_last(self, node: py_ast.AST) -> int:
+        return self.outer_span(node)[1]
+
+    def is_parenthesized(self, node: py_ast.AST) -> bool:
+        return self.outer_first(node) != self.first(node)
+
+
+_IGNORED_TOKENS = frozenset([
+    tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+    tokenize.DEDENT, tokenize.ENCODING])
+
+_OPEN_BRACKETS = frozenset(['(', '[', '{'])
+_CLOSE_BRACKETS = frozenset([')', ']', '}'])
+
+_LONE_CR_RE = re.compile(r'\r(?!\n)')
+
+
+@dataclass(frozen=True)
+class Ctx(pod.PlainOldData):
+    """Context for traversing the ast module's AST.
+
+    This is the same as ast_raw.Ctx (q.v.), except that it has the
+    tokens instead of the src_file, and python_version is always 3.
+
+    Attributes:
+        name_ctx: See ast_raw.Ctx.
+        scope_bindings: See ast_raw.Ctx.
+        global_vars: See ast_raw.Ctx.
+        nonlocal_vars: See ast_raw.Ctx.
+        tokens: the tokens and their offsets.
+    """
+
+    name_ctx: NameCtx
+    scope_bindings: Dict[Text, None]
+    global_vars: Dict[Text, None]
+    nonlocal_vars: Dict[Text, None]
+    tokens: Tokens
+
+    __slots__ = [
+        'name_ctx', 'scope_bindings', 'global_vars', 'nonlocal_vars',
+        'tokens']
+
+
+def new_ctx(tokens: Tokens) -> Ctx:
+    return Ctx(
+        name_ctx=NameCtx.REF,
+        scope_bindings=collections.OrderedDict(),
+        global_vars=collections.OrderedDict(),
+        nonlocal_vars=collections.OrderedDict(),
+        tokens=tokens)
+
+
+def new_ctx_from(ctx: Ctx) -> Ctx:
+    return new_ctx(ctx.tokens)
+
+
+def cvt_annassign(node: py_ast.AnnAssign, ctx: Ctx) -> ast_cooked.Base:
+    """AnnAssign(expr target, expr annotation, expr? value, int simple)"""
+    # Same order of processing as ast_raw.cvt_annassign, cvt_expr_stmt
+    if node.value:
+        expr = cvt(node.value, ctx)
+    else:
+        expr = ast_cooked.OMITTED_NODE
+    return ast_cooked.AnnAssignStmt(
+        left_annotation=cvt(node.annotation, ctx),
+        expr=expr,
+        left=cvt_name_ctx(NameCtx.BINDING, node.target, ctx))
+
+
+def cvt_assert(node: py_ast.Assert, ctx: Ctx) -> ast_cooked.Base:
+    """Assert(expr test, expr? msg)"""
+    test = cvt(node.test, ctx)
+    if node.msg:
+        display = cvt(node.msg, ctx)
+    else:
+        display = ast_cooked.OMITTED_NODE
+    return ast_cooked.AssertStmt(items=[test, display])
+
+
+def cvt_assign(node: py_ast.Assign, ctx: Ctx) -> ast_cooked.Base:
+    """Assign(expr* targets, expr value)"""
+    expr = cvt(node.value, ctx)
+    left_ctx = dataclasses.replace(ctx, name_ctx=NameCtx.BINDING)
+    return ast_cooked.AssignMultipleExprStmt(
+        left_list=[cvt(target, left_ctx) for target in node.targets],
+        expr=expr)
+
+
+def cvt_attribute(node: py_ast.Attribute, ctx: Ctx) -> ast_cooked.Base:
+    """Attribute(expr value, identifier attr, expr_context ctx)"""
+    # Only the last trailer is in the current binds context (see
+    # ast_raw.cvt_power).
+    return ast_cooked.AtomDotNode(
+        atom=cvt_name_ctx(NameCtx.REF, node.value, ctx),
+        attr_name=ctx.tokens.astn(ctx.tokens.last(node)),
+        binds=ctx.name_ctx is NameCtx.BINDING)
+
+
+def cvt_augassign(node: py_ast.AugAssign, ctx: Ctx) -> ast_cooked.Base:
+    """AugAssign(expr target, operator op, expr value)"""
+    augassign = ctx.tokens.astn(ctx.tokens.outer_last(node.target) + 1)
+    expr = cvt(node.value, ctx)
+    left_augassign = cvt(node.target, ctx)  # modifies left; REF context
+    return ast_cooked.AugAssignStmt(
+        left=left_augassign, augassign=augassign, expr=expr)
+
+
+def cvt_binop(node: py_ast.BinOp, ctx: Ctx) -> ast_cooked.Base:
+    """BinOp(expr left, operator op, expr right)"""
+    if isinstance(node.op, py_ast.Pow):
+        # ast_raw.cvt_power processes the right side first
+        right = cvt(node.right, ctx)
+        return ast_cooked.OpNode(
+            op_astns=[ctx.tokens.astn(ctx.tokens.outer_last(node.left) + 1)],
+            args=[cvt(node.left, ctx), right])
+    return ast_cooked.OpNode(
+        op_astns=[ctx.tokens.astn(ctx.tokens.outer_last(node.left) + 1)],
+        args=[cvt(node.left, ctx), cvt(node.right, ctx)])
+
+
+def cvt_boolop(node: py_ast.BoolOp, ctx: Ctx) -> ast_cooked.Base:
+    """BoolOp(boolop op, expr* values)"""
+    # Same as ast_raw.cvt_binary_op
+    result = cvt(node.values[0], ctx)
+    for prev_value, value in zip(node.values, node.values[1:]):
+        result = ast_cooked.OpNode(
+            op_astns=[ctx.tokens.astn(ctx.tokens.outer_last(prev_value) + 1)],
+            args=[result, cvt(value, ctx)])
+    return result
+
+
+def cvt_break(node: py_ast.Break, ctx: Ctx) -> ast_cooked.Base:
+    """Break"""
+    return ast_cooked.BreakStmt()
+
+
+def cvt_call(node: py_ast.Call, ctx: Ctx) -> ast_cooked.Base:
+    """Call(expr func, expr* args, keyword* keywords)"""
+    return ast_cooked.AtomCallNode(
+        atom=cvt_name_ctx(NameCtx.REF, node.func, ctx),
+        args=cvt_arglist(node.args, node.keywords,
+                         dataclasses.replace(ctx, name_ctx=NameCtx.REF)))
+
+
+def cvt_arglist(args: Sequence[py_ast.expr],
+                keywords: Sequence[py_ast.keyword],
+                ctx: Ctx) -> List[ast_cooked.Base]:
+    """Arguments for Call or ClassDef, in source order.
+
+    `*arg` and `**arg` are ignored (see ast_raw.cvt_argument).
+    """
+    tokens = ctx.tokens
+    args_and_keywords = sorted(
+        [(tokens.first(arg), arg) for arg in args] +
+        [(tokens.outer_first(keyword.value), keyword)
+         for keyword in keywords],
+        key=lambda first_arg: first_arg[0])
+    result = []  # type: List[ast_cooked.Base]
+    for first, arg in args_and_keywords:
+        if isinstance(arg, py_ast.keyword):
+            if arg.arg is None:  # `**arg`
+                result.append(cvt(arg.value, ctx))
+            else:
+                result.append(
+                    ast_cooked.ArgumentNode(
+                        name=tokens.astn(first - 2),  # NAME '=' value
+                        arg=cvt(arg.value, ctx)))
+        else:
+            result.append(cvt(arg, ctx))
+    return result
+
+
+def cvt_classdef(node: py_ast.ClassDef, ctx: Ctx) -> ast_cooked.Base:
+    """ClassDef(identifier name, expr* bases, keyword* keywords,
+                stmt* body, expr* decorator_list)
+    """
+    decorators = cvt_decorators(node.decorator_list, ctx)
+    name = xcast(ast_cooked.NameBindsNode,
+                 cvt_name_astn(NameCtx.BINDING, _def_name(node, ctx), ctx))
+    ctx_class = new_ctx_from(ctx)
+    bases = cvt_arglist(node.bases, node.keywords, ctx_class)
+    suite = cvt_stmts(node.body, ctx_class)
+    return _decorated(
+        decorators,
+        ast_cooked.ClassDefStmt(
+            name=name,
+            bases=bases,
+            suite=suite,
+            scope_bindings=ctx_class.scope_bindings))
+
+
+def cvt_compare(node: py_ast.Compare, ctx: Ctx) -> ast_cooked.Base:
+    """Compare(expr left, cmpop* ops, expr* comparators)"""
+    # Similar to cvt_boolop
+    tokens = ctx.tokens
+    result = cvt(node.left, ctx)
+    prev_expr = node.left
+    for op, comparator in zip(node.ops, node.comparators):
+        op_start = tokens.outer_last(prev_expr) + 1
+        if isinstance(op, (py_ast.IsNot, py_ast.NotIn)):
+            op_astns = [tokens.astn(op_start), tokens.astn(op_start + 1)]
+        else:
+            op_astns = [tokens.astn(op_start)]
+        result = ast_cooked.OpNode(
+            op_astns=op_astns, args=[result, cvt(comparator, ctx)])
+        prev_expr = comparator
+    return result
+
+
+def cvt_comprehension(generators: Sequence[py_ast.comprehension],
+                      ctx: Ctx) -> ast_cooked.CompForNode:
+    """comprehension(expr target, expr iter, expr* ifs, int is_async)
+
+    Handles the first of generators; the rest are handled by
+    cvt_comp_iter (see ast_raw.cvt_comp_for).
+    """
+    generator = generators[0]
+    in_testlist = cvt(generator.iter, ctx)  # outside the `for`
+    ctx_for = dataclasses.replace(
+        ctx, scope_bindings=collections.OrderedDict())
+    for_exprlist = cvt_name_ctx(NameCtx.BINDING, generator.target, ctx_for)
+    comp_iter = cvt_comp_iter(generator.ifs, generators[1:], ctx_for)
+    return ast_cooked.CompForNode(
+        for_astn=ctx.tokens.astn(
+            ctx.tokens.outer_first(generator.target) - 1),
+        for_exprlist=for_exprlist,
+        in_testlist=in_testlist,
+        comp_iter=comp_iter,
+        scope_bindings=ctx_for.scope_bindings)
+
+
+def cvt_comp_iter(ifs: Sequence[py_ast.expr],
+                  generators: Sequence[py_ast.comprehension],
+                  ctx: Ctx) -> ast_cooked.Base:
+    """The `if`s and `for`s following a `for` in a comprehension.
+
+    See ast_raw.cvt_comp_if: an `if` without anything following it is
+    just its expression.
+    """
+    if ifs:
+        if len(ifs) == 1 and not generators:
+            return cvt(ifs[0], ctx)
+        return ast_cooked.CompIfCompIterNode(
+            value_expr=cvt(ifs[0], ctx),
+            comp_iter=cvt_comp_iter(ifs[1:], generators, ctx))
+    if generators:
+        return cvt_comprehension(generators, ctx)
+    return ast_cooked.OMITTED_NODE
+
+
+def cvt_continue(node: py_ast.Continue, ctx: Ctx) -> ast_cooked.Base:
+    """Continue"""
+    return ast_cooked.ContinueStmt()
+
+
+def cvt_decorators(decorator_list: Sequence[py_ast.expr],
+                   ctx: Ctx) -> Optional[ast_cooked.Base]:
+    """decorators for FunctionDef, ClassDef (None if no decorators)."""
+    # Same as ast_raw.cvt_decorator: `decorator: '@' dotted_name [
+    # '(' [arglist] ')' ] NEWLINE`
+    if not decorator_list:
+        return None
+    decorators = []
+    for decorator in decorator_list:
+        if isinstance(decorator, py_ast.Call):
+            dotted_name = decorator.func
+            arglist = cvt_arglist(decorator.args, decorator.keywords, ctx)
+        else:
+            dotted_name = decorator
+            arglist = []
+        names = []
+        while isinstance(dotted_name, py_ast.Attribute):
+            names.append(ast_cooked.NameRawNode(
+                name=ctx.tokens.astn(ctx.tokens.last(dotted_name))))
+            dotted_name = dotted_name.value
+        names.append(ast_cooked.NameRawNode(
+            name=ctx.tokens.astn(ctx.tokens.first(dotted_name))))
+        decorators.append(ast_cooked.DecoratorNode(
+            name=ast_cooked.DecoratorDottedNameNode(
+                items=list(reversed(names))),
+            args=arglist))
+    return ast_cooked.DecoratorsNode(items=decorators)
+
+
+def _decorated(decorators: Optional[ast_cooked.Base],
+               stmt: ast_cooked.Base) -> ast_cooked.Base:
+    if decorators:
+        return ast_cooked.DecoratedStmt(items=[decorators, stmt])
+    return stmt
+
+
+def _def_name(node: Union[py_ast.FunctionDef, py_ast.AsyncFunctionDef,
+                          py_ast.ClassDef], ctx: Ctx) -> int:
+    """Get the index of the NAME token for a FunctionDef or ClassDef."""
+    # If there are decorators, the position is the first '@' (before
+    # Python 3.8), so start from the end of the decorators.
+    tokens = ctx.tokens
+    if node.decorator_list:
+        i = tokens.outer_last(node.decorator_list[-1]) + 1
+    else:
+        i = tokens.at(node)
+    if tokens.values[i] == 'async':
+        i += 1
+    assert tokens.values[i] in ('def', 'class'), [node, tokens.values[i]]
+    return i + 1
+
+
+def cvt_delete(node: py_ast.Delete, ctx: Ctx) -> ast_cooked.Base:
+    """Delete(expr* targets)"""
+    # ast_raw.cvt_del_stmt always has a single item, which might be
+    # a list
+    tokens = ctx.tokens
+    if (len(node.targets) > 1 or
+            tokens.values[tokens.outer_last(node.targets[-1]) + 1] == ','):
+        exprs = ast_cooked.ExprListNode(
+            items=[cvt(target, ctx)
+                   for target in node.targets])  # type: ast_cooked.Base
+    else:
+        exprs = cvt(node.targets[0], ctx)
+    return ast_cooked.DelStmt(items=[exprs])
+
+
+def cvt_dict(node: py_ast.Dict, ctx: Ctx) -> ast_cooked.Base:
+    """Dict(expr* keys, expr* values)"""
+    items = []  # type: List[ast_cooked.Base]
+    for key, value in zip(node.keys, node.values):
+        if key:  # `**value` has key=None
+            items.append(cvt(key, ctx))
+        items.append(cvt(value, ctx))
+    return ast_cooked.DictSetMakerNode(items=items)
+
+
+def cvt_dictcomp(node: py_ast.DictComp, ctx: Ctx) -> ast_cooked.Base:
+    """DictComp(expr key, expr value, comprehension* generators)"""
+    return ast_cooked.DictGenListSetMakerCompForNode(
+        value_expr=ast_cooked.DictKeyValue(
+            items=[cvt(node.key, ctx), cvt(node.value, ctx)]),
+        comp_for=cvt_comprehension(node.generators, ctx))
+
+
+def cvt_ellipsis(node: py_ast.Ellipsis, ctx: Ctx) -> ast_cooked.Base:
+    """Ellipsis"""
+    return ast_cooked.EllipsisNode()
+
+
+def cvt_expr(node: py_ast.Expr, ctx: Ctx) -> ast_cooked.Base:
+    """Expr(expr value)"""
+    if (isinstance(node.value, (py_ast.Yield, py_ast.YieldFrom)) and
+            not ctx.tokens.is_parenthesized(node.value)):
+        # yield_stmt (not expr_stmt)
+        return cvt(node.value, ctx)
+    return ast_cooked.make_stmts([
+        ast_cooked.AssignMultipleExprStmt(
+            left_list=[], expr=cvt(node.value, ctx))])
+
+
+def cvt_for(node: py_ast.For, ctx: Ctx) -> ast_cooked.Base:
+    """For(expr target, expr iter, stmt* body, stmt* orelse)"""
+    exprlist = cvt_name_ctx(NameCtx.BINDING, node.target, ctx)
+    testlist = cvt(node.iter, ctx)
+    suite = cvt_stmts(node.body, ctx)
+    return ast_cooked.ForStmt(
+        for_exprlist=exprlist,
+        in_testlist=testlist,
+        suite=suite,
+        else_suite=cvt_else(node.orelse, ctx))
+
+
+def cvt_else(orelse: Sequence[py_ast.stmt], ctx: Ctx) -> ast_cooked.Base:
+    """The optional `else` suite for For, While, If."""
+    if orelse:
+        return cvt_stmts(orelse, ctx)
+    return ast_cooked.OMITTED_NODE
+
+
+def cvt_functiondef(node: py_ast.FunctionDef, ctx: Ctx) -> ast_cooked.Base:
+    """FunctionDef(identifier name, arguments args, stmt* body,
+                   expr* decorator_list, expr? returns)
+    """
+    # Same as ast_raw.cvt_funcdef.
+    decorators = cvt_decorators(node.decorator_list, ctx)
+    name = xcast(ast_cooked.NameBindsNode,
+                 cvt_name_astn(NameCtx.BINDING, _def_name(node, ctx), ctx))
+    ctx.scope_bindings[name.name.value] = None
+    # start a new set of bindings for the parameters, suite
+    ctx_func = new_ctx_from(ctx)
+    parameters = cvt_arguments(node.args, ctx_func)
+    if node.returns:
+        return_type = cvt(node.returns, ctx)
+    else:
+        return_type = ast_cooked.OMITTED_NODE
+    suite = cvt_stmts(node.body, ctx_func)
+    return _decorated(
+        decorators,
+        ast_cooked.FuncDefStmt(
+            name=name,
+            parameters=parameters,
+            return_type=return_type,
+            suite=suite,
+            scope_bindings=ctx_func.scope_bindings))
+
+
+def cvt_arguments(node: py_ast.arguments,
+                  ctx: Ctx) -> Sequence[ast_cooked.TypedArgNode]:
+    """arguments = (arg* args, arg? vararg, arg* kwonlyargs,
+                    expr* kw_defaults, arg? kwarg, expr* defaults)
+
+    See ast_raw.cvt_typedargslist.
+    """
+    num_no_default = len(node.args) - len(node.defaults)
+    args_defaults = [
+        (arg, node.defaults[i - num_no_default]
+         if i >= num_no_default else None)
+        for i, arg in enumerate(node.args)]
+    if node.vararg:
+        args_defaults.append((node.vararg, None))
+    args_defaults.extend(zip(node.kwonlyargs, node.kw_defaults))
+    if node.kwarg:
+        args_defaults.append((node.kwarg, None))
+    return [
+        ast_cooked.TypedArgNode(
+            tname=cvt_arg(arg, ctx),
+            expr=cvt(default, ctx) if default else ast_cooked.OMITTED_NODE)
+        for arg, default in args_defaults]
+
+
+def cvt_arg(node: py_ast.arg, ctx: Ctx) -> ast_cooked.TnameNode:
+    """arg = (identifier arg, expr? annotation)"""
+    name = cvt_name_astn(NameCtx.BINDING, ctx.tokens.at(node), ctx)
+    if node.annotation:
+        type_expr = cvt_name_ctx(NameCtx.REF, node.annotation, ctx)
+    else:
+        type_expr = ast_cooked.OMITTED_NODE
+    return ast_cooked.TnameNode(name=name, type_expr=type_expr)
+
+
+def cvt_generatorexp(node: py_ast.GeneratorExp,
+                     ctx: Ctx) -> ast_cooked.Base:
+    """GeneratorExp(expr elt, comprehension* generators)
+
+    Also: ListComp.
+    """
+    return ast_cooked.DictGenListSetMakerCompForNode(
+        value_expr=cvt(node.elt, ctx),
+        comp_for=cvt_comprehension(node.generators, ctx))
+
+
+def cvt_global(node: py_ast.Global, ctx: Ctx) -> ast_cooked.Base:
+    """Global(identifier* names)"""
+    names = _global_names(node, ctx)
+    ctx.global_vars.update((name.name.value, None) for name in names)
+    return ast_cooked.GlobalStmt(items=names)
+
+
+def cvt_nonlocal(node: py_ast.Nonlocal, ctx: Ctx) -> ast_cooked.Base:
+    """Nonlocal(identifier* names)"""
+    names = _global_names(node, ctx)
+    ctx.nonlocal_vars.update((name.name.value, None) for name in names)
+    return ast_cooked.NonLocalStmt(items=names)
+
+
+def _global_names(node: Union[py_ast.Global, py_ast.Nonlocal],
+                  ctx: Ctx) -> List[ast_cooked.NameRefNode]:
+    """The names in a Global or Nonlocal: ('global'|'nonlocal') NAME (',' NAME)*"""
+    i = ctx.tokens.at(node)
+    return [
+        ast_cooked.NameRefNode(name=ctx.tokens.astn(i + 1 + 2 * name_i))
+        for name_i in range(len(node.names))]
+
+
+def cvt_if(node: py_ast.If, ctx: Ctx) -> ast_cooked.Base:
+    """If(expr test, stmt* body, stmt* orelse)"""
+    ifthens = [cvt(node.test, ctx), cvt_stmts(node.body, ctx)]
+    while (len(node.orelse) == 1 and isinstance(node.orelse[0], py_ast.If)
+           and ctx.tokens.values[
+               ctx.tokens.outer_first(node.orelse[0].test) - 1] == 'elif'):
+        node = node.orelse[0]
+        ifthens.append(cvt(node.test, ctx))
+        ifthens.append(cvt_stmts(node.body, ctx))
+    return ast_cooked.IfStmt(items=ifthens + [cvt_else(node.orelse, ctx)])
+
+
+def cvt_ifexp(node: py_ast.IfExp, ctx: Ctx) -> ast_cooked.Base:
+    """IfExp(expr test, expr body, expr orelse)"""
+    # ast_raw.cvt_test ignores all but the first part.
+    return cvt(node.body, ctx)
+
+
+def cvt_import(node: py_ast.Import, ctx: Ctx) -> ast_cooked.Base:
+    """Import(alias* names)"""
+    tokens = ctx.tokens
+    i = tokens.at(node)  # 'import'
+    dotted_as_names = []
+    for alias in node.names:
+        dotted_name, i = _dotted_name(i + 1, ctx)
+        if alias.asname:
+            as_name = xcast(
+                ast_cooked.NameBindsNode,
+                cvt_name_astn(NameCtx.BINDING, i + 2,
+                              ctx))  # type: Optional[ast_cooked.NameBindsNode]
+            i += 2
+        else:
+            as_name = None
+        dotted_as_names.append(
+            ast_cooked.ImportDottedAsNameNode(
+                dotted_name=dotted_name, as_name=as_name))
+        i += 1  # ','
+    return ast_cooked.ImportNameNode(
+        dotted_as_names=ast_cooked.ImportDottedAsNamesNode(
+            items=dotted_as_names))
+
+
+def _dotted_name(i: int, ctx: Ctx) -> Tuple[ast_cooked.DottedNameNode, int]:
+    """dotted_name: NAME ('.' NAME)*, starting at token i.
+
+    Returns:
+      the node and the index of the last NAME token.
+    """
+    tokens = ctx.tokens
+    names = [ast_cooked.NameRawNode(name=tokens.astn(i))]
+    while tokens.values[i + 1] == '.':
+        i += 2
+        names.append(ast_cooked.NameRawNode(name=tokens.astn(i)))
+    return ast_cooked.DottedNameNode(items=names), i
+
+
+def cvt_importfrom(node: py_ast.ImportFrom, ctx: Ctx) -> ast_cooked.Base:
+    """ImportFrom(identifier? module, alias* names, int? level)"""
+    tokens = ctx.tokens
+    i = tokens.at(node) + 1  # skip 'from'
+    from_dots = []  # type: List[ast_cooked.Base]
+    while tokens.values[i] in ('.', '...'):
+        # lib2to3 has a separate token for each '.'
+        for dot_i in range(len(tokens.values[i])):
+            start = tokens.starts[i] + dot_i
+            from_dots.append(ast_cooked.ImportDotNode(
+                dot=ast.Astn(value='.', start=start, end=start + 1)))
+        i += 1
+    from_name = None  # type: Optional[ast_cooked.Base]
+    if node.module:
+        from_name, i = _dotted_name(i, ctx)
+        i += 1
+    assert tokens.values[i] == 'import', [node, i, tokens.values[i]]
+    i += 1
+    if tokens.values[i] == '*':
+        import_part = ast_cooked.StarNode(
+            star=tokens.astn(i))  # type: ast_cooked.Base
+    else:
+        if tokens.values[i] == '(':
+            i += 1
+        as_names = []
+        for alias in node.names:
+            name = ast_cooked.NameRawNode(name=tokens.astn(i))
+            if alias.asname:
+                i += 2
+            as_names.append(ast_cooked.AsNameNode(
+                name=name, as_name=cvt_name_astn(NameCtx.BINDING, i, ctx)))
+            i += 2  # skip ','
+        import_part = ast_cooked.ImportAsNamesNode(items=as_names)
+    return ast_cooked.ImportFromStmt(
+        from_dots=from_dots, from_name=from_name, import_part=import_part)
+
+
+def cvt_lambda(node: py_ast.Lambda, ctx: Ctx) -> ast_cooked.Base:
+    """Lambda(arguments args, expr body)"""
+    name = xcast(ast_cooked.NameBindsNode,
+                 cvt_name_astn(NameCtx.BINDING, ctx.tokens.at(node), ctx))
+    ctx_func = new_ctx_from(ctx)
+    parameters = cvt_arguments(node.args, ctx_func)
+    suite = cvt(node.body, ctx_func)
+    return ast_cooked.FuncDefStmt(
+        name=name,
+        parameters=parameters,
+        return_type=ast_cooked.OMITTED_NODE,
+        suite=suite,
+        scope_bindings=ctx_func.scope_bindings)
+
+
+def cvt_list(node: py_ast.List, ctx: Ctx) -> ast_cooked.Base:
+    """List(expr* elts, expr_context ctx)"""
+    return ast_cooked.ListMakerNode(
+        items=[cvt(elt, ctx) for elt in node.elts])
+
+
+def cvt_module(node: py_ast.Module, ctx: Ctx) -> ast_cooked.Base:
+    """Module(stmt* body)"""
+    return ast_cooked.FileInput(
+        path=ctx.tokens.src_file.path,
+        stmts=cvt_stmts(node.body, ctx).items,
+        scope_bindings=ctx.scope_bindings)
+
+
+def cvt_name(node: py_ast.Name, ctx: Ctx) -> ast_cooked.Base:
+    """Name(identifier id, expr_context ctx)
+
+    Also: NameConstant (which lib2to3 treats as a NAME).
+    """
+    return cvt_name_astn(ctx.name_ctx, ctx.tokens.at(node), ctx)
+
+
+def cvt_num(node: py_ast.Num, ctx: Ctx) -> ast_cooked.Base:
+    """Num(object n)"""
+    return ast_cooked.NumberNode(astn=ctx.tokens.astn(ctx.tokens.at(node)))
+
+
+def cvt_pass(node: py_ast.Pass, ctx: Ctx) -> ast_cooked.Base:
+    """Pass"""
+    return ast_cooked.PassStmt()
+
+
+def cvt_raise(node: py_ast.Raise, ctx: Ctx) -> ast_cooked.Base:
+    """Raise(expr? exc, expr? cause)"""
+    if not node.exc:
+        return ast_cooked.RaiseStmt(items=[])
+    exc = cvt(node.exc, ctx)
+    if node.cause:
+        raise_from = cvt(node.cause, ctx)
+    else:
+        raise_from = ast_cooked.OMITTED_NODE
+    return ast_cooked.RaiseStmt(items=[
+        exc, ast_cooked.OMITTED_NODE, ast_cooked.OMITTED_NODE, raise_from])
+
+
+def cvt_return(node: py_ast.Return, ctx: Ctx) -> ast_cooked.Base:
+    """Return(expr? value)"""
+    if node.value:
+        return cvt(node.value, ctx)
+    return ast_cooked.OMITTED_NODE
+
+
+def cvt_set(node: py_ast.Set, ctx: Ctx) -> ast_cooked.Base:
+    """Set(expr* elts)"""
+    return ast_cooked.DictSetMakerNode(
+        items=[cvt(elt, ctx) for elt in node.elts])
+
+
+def cvt_setcomp(node: py_ast.SetComp, ctx: Ctx) -> ast_cooked.Base:
+    """SetComp(expr elt, comprehension* generators)"""
+    # ast_raw.cvt_dictsetmaker doesn't recognize the comp_for, so it
+    # treats it as an item.
+    return ast_cooked.DictSetMakerNode(items=[
+        cvt(node.elt, ctx), cvt_comprehension(node.generators, ctx)])
+
+
+def cvt_starred(node: py_ast.Starred, ctx: Ctx) -> ast_cooked.Base:
+    """Starred(expr value, expr_context ctx)
+
+    Also: Await, which is handled the same way (see ast_raw.cvt_power).
+    """
+    return cvt(node.value, ctx)  # Ignore the `*`
+
+
+def cvt_str(node: py_ast.Str, ctx: Ctx) -> ast_cooked.Base:
+    """Str(string s)
+
+    Also: Bytes, JoinedStr.
+    """
+    # ast_raw.cvt_atom only uses the first of STRING+
+    return ast_cooked.StringNode(
+        astns=[ctx.tokens.astn(ctx.tokens.first(node))])
+
+
+def cvt_subscript(node: py_ast.Subscript, ctx: Ctx) -> ast_cooked.Base:
+    """Subscript(expr value, slice slice, expr_context ctx)"""
+    ctx_ref = dataclasses.replace(ctx, name_ctx=NameCtx.REF)
+    atom = cvt(node.value, ctx_ref)
+    # Index, ExtSlice or Slice (Index and ExtSlice are only in the
+    # Python 3.6 and 3.7 type stubs):
+    slice_node = node.slice  # type: Any
+    if isinstance(slice_node, py_ast.ExtSlice):
+        subscripts = [cvt_slice(dim, ctx_ref) for dim in slice_node.dims]
+    elif (isinstance(slice_node, py_ast.Index) and
+          isinstance(slice_node.value, py_ast.Tuple) and
+          slice_node.value.elts and
+          not ctx.tokens.is_parenthesized(slice_node.value)):
+        # subscriptlist: subscript (',' subscript)* [',']
+        subscripts = [
+            ast_cooked.SubscriptNode(
+                expr1=cvt(elt, ctx_ref),
+                expr2=ast_cooked.OMITTED_NODE,
+                expr3=ast_cooked.OMITTED_NODE)
+            for elt in slice_node.value.elts]
+    else:
+        subscripts = [cvt_slice(slice_node, ctx_ref)]
+    return ast_cooked.AtomSubscriptNode(atom=atom, subscripts=subscripts)
+
+
+def cvt_slice(node: Any, ctx: Ctx) -> ast_cooked.SubscriptNode:
+    """Index(expr value) | Slice(expr? lower, expr? upper, expr? step)"""
+    if isinstance(node, py_ast.Index):
+        return ast_cooked.SubscriptNode(
+            expr1=cvt(xcast(py_ast.Index, node).value, ctx),
+            expr2=ast_cooked.OMITTED_NODE,
+            expr3=ast_cooked.OMITTED_NODE)
+    slice_node = xcast(py_ast.Slice, node)
+    return ast_cooked.SubscriptNode(
+        expr1=_cvt_optional(slice_node.lower, ctx),
+        expr2=_cvt_optional(slice_node.upper, ctx),
+        expr3=_cvt_optional(slice_node.step, ctx))
+
+
+def _cvt_optional(node: Optional[py_ast.AST], ctx: Ctx) -> ast_cooked.Base:
+    if node:
+        return cvt(node, ctx)
+    return ast_cooked.OMITTED_NODE
+
+
+def cvt_try(node: py_ast.Try, ctx: Ctx) -> ast_cooked.Base:
+    """Try(stmt* body, excepthandler* handlers, stmt* orelse, stmt* finalbody)"""
+    items = [cvt_stmts(node.body, ctx)]  # type: List[ast_cooked.Base]
+    for handler in node.handlers:
+        items.append(cvt_excepthandler(handler, ctx))
+        items.append(cvt_stmts(handler.body, ctx))
+    if node.orelse:
+        items.append(cvt_stmts(node.orelse, ctx))
+    if node.finalbody:
+        items.append(cvt_stmts(node.finalbody, ctx))
+    return ast_cooked.TryStmt(items=items)
+
+
+def cvt_excepthandler(node: py_ast.ExceptHandler,
+                      ctx: Ctx) -> ast_cooked.Base:
+    """ExceptHandler(expr? type, identifier? name, stmt* body)
+
+    The body isn't processed (see cvt_try).
+    """
+    if node.type:
+        expr = cvt(node.type, ctx)
+    else:
+        expr = ast_cooked.OMITTED_NODE
+    if node.name:
+        # `except E as name`: node.type can't be None
+        as_item = cvt_name_astn(
+            NameCtx.BINDING,
+            ctx.tokens.outer_last(xcast(py_ast.expr, node.type)) + 2, ctx)
+    else:
+        as_item = ast_cooked.OMITTED_NODE
+    return ast_cooked.ExceptClauseNode(expr=expr, as_item=as_item)
+
+
+def cvt_tuple(node: py_ast.Tuple, ctx: Ctx) -> ast_cooked.Base:
+    """Tuple(expr* elts, expr_context ctx)"""
+    return ast_cooked.ExprListNode(items=[cvt(elt, ctx) for elt in node.elts])
+
+
+def cvt_unaryop(node: py_ast.UnaryOp, ctx: Ctx) -> ast_cooked.Base:
+    """UnaryOp(unaryop op, expr operand)"""
+    return ast_cooked.OpNode(
+        op_astns=[ctx.tokens.astn(ctx.tokens.at(node))],
+        args=[cvt(node.operand, ctx)])
+
+
+def cvt_while(node: py_ast.While, ctx: Ctx) -> ast_cooked.Base:
+    """While(expr test, stmt* body, stmt* orelse)"""
+    return ast_cooked.WhileStmt(
+        test=cvt(node.test, ctx),
+        suite=cvt_stmts(node.body, ctx),
+        else_suite=cvt_else(node.orelse, ctx))
+
+
+def cvt_with(node: py_ast.With, ctx: Ctx) -> ast_cooked.Base:
+    """With(withitem* items, stmt* body)"""
+    # ast_raw.cvt_with_item doesn't treat the `as` part as a binding.
+    return ast_cooked.WithStmt(
+        items=[
+            ast_cooked.WithItemNode(
+                item=cvt(item.context_expr, ctx),
+                as_item=_cvt_optional(item.optional_vars, ctx))
+            for item in node.items],
+        suite=cvt_stmts(node.body, ctx))
+
+
+def cvt_yield(node: py_ast.Yield, ctx: Ctx) -> ast_cooked.Base:
+    """Yield(expr? value)
+
+    Also: YieldFrom(expr value).
+    """
+    if node.value:
+        return ast_cooked.YieldNode(items=[cvt(node.value, ctx)])
+    return ast_cooked.YieldNode(items=[])
+
+
+def cvt_name_astn(name_ctx: NameCtx, i: int, ctx: Ctx) -> ast_cooked.Base:
+    """Handle the NAME at token i (see ast_raw.cvt_token_name)."""
+    name_astn = ctx.tokens.astn(i)
+    if name_ctx is NameCtx.BINDING:
+        if (name_astn.value not in ctx.global_vars and
+                name_astn.value not in ctx.nonlocal_vars):
+            ctx.scope_bindings[name_astn.value] = None
+            return ast_cooked.NameBindsNode(name=name_astn)
+        return ast_cooked.NameRefNode(name=name_astn)
+    if name_ctx is NameCtx.REF:
+        return ast_cooked.NameRefNode(name=name_astn)
+    if name_ctx is NameCtx.RAW:
+        return ast_cooked.NameRawNode(name=name_astn)
+    raise ValueError('Invalid name_ctx: {} to {!r}'.format(
+        name_ctx, name_astn))  # pragma: no cover
+
+
+def cvt_stmts(stmts: Sequence[py_ast.stmt], ctx: Ctx) -> ast_cooked.Stmts:
+    """Convert a body (suite)."""
+    return ast_cooked.make_stmts(cvt(stmt, ctx) for stmt in stmts)
+
+
+_DISPATCH = {
+    py_ast.AnnAssign: cvt_annassign,
+    py_ast.Assert: cvt_assert,
+    py_ast.Assign: cvt_assign,
+    py_ast.AsyncFor: cvt_for,
+    py_ast.AsyncFunctionDef: cvt_functiondef,
+    py_ast.AsyncWith: cvt_with,
+    py_ast.Attribute: cvt_attribute,
+    py_ast.AugAssign: cvt_augassign,
+    py_ast.Await: cvt_starred,
+    py_ast.BinOp: cvt_binop,
+    py_ast.BoolOp: cvt_boolop,
+    py_ast.Break: cvt_break,
+    py_ast.Bytes: cvt_str,
+    py_ast.Call: cvt_call,
+    py_ast.ClassDef: cvt_classdef,
+    py_ast.Compare: cvt_compare,
+    py_ast.Continue: cvt_continue,
+    py_ast.Delete: cvt_delete,
+    py_ast.Dict: cvt_dict,
+    py_ast.DictComp: cvt_dictcomp,
+    py_ast.Ellipsis: cvt_ellipsis,
+    py_ast.Expr: cvt_expr,
+    py_ast.For: cvt_for,
+    py_ast.FunctionDef: cvt_functiondef,
+    py_ast.GeneratorExp: cvt_generatorexp,
+    py_ast.Global: cvt_global,
+    py_ast.If: cvt_if,
+    py_ast.IfExp: cvt_ifexp,
+    py_ast.Import: cvt_import,
+    py_ast.ImportFrom: cvt_importfrom,
+    py_ast.JoinedStr: cvt_str,
+    py_ast.Lambda: cvt_lambda,
+    py_ast.List: cvt_list,
+    py_ast.ListComp: cvt_generatorexp,
+    py_ast.Module: cvt_module,
+    py_ast.Name: cvt_name,
+    py_ast.NameConstant: cvt_name,
+    py_ast.Nonlocal: cvt_nonlocal,
+    py_ast.Num: cvt_num,
+    py_ast.Pass: cvt_pass,
+    py_ast.Raise: cvt_raise,
+    py_ast.Return: cvt_return,
+    py_ast.Set: cvt_set,
+    py_ast.SetComp: cvt_setcomp,
+    py_ast.Starred: cvt_starred,
+    py_ast.Str: cvt_str,
+    py_ast.Subscript: cvt_subscript,
+    py_ast.Try: cvt_try,
+    py_ast.Tuple: cvt_tuple,
+    py_ast.UnaryOp: cvt_unaryop,
+    py_ast.While: cvt_while,
+    py_ast.With: cvt_with,
+    py_ast.Yield: cvt_yield,
+    py_ast.YieldFrom: cvt_yield,
+}  # type: Dict[type, Callable[[Any, Ctx], ast_cooked.Base]]
+
+
+def cvt(node: py_ast.AST, ctx: Ctx) -> ast_cooked.Base:
+    """Call the appropriate cvt_XXX for node."""
+    return _DISPATCH[type(node)](node, ctx)
+
+
+def cvt_name_ctx(name_ctx: NameCtx, node: py_ast.AST,
+                 ctx: Ctx) -> ast_cooked.Base:
+    """Dispatch in a new context that changes name_ctx."""
+    return cvt(node, dataclasses.replace(ctx, name_ctx=name_ctx))
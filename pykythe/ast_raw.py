@@ -16,27 +16,53 @@ import dataclasses
 import enum
 import io
 import logging
+import re
+import reprlib
+import threading
+import types
 from lib2to3 import pygram
 from lib2to3 import pytree
 from lib2to3.pygram import python_symbols as syms
 from lib2to3.pgen2 import driver, grammar as pgen2_grammar, token, tokenize
 
 from typing import (
-    Callable, Dict, FrozenSet, List, Optional, Sequence, Text, Tuple, Union)  # pylint: disable=unused-import
+    Callable, Dict, FrozenSet, Generator, List, Optional, Sequence, Text,
+    Tuple, Union)  # pylint: disable=unused-import
 import typing
 
-# The following requires pip3 install mypy_extensions
-# and possibly symlinking into /usr/local/lib/python3.6/dist-packages
-from mypy_extensions import Arg
+if typing.TYPE_CHECKING:
+    # The following requires pip3 install mypy_extensions
+    # and possibly symlinking into /usr/local/lib/python3.6/dist-packages
+    # (it's only needed for type-checking; importing it at run time
+    # would add to start-up time).
+    from mypy_extensions import Arg
 
-from . import ast, ast_cooked, pod, typing_debug
+from . import ast, ast_cooked, pod, tokenizer, typing_debug
 from .typing_debug import cast as xcast
 
 
-def cvt_parse_tree(parse_tree: pytree.Base, python_version: int,
-                   src_file: ast.File) -> ast_cooked.Base:
-    """Convert a lib2to3.pytree to ast_cooked.Base."""
-    return cvt(parse_tree, new_ctx(python_version, src_file))
+def cvt_parse_tree(parse_tree: pytree.Base,
+                   python_version: int,
+                   src_file: ast.File,
+                   prune: FrozenSet[Text] = frozenset()) -> ast_cooked.Base:
+    """Convert a lib2to3.pytree to ast_cooked.Base.
+
+    prune is a subset of PRUNE_KINDS (see Ctx.prune).
+    """
+    return cvt(parse_tree, new_ctx(python_version, src_file, prune))
+
+
+# What cvt can prune (see Ctx.prune). These are subtrees without any
+# names, which pykythe.pl processes without producing any Kythe facts,
+# and which don't affect the types that it computes (the container
+# types todo_list, todo_dictset, todo_exprlist evaluate to [] whatever
+# their items are, and the type of a StringNode doesn't depend on its
+# astns):
+#   'exprs': expression statements (e.g., docstrings) are dropped
+#   'strings': the source text of strings (StringNode.astns) is dropped
+#   'containers': the items of lists, dicts, sets and tuples are
+#                 dropped (the container is kept, with no items)
+PRUNE_KINDS = ('exprs', 'strings', 'containers')
 
 
 # pylint: disable=too-few-public-methods
@@ -103,6 +129,7 @@ class Ctx(pod.PlainOldData):
             statements within the current scope.
         python_version: 2 or 3
         src_file: source and offset information
+        prune: The kinds of subtrees to prune (a subset of PRUNE_KINDS).
 
     """
 
@@ -112,10 +139,11 @@ class Ctx(pod.PlainOldData):
     nonlocal_vars: Dict[Text, None]
     python_version: int
     src_file: ast.File
+    prune: FrozenSet[Text]
 
     __slots__ = [
         'name_ctx', 'scope_bindings', 'global_vars', 'nonlocal_vars',
-        'python_version', 'src_file']
+        'python_version', 'src_file', 'prune']
 
     def __post_init__(self) -> None:
         # scope_bindings should be collections.OrderedDicts if you want
@@ -123,18 +151,30 @@ class Ctx(pod.PlainOldData):
         assert self.python_version in (2, 3)
 
 
-def new_ctx(python_version: int, src_file: ast.File) -> Ctx:
+def new_ctx(python_version: int,
+            src_file: ast.File,
+            prune: FrozenSet[Text] = frozenset()) -> Ctx:
     return Ctx(
         name_ctx=NameCtx.REF,
         scope_bindings=collections.OrderedDict(),
         global_vars=collections.OrderedDict(),
         nonlocal_vars=collections.OrderedDict(),
         python_version=python_version,
-        src_file=src_file)
+        src_file=src_file,
+        prune=prune)
 
 
 def new_ctx_from(ctx: Ctx) -> Ctx:
-    return new_ctx(ctx.python_version, ctx.src_file)
+    return new_ctx(ctx.python_version, ctx.src_file, ctx.prune)
+
+
+# Expressions can be nested very deeply (e.g., `((((x))))` or
+# `f(f(f(x)))`), so their cvt_XXX functions are generators, to avoid
+# exceeding the recursion limit: instead of calling cvt() for a child,
+# the function yields the (child, ctx) and is sent the result (see
+# cvt). The generator's return value is the converted node.
+_CvtGenerator = Generator[Tuple[pytree.Base, Ctx], ast_cooked.Base,
+                          ast_cooked.Base]
 
 
 def cvt_annassign(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -149,13 +189,14 @@ def cvt_annassign(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         left_annotation=cvt(node.children[1], ctx), expr=expr)
 
 
-def cvt_arglist(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_arglist(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """arglist: argument (',' argument)* [',']"""
     assert ctx.name_ctx is NameCtx.REF, [node]
-    return ast_cooked.RawArgListNode(args=cvt_children_skip_commas(node, ctx))
+    return ast_cooked.RawArgListNode(
+        args=(yield from cvt_children_skip_commas_gen(node, ctx)))
 
 
-def cvt_argument(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_argument(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """
     argument: ( test [comp_for] |
                 test '=' test |
@@ -165,30 +206,32 @@ def cvt_argument(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     assert ctx.name_ctx is NameCtx.REF, [node]
     if node.children[0].type == SYMS_TEST:
         if len(node.children) == 1:
-            return cvt(node.children[0], ctx)
+            return (yield node.children[0], ctx)
         if node.children[1].type == token.EQUAL:
             # The name is a `test`, which should simplify to a single
             # name, so use cvt() to get that name, and then extract
             # the astn:
-            name_cvt = cvt(node.children[0], ctx)
+            name_cvt = yield node.children[0], ctx
             if isinstance(name_cvt, ast_cooked.NameRefNode):
                 return ast_cooked.ArgumentNode(
-                    name=name_cvt.name, arg=cvt(node.children[2], ctx))
+                    name=name_cvt.name, arg=(yield node.children[2], ctx))
             # The grammar allows this but it's not a well-formed Python program
             logging.warning(
                 'argument not in form name=expr: %r', node)  # pragma: no cover
-            return cvt(node.children[2], ctx)  # pragma: no cover
+            return (yield node.children[2], ctx)  # pragma: no cover
         assert node.children[1].type == syms.comp_for
         assert len(node.children) == 2
         # the arg is a generator
+        value_expr = yield node.children[0], ctx
         return ast_cooked.DictGenListSetMakerCompForNode(
-            value_expr=cvt(node.children[0], ctx),
-            comp_for=xcast(ast_cooked.CompForNode, cvt(node.children[1], ctx)))
+            value_expr=value_expr,
+            comp_for=xcast(ast_cooked.CompForNode,
+                           (yield node.children[1], ctx)))
     if node.children[0].type == token.DOUBLESTAR:
-        return cvt(node.children[1], ctx)  # Ignore the `**`
+        return (yield node.children[1], ctx)  # Ignore the `**`
     assert node.children[0].type == SYMS_STAR_EXPR, dict(
         ch0=node.children[0], node=node)
-    return cvt(node.children[0], ctx)  # Ignores the `*`
+    return (yield node.children[0], ctx)  # Ignores the `*`
 
 
 def cvt_assert_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -216,7 +259,7 @@ def cvt_async_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return cvt(node.children[1], ctx)  # Ignore the `async`
 
 
-def cvt_atom(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_atom(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """
     atom: ('(' [yield_expr|testlist_gexp] ')' |
            '[' [listmaker] ']' |
@@ -228,7 +271,7 @@ def cvt_atom(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     ch0 = node.children[0]
     if ch0.type in _EMPTY_PAIR:
         if len(node.children) == 3:
-            result = cvt(node.children[1], ctx)
+            result = yield node.children[1], ctx
         else:
             assert len(node.children) == 2
             if ch0.type == token.LSQB:
@@ -238,7 +281,7 @@ def cvt_atom(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
             else:
                 result = ast_cooked.ExprListNode(items=[])
     elif ch0.type in _CONSTANT:
-        result = cvt(ch0, ctx)
+        result = yield ch0, ctx
     elif (len(node.children) == 3 and node.children[0].type ==
           node.children[1].type == node.children[2].type == token.DOT):
         assert ctx.name_ctx is NameCtx.REF, [node]
@@ -268,7 +311,7 @@ def cvt_augassign(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         op=ctx.src_file.astn_to_range(node.children[0]))
 
 
-def cvt_binary_op(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_binary_op(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """Handles the following rules (as modified by _convert()):
        and_expr: shift_expr ('&' shift_expr)*
        and_test: not_test ('and' not_test)*
@@ -279,19 +322,19 @@ def cvt_binary_op(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
        term: factor (('*'|'@'|'/'|'%'|'//') factor)*
        xor_expr: and_expr ('^' and_expr)*
     """
-    result = cvt(node.children[0], ctx)
+    result = yield node.children[0], ctx
     if len(node.children) == 1:
-        # Can appear on left of assignment if it's a single item; also, this reduces
-        # the clutter in the ast_cooked tree without losing any
-        # significant information.
-        # TODO: modify _EXPR_NODES (used by _convert) to reduce
-        #       the raw tree before getting to here
+        # Only for `expr` (the others are removed by _convert). Can
+        # appear on left of assignment if it's a single item; also,
+        # this reduces the clutter in the ast_cooked tree without
+        # losing any significant information.
         return result
     assert ctx.name_ctx is NameCtx.REF, [node]
     for i in range(1, len(node.children), 2):
+        op_astns = [ctx.src_file.astn_to_range(node.children[i])]
         result = ast_cooked.OpNode(
-            op_astns=[ctx.src_file.astn_to_range(node.children[i])],
-            args=[result, cvt(node.children[i + 1], ctx)])
+            op_astns=op_astns,
+            args=[result, (yield node.children[i + 1], ctx)])
     return result
 
 
@@ -327,7 +370,7 @@ def cvt_classdef(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         scope_bindings=ctx_class.scope_bindings)
 
 
-def cvt_comp_for(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_comp_for(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """comp_for: [ASYNC] 'for' exprlist 'in' test_list_safe [comp_iter]
     """
     assert ctx.name_ctx is NameCtx.REF, [node]
@@ -337,13 +380,14 @@ def cvt_comp_for(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         children = node.children[1:]  # ignore ASYNC
     else:
         children = node.children
-    in_testlist = cvt(children[3], ctx)  # outside the `for`
+    in_testlist = yield children[3], ctx  # outside the `for`
     ctx_for = (
         ctx if ctx.python_version == 2 else  # TODO: Python 2 test case
         dataclasses.replace(ctx, scope_bindings=collections.OrderedDict()))
-    for_exprlist = cvt_name_ctx(NameCtx.BINDING, children[1], ctx_for)
+    for_exprlist = yield children[1], dataclasses.replace(
+        ctx_for, name_ctx=NameCtx.BINDING)
     if len(children) == 5:
-        comp_iter = cvt(children[4], ctx_for)  # evaluated in context of `for`
+        comp_iter = yield children[4], ctx_for  # evaluated in context of `for`
     else:
         comp_iter = ast_cooked.OMITTED_NODE
     if ctx.python_version == 2:  # TODO: Python2 test case
@@ -356,23 +400,23 @@ def cvt_comp_for(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         scope_bindings=ctx_for.scope_bindings)
 
 
-def cvt_comp_if(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_comp_if(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """comp_if: 'if' old_test [comp_iter]
     """
     assert ctx.name_ctx is NameCtx.REF, [node]
     if len(node.children) == 2:
-        return cvt(node.children[1], ctx)
+        return (yield node.children[1], ctx)
     assert len(node.children) == 3
+    value_expr = yield node.children[1], ctx
     return ast_cooked.CompIfCompIterNode(
-        value_expr=cvt(node.children[1], ctx),
-        comp_iter=cvt(node.children[2], ctx))
+        value_expr=value_expr, comp_iter=(yield node.children[2], ctx))
 
 
-def cvt_comp_iter(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_comp_iter(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """comp_iter: comp_for | comp_if
     """
     assert ctx.name_ctx is NameCtx.REF, [node]
-    return cvt(node.children[0], ctx)
+    return (yield node.children[0], ctx)
 
 
 def cvt_comp_op(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -384,21 +428,21 @@ def cvt_comp_op(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         args=[])
 
 
-def cvt_comparison(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_comparison(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """comparison: expr (comp_op expr)*"""
     # This is similar to cvt_binary_op
-    result = cvt(node.children[0], ctx)
+    result = yield node.children[0], ctx
     if len(node.children) == 1:
         # Can appear on left of assignment if it's a single item
         return result
     assert ctx.name_ctx is NameCtx.REF, [node]
     for i in range(1, len(node.children), 2):
-        op_astns = xcast(ast_cooked.OpNode, cvt(
-            node.children[i], ctx)).op_astns
+        op_astns = xcast(ast_cooked.OpNode, (yield node.children[i],
+                                             ctx)).op_astns
         typing_debug.assert_all_isinstance(ast.Astn, op_astns)  # TODO: remove
         result = ast_cooked.OpNode(
-            op_astns=op_astns, args=[result,
-                                     cvt(node.children[i + 1], ctx)])
+            op_astns=op_astns,
+            args=[result, (yield node.children[i + 1], ctx)])
     return result
 
 
@@ -457,7 +501,7 @@ def cvt_del_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return ast_cooked.DelStmt(items=[exprs])
 
 
-def cvt_dictsetmaker(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_dictsetmaker(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """
     dictsetmaker: ( ((test ':' test | '**' expr)
                      (comp_for | (',' (test ':' test | '**' expr))* [','])) |
@@ -466,31 +510,38 @@ def cvt_dictsetmaker(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     """
     assert ctx.name_ctx is NameCtx.REF, [node]
     if len(node.children) == 1:
-        return ast_cooked.DictSetMakerNode(items=[cvt(node.children[0], ctx)])
+        return ast_cooked.DictSetMakerNode(
+            items=_prune_items([(yield node.children[0], ctx)], ctx))
     if (len(node.children) == 4 and node.children[1].type == token.COLON and
             node.children[3].type == syms.comp_for):
+        key = yield node.children[0], ctx
+        value = yield node.children[2], ctx
         return ast_cooked.DictGenListSetMakerCompForNode(
-            value_expr=ast_cooked.DictKeyValue(
-                items=[cvt(node.children[0], ctx),
-                       cvt(node.children[2], ctx)]),
-            comp_for=xcast(ast_cooked.CompForNode, cvt(node.children[3], ctx)))
+            value_expr=ast_cooked.DictKeyValue(items=[key, value]),
+            comp_for=xcast(ast_cooked.CompForNode,
+                           (yield node.children[3], ctx)))
     if (len(node.children) == 3 and
             node.children[0].type == token.DOUBLESTAR and
             node.children[2].type == syms.comp_for):
         # TODO: test case
+        value_expr = yield node.children[1], ctx  # ignore '**'
         return ast_cooked.DictGenListSetMakerCompForNode(
-            value_expr=cvt(node.children[1], ctx),  # ignore '**'
-            comp_for=xcast(ast_cooked.CompForNode, cvt(node.children[2], ctx)))
+            value_expr=value_expr,
+            comp_for=xcast(ast_cooked.CompForNode,
+                           (yield node.children[2], ctx)))
     if node.children[1] == syms.comp_for:
         # TODO: test case
         assert len(node.children) == 2
+        value_expr = yield node.children[0], ctx
         return ast_cooked.DictGenListSetMakerCompForNode(
-            value_expr=cvt(node.children[0], ctx),
-            comp_for=xcast(ast_cooked.CompForNode, cvt(node.children[1], ctx)))
-    return ast_cooked.DictSetMakerNode(items=[
-        cvt(ch, ctx)
-        for ch in node.children
-        if ch.type not in (token.COLON, token.DOUBLESTAR, token.COMMA)])
+            value_expr=value_expr,
+            comp_for=xcast(ast_cooked.CompForNode,
+                           (yield node.children[1], ctx)))
+    items = []
+    for ch in node.children:
+        if ch.type not in (token.COLON, token.DOUBLESTAR, token.COMMA):
+            items.append((yield ch, ctx))
+    return ast_cooked.DictSetMakerNode(items=_prune_items(items, ctx))
 
 
 def cvt_dotted_as_name(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -584,10 +635,12 @@ def cvt_expr_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     """
     assert ctx.name_ctx is NameCtx.REF, [node]
     if len(node.children) == 1:
+        expr = cvt(node.children[0], ctx)
+        if 'exprs' in ctx.prune and _has_no_names(expr, ctx):
+            return ast_cooked.make_stmts([])
         # TODO: ast_cooked.ExprStmt:
-        return ast_cooked.make_stmts([
-            ast_cooked.AssignMultipleExprStmt(
-                left_list=[], expr=cvt(node.children[0], ctx))])
+        return ast_cooked.make_stmts(
+            [ast_cooked.AssignMultipleExprStmt(left_list=[], expr=expr)])
     if len(node.children) == 2:
         # TODO: test case
         assert node.children[1].type == SYMS_ANNASSIGN
@@ -619,11 +672,11 @@ def cvt_expr_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         left=left_augassign, augassign=augassign.op, expr=expr)
 
 
-def cvt_exprlist(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_exprlist(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """exprlist: (expr|star_expr) (',' (expr|star_expr))* [',']"""
     # TODO: Can appear in (LHS) binding context ('for' exprlist ...)?
     #       (or is this only as testlist?)
-    return cvt_children_skip_commas_tuple(node, ctx)
+    return (yield from cvt_children_skip_commas_tuple(node, ctx))
 
 
 def cvt_file_input(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -792,7 +845,7 @@ def cvt_import_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return cvt(node.children[0], ctx)
 
 
-def cvt_lambdef(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_lambdef(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """lambdef: 'lambda' [varargslist] ':' test"""
     assert ctx.name_ctx is NameCtx.REF, [node]
     name = xcast(ast_cooked.NameBindsNode,
@@ -801,10 +854,10 @@ def cvt_lambdef(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     if len(node.children) == 4:
         parameters = xcast(ast_cooked.RawTypedArgsListNode,
                            cvt(node.children[1], ctx_func))
-        suite = cvt(node.children[3], ctx_func)
+        suite = yield node.children[3], ctx_func
     else:
         parameters = ast_cooked.RawTypedArgsListNode(args=[])
-        suite = cvt(node.children[2], ctx_func)
+        suite = yield node.children[2], ctx_func
     return ast_cooked.FuncDefStmt(
         name=name,
         parameters=parameters.args,
@@ -813,15 +866,18 @@ def cvt_lambdef(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         scope_bindings=ctx_func.scope_bindings)
 
 
-def cvt_listmaker(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_listmaker(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """listmaker: (test|star_expr) ( comp_for | (',' (test|star_expr))* [','] )"""
     assert ctx.name_ctx is NameCtx.REF, [node]
     if len(node.children) > 1 and node.children[1].type == syms.comp_for:
         assert len(node.children) == 2
+        value_expr = yield node.children[0], ctx
         return ast_cooked.DictGenListSetMakerCompForNode(
-            value_expr=cvt(node.children[0], ctx),
-            comp_for=xcast(ast_cooked.CompForNode, cvt(node.children[1], ctx)))
-    return ast_cooked.ListMakerNode(items=cvt_children_skip_commas(node, ctx))
+            value_expr=value_expr,
+            comp_for=xcast(ast_cooked.CompForNode,
+                           (yield node.children[1], ctx)))
+    return ast_cooked.ListMakerNode(items=_prune_items(
+        (yield from cvt_children_skip_commas_gen(node, ctx)), ctx))
 
 
 def cvt_parameters(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -838,22 +894,27 @@ def cvt_pass_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return ast_cooked.PassStmt()
 
 
-def cvt_power(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
-    """power: [AWAIT] atom trailer* ['**' factor]"""
+def cvt_power(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
+    """power: [AWAIT] atom trailer* ['**' factor]
+
+    The atom and factor might have been removed by _convert (e.g.,
+    `x ** y` is NAME '**' NAME), so neither's type is checked.
+    """
     # Can appear on left of assignment
     if (node.children[0].type == token.NAME and
-            node.children[0].value == 'await'):  # type: ignore
+            node.children[0].value == 'await' and  # type: ignore
+            node.children[1].type not in (SYMS_TRAILER, token.DOUBLESTAR)):
+        # (`await(x)` or `await ** 2` is a use of the name `await`)
         # ignore AWAIT
         # TODO: test case
         children = node.children[1:]
     else:
         children = node.children
     if len(children) == 1:
-        return cvt(children[0], ctx)
-    if children[-1].type == SYMS_FACTOR:
-        assert children[-2].type == token.DOUBLESTAR
-        doublestar_factor = cvt(
-            children[-1], ctx)  # type: Optional[ast_cooked.Base]
+        return (yield children[0], ctx)
+    if children[-2].type == token.DOUBLESTAR:
+        doublestar_factor = (
+            yield children[-1], ctx)  # type: Optional[ast_cooked.Base]
         children = children[:-2]
     else:
         assert len(children) == 1 or children[-1].type == SYMS_TRAILER
@@ -862,10 +923,12 @@ def cvt_power(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     # context; the last item is in the current binds context (which
     # only applies for ".").
     trailer_ctx = dataclasses.replace(ctx, name_ctx=NameCtx.REF)
-    atom = cvt(children[0], trailer_ctx)
-    trailers = [cvt(ch, trailer_ctx) for ch in children[1:-1]]
+    atom = yield children[0], trailer_ctx
+    trailers = []
+    for ch in children[1:-1]:
+        trailers.append((yield ch, trailer_ctx))
     if len(children) > 1:
-        trailers.append(cvt(children[-1], ctx))
+        trailers.append((yield children[-1], ctx))
     typing_debug.assert_all_isinstance(ast_cooked.BaseAtomTrailer, trailers)
     trailer = ast_cooked.atom_trailer_node(
         atom, typing.cast(Sequence[ast_cooked.BaseAtomTrailer], trailers))
@@ -945,11 +1008,11 @@ def cvt_single_input(
     return cvt(node.children[0], ctx)
 
 
-def cvt_sliceop(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_sliceop(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """sliceop: ':' [test]"""
     # TODO: test case
     assert ctx.name_ctx is NameCtx.REF, [node]
-    return cvt(node.children[0], ctx)
+    return (yield node.children[0], ctx)
 
 
 def cvt_small_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -969,14 +1032,14 @@ def cvt_stmt(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return ast_cooked.make_stmts([cvt(node.children[0], ctx)])
 
 
-def cvt_subscript(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_subscript(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """subscript: test | [test] ':' [test] [sliceop]"""
     assert ctx.name_ctx is NameCtx.REF, [node]
     if len(node.children) == 1:
         if node.children[0].type == token.COLON:
             expr1 = ast_cooked.OMITTED_NODE  # type: ast_cooked.Base
         else:
-            expr1 = cvt(node.children[0], ctx)
+            expr1 = yield node.children[0], ctx
         expr2 = ast_cooked.OMITTED_NODE  # type: ast_cooked.Base
         expr3 = ast_cooked.OMITTED_NODE  # type: ast_cooked.Base
     else:
@@ -985,33 +1048,33 @@ def cvt_subscript(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
             expr1 = ast_cooked.OMITTED_NODE
             i += 1
         else:
-            expr1 = cvt(node.children[0], ctx)
+            expr1 = yield node.children[0], ctx
             i += 2  # skip ':'
         if i < len(node.children):
             if node.children[i].type == SYMS_SLICEOP:
                 # TODO: test case
                 expr2 = ast_cooked.OMITTED_NODE
             else:
-                expr2 = cvt(node.children[i], ctx)
+                expr2 = yield node.children[i], ctx
                 i += 1
             if i < len(node.children):
                 # TODO: test case
-                expr3 = cvt(node.children[i], ctx)
+                expr3 = yield node.children[i], ctx
             else:
                 expr3 = ast_cooked.OMITTED_NODE
         else:
-            expr1 = cvt(node.children[0], ctx)
+            expr1 = yield node.children[0], ctx
             expr2 = ast_cooked.OMITTED_NODE
             expr3 = ast_cooked.OMITTED_NODE
     return ast_cooked.SubscriptNode(expr1=expr1, expr2=expr2, expr3=expr3)
 
 
-def cvt_subscriptlist(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_subscriptlist(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """subscriptlist: subscript (',' subscript)* [',']"""
     # Can appear on left of assignment
     return ast_cooked.RawSubscriptListNode(
-        subscripts=cvt_children_skip_commas(
-            node, dataclasses.replace(ctx, name_ctx=NameCtx.REF)))
+        subscripts=(yield from cvt_children_skip_commas_gen(
+            node, dataclasses.replace(ctx, name_ctx=NameCtx.REF))))
 
 
 def cvt_suite(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -1026,63 +1089,66 @@ def cvt_suite(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
         if ch.type not in (token.NEWLINE, token.INDENT, token.DEDENT))
 
 
-def cvt_star_expr(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_star_expr(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """star_expr: '*' expr"""
     assert ctx.name_ctx is NameCtx.REF, [node]
     # Ignore the `*`
-    return cvt(node.children[1], ctx)
+    return (yield node.children[1], ctx)
 
 
-def cvt_test(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_test(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """
     test: or_test ['if' or_test 'else' test] | lambdef
     old_test: or_test | old_lambdef
     """
     # Can appear on left of assignment
-    return cvt(node.children[0], ctx)
+    return (yield node.children[0], ctx)
 
 
-def cvt_testlist(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_testlist(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """testlist: test (',' test)* [',']"""
     assert ctx.name_ctx is NameCtx.REF, [node]
-    return cvt_children_skip_commas_tuple(node, ctx)
+    return (yield from cvt_children_skip_commas_tuple(node, ctx))
 
 
 def cvt_testlist1(
-        node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:  # pragma: no cover
+        node: pytree.Base, ctx: Ctx) -> _CvtGenerator:  # pragma: no cover
     """testlist1: test (',' test)*
 
     Python2 only, so there are no test cases
     """
     assert ctx.name_ctx is NameCtx.REF, [node]
-    return ast_cooked.ExprListNode(items=cvt_children_skip_commas(node, ctx))
+    return ast_cooked.ExprListNode(items=_prune_items(
+        (yield from cvt_children_skip_commas_gen(node, ctx)), ctx))
 
 
-def cvt_testlist_gexp(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_testlist_gexp(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """testlist_gexp: (test|star_expr) ( comp_for | (',' (test|star_expr))* [','] )"""
     # Can appear on left of assignment
     # Similar to cvt_listmaker
     if len(node.children) > 1 and node.children[1].type == syms.comp_for:
         assert len(node.children) == 2
+        value_expr = yield node.children[0], ctx
         return ast_cooked.DictGenListSetMakerCompForNode(
-            value_expr=cvt(node.children[0], ctx),
-            comp_for=xcast(ast_cooked.CompForNode, cvt(node.children[1], ctx)))
-    return cvt_children_skip_commas_tuple(node, ctx)
+            value_expr=value_expr,
+            comp_for=xcast(ast_cooked.CompForNode,
+                           (yield node.children[1], ctx)))
+    return (yield from cvt_children_skip_commas_tuple(node, ctx))
 
 
-def cvt_testlist_safe(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_testlist_safe(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """testlist_safe: old_test [(',' old_test)+ [',']]"""
     assert ctx.name_ctx is NameCtx.REF, [node]
-    return cvt_children_skip_commas_tuple(node, ctx)
+    return (yield from cvt_children_skip_commas_tuple(node, ctx))
 
 
-def cvt_testlist_star_expr(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_testlist_star_expr(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """testlist_star_expr: (test|star_expr) (',' (test|star_expr))* [',']"""
     # Can appear on left of assignment, e.g.:
     #   x, *middle, y = (1, 2, 3, 4, 5)
     # or in some cases on the RHS:
     #   [x, *middle, y]
-    return cvt_children_skip_commas_tuple(node, ctx)
+    return (yield from cvt_children_skip_commas_tuple(node, ctx))
 
 
 def cvt_tfpdef(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
@@ -1121,18 +1187,20 @@ def cvt_tname(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return ast_cooked.TnameNode(name=name, type_expr=type_expr)
 
 
-def cvt_trailer(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_trailer(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """trailer: '(' [arglist] ')' | '[' subscriptlist ']' | '.' NAME"""
     # Can appear on left of assignment - cvt_power will set ctx.left_binds appropriately
     if node.children[0].type == token.LPAR:
         if node.children[1].type == token.RPAR:
             return ast_cooked.RawArgListNode(args=[])
         else:
-            return xcast(ast_cooked.RawArgListNode,
-                         cvt_name_ctx(NameCtx.REF, node.children[1], ctx))
+            arglist = yield node.children[1], dataclasses.replace(
+                ctx, name_ctx=NameCtx.REF)
+            return xcast(ast_cooked.RawArgListNode, arglist)
     if node.children[0].type == token.LSQB:
-        return xcast(ast_cooked.RawSubscriptListNode,
-                     cvt_name_ctx(NameCtx.REF, node.children[1], ctx))
+        subscripts = yield node.children[1], dataclasses.replace(
+            ctx, name_ctx=NameCtx.REF)
+        return xcast(ast_cooked.RawSubscriptListNode, subscripts)
     assert node.children[0].type == token.DOT
     return ast_cooked.DotNameTrailerNode(
         binds=ctx.name_ctx is NameCtx.BINDING,
@@ -1238,23 +1306,23 @@ def cvt_with_var(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     return cvt(node.children[1], ctx)
 
 
-def cvt_yield_arg(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_yield_arg(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """yield_arg: 'from' test | testlist"""
     # TODO: test case
     assert ctx.name_ctx is NameCtx.REF, [node]
     # ignore FROM
     if len(node.children) == 2:
-        return cvt(node.children[1], ctx)
-    return cvt(node.children[0], ctx)
+        return (yield node.children[1], ctx)
+    return (yield node.children[0], ctx)
 
 
-def cvt_yield_expr(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_yield_expr(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """yield_expr: 'yield' [yield_arg]"""
     # TODO: test case
     assert ctx.name_ctx is NameCtx.REF, [node]
     # Don't care that it's YIELD; just want the expr
     if len(node.children) > 1:
-        return ast_cooked.YieldNode(items=[cvt(node.children[1], ctx)])
+        return ast_cooked.YieldNode(items=[(yield node.children[1], ctx)])
     return ast_cooked.YieldNode(items=[])
 
 
@@ -1292,24 +1360,26 @@ def cvt_token_number(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
 def cvt_token_string(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
     """Handle token.NAME."""
     assert ctx.name_ctx is NameCtx.REF, [node]
+    if 'strings' in ctx.prune:
+        return ast_cooked.StringNode(astns=[])
     astns = node if isinstance(node, list) else [node]
     typing_debug.assert_all_isinstance(pytree.Leaf, astns)  # TODO: remove
     return ast_cooked.StringNode(
         astns=[ctx.src_file.astn_to_range(astn) for astn in astns])
 
 
-def cvt_unary_op(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
+def cvt_unary_op(node: pytree.Base, ctx: Ctx) -> _CvtGenerator:
     """Handles the following rules (as modified by _convert()):
        factor: ('+'|'-'|'~') factor | power
        not_test: 'not' not_test | comparison
     """
     if len(node.children) == 1:
         # Can appear on left of assignment if it's a single item
-        return cvt(node.children[0], ctx)
+        return (yield node.children[0], ctx)
     assert ctx.name_ctx is NameCtx.REF, [node]
+    op_astns = [ctx.src_file.astn_to_range(node.children[0])]
     return ast_cooked.OpNode(
-        op_astns=[ctx.src_file.astn_to_range(node.children[0])],
-        args=[cvt(node.children[1], ctx)])
+        op_astns=op_astns, args=[(yield node.children[1], ctx)])
 
 
 # The following dispatch table is derived from
@@ -1318,8 +1388,17 @@ def cvt_unary_op(node: pytree.Base, ctx: Ctx) -> ast_cooked.Base:
 # productions have "test" or similar, which is expected to collapse to
 # a name.
 
+# Explanation for the following: https://github.com/python/mypy/issues/4530
+if typing.TYPE_CHECKING:
+    _DISPATCH_TYPE = Dict[
+        int, Callable[[Arg(pytree.Base, 'node'), Arg(Ctx, 'ctx')],
+                      Union[ast_cooked.Base, _CvtGenerator], ]]
+else:
+    _DISPATCH_TYPE = Dict[int, Callable[[pytree.Base, Ctx],
+                                        Union[ast_cooked.Base, _CvtGenerator]]]
+
 # pylint: disable=no-member
-_DISPATCH = {
+_DISPATCH = {  # type: _DISPATCH_TYPE
     token.NAME: cvt_token_name,
     token.NUMBER: cvt_token_number,
     token.STRING: cvt_token_string,
@@ -1422,7 +1501,6 @@ _DISPATCH = {
 
 SYMS_ANNASSIGN = syms.annassign
 SYMS_AUGASSIGN = syms.augassign
-SYMS_FACTOR = syms.factor
 SYMS_SIMPLE_STMT = syms.simple_stmt
 SYMS_SLICEOP = syms.sliceop
 SYMS_SMALL_STMT = syms.small_stmt
@@ -1437,16 +1515,96 @@ SYMS_TNAMES = frozenset([syms.tfpdef, syms.vfpdef, syms.tname, syms.vname])
 
 # pylint: disable=dangerous-default-value,invalid-name
 
-# Explanation for the following: https://github.com/python/mypy/issues/4530
-_DISPATCH_TYPE = Dict[
-    int, Callable[[Arg(pytree.Base, 'node'
-                      ), Arg(Ctx, 'ctx')], ast_cooked.Base, ]]
+# Nodes that cvt_XXX converts by converting their child, if they have
+# only one child (these aren't removed by _convert; see _EXPR_NODES).
+# cvt skips them, to avoid the overhead of a generator for each one.
+# pylint: disable=no-member
+_PASS_THROUGH_NODES = frozenset([
+    syms.argument, syms.expr, syms.exprlist, syms.test, syms.testlist_gexp,
+    syms.testlist_star_expr])
+
+# pylint: enable=no-member
 
 
 def cvt(node: pytree.Base, ctx: Ctx,
         _DISPATCH: _DISPATCH_TYPE = _DISPATCH) -> ast_cooked.Base:
-    """Call the appropriate cvt_XXX for node."""
-    return _DISPATCH[node.type](node, ctx)
+    """Call the appropriate cvt_XXX for node.
+
+    If the cvt_XXX is a generator (see _CvtGenerator), this runs it
+    and the generators for its children using an explicit stack,
+    instead of recursively calling cvt().
+
+    An exception is raised as ast_cooked.NodeError, with the innermost
+    node that was being converted.
+    """
+    while node.type in _PASS_THROUGH_NODES and len(node.children) == 1:
+        node = node.children[0]
+    try:
+        result = _DISPATCH[node.type](node, ctx)
+        if isinstance(result, ast_cooked.Base):
+            return result
+        return _cvt_generators(result, node, _DISPATCH)
+    except ast_cooked.NodeError:
+        raise
+    except Exception as exc:
+        raise ast_cooked.NodeError.wrap(exc, _node_description(node)) from exc
+
+
+def _cvt_generators(generator: _CvtGenerator, node: pytree.Base,
+                    _DISPATCH: _DISPATCH_TYPE) -> ast_cooked.Base:
+    """Run a cvt_XXX generator, with a stack of its children's generators.
+
+    A generator is started with next() (result is None) and is then
+    sent the result for each child that it yields. `node` is the
+    generator's node; an exception is raised as ast_cooked.NodeError
+    with the node whose generator or cvt_XXX raised it.
+    """
+    stack = [generator]
+    nodes = [node]
+    result = None  # type: Optional[ast_cooked.Base]
+    try:
+        while stack:
+            try:
+                if result is None:
+                    child, child_ctx = next(stack[-1])
+                else:
+                    child, child_ctx = stack[-1].send(result)
+            except StopIteration as stop:
+                stack.pop()
+                nodes.pop()
+                result = stop.value
+                continue
+            while (child.type in _PASS_THROUGH_NODES and
+                   len(child.children) == 1):
+                child = child.children[0]
+            nodes.append(child)
+            child_result = _DISPATCH[child.type](child, child_ctx)
+            if isinstance(child_result, ast_cooked.Base):
+                nodes.pop()
+                result = child_result
+            else:
+                stack.append(child_result)
+                result = None
+    except ast_cooked.NodeError:
+        raise
+    except Exception as exc:
+        raise ast_cooked.NodeError.wrap(
+            exc, _node_description(nodes[-1])) from exc
+    return typing.cast(ast_cooked.Base, result)
+
+
+def _node_description(node: pytree.Base) -> Text:
+    """Describe a node for a NodeError, without its subtree.
+
+    e.g., "NUMBER '42' line 1" or "power line 3" (see
+    ast_cooked.NodeError.wrap).
+    """
+    if isinstance(node, pytree.Leaf):
+        return '{} {} line {}'.format(
+            token.tok_name.get(node.type, node.type),
+            reprlib.repr(node.value), node.lineno)
+    return '{} line {}'.format(
+        pytree.type_repr(node.type), node.get_lineno())
 
 
 def cvt_debug(node: pytree.Base,
@@ -1458,6 +1616,8 @@ def cvt_debug(node: pytree.Base,
     cvt_func = _DISPATCH[node.type]
     try:
         result = cvt_func(node, ctx)
+        if isinstance(result, types.GeneratorType):
+            result = _cvt_generators(result, node, _DISPATCH)
     except Exception as exc:
         raise Exception(
             '%s calling=%s node=%r' % (exc, cvt_func, node)) from exc
@@ -1481,10 +1641,21 @@ def cvt_children_skip_commas(
     return [cvt(ch, ctx) for ch in node.children if ch.type != token.COMMA]
 
 
+def cvt_children_skip_commas_gen(
+        node: pytree.Base,  # pytree.Node
+        ctx: Ctx) -> Generator[Tuple[pytree.Base, Ctx], ast_cooked.Base, List[
+            ast_cooked.Base]]:
+    """Like cvt_children_skip_commas, for a cvt_XXX generator (use `yield from`)."""
+    result = []
+    for ch in node.children:
+        if ch.type != token.COMMA:
+            result.append((yield ch, ctx))
+    return result
+
+
 def cvt_children_skip_commas_tuple(
         node: pytree.Base,  # pytree.Node
-        ctx: Ctx,
-        _DISPATCH: _DISPATCH_TYPE = _DISPATCH) -> ast_cooked.Base:
+        ctx: Ctx) -> _CvtGenerator:
     """Like cvt_children_skip_commas, but special case for singleton without comma.
 
     If node.children is a single item, then just return the result of running `cvt` on it;
@@ -1492,9 +1663,9 @@ def cvt_children_skip_commas_tuple(
     node.children. This covers the special case of a trailing comma (e.g., `x, = [1]`).
     """
     if len(node.children) == 1:
-        return cvt(node.children[0], ctx)
-    return ast_cooked.ExprListNode(
-        items=[cvt(ch, ctx) for ch in node.children if ch.type != token.COMMA])
+        return (yield node.children[0], ctx)
+    return ast_cooked.ExprListNode(items=_prune_items(
+        (yield from cvt_children_skip_commas_gen(node, ctx)), ctx))
 
 
 def cvt_name_ctx(name_ctx: NameCtx,
@@ -1508,6 +1679,48 @@ def cvt_name_ctx(name_ctx: NameCtx,
 # pylint: enable=dangerous-default-value,invalid-name
 
 
+def _prune_items(items: List[ast_cooked.Base],
+                 ctx: Ctx) -> List[ast_cooked.Base]:
+    """Get a container's items, pruned if requested (see PRUNE_KINDS)."""
+    if 'containers' in ctx.prune and all(
+            _has_no_names(item, ctx) for item in items):
+        return []
+    return items
+
+
+def _has_no_names(node: ast_cooked.Base, ctx: Ctx) -> bool:
+    """Check whether a node is made only from literals (has no names).
+
+    If containers are pruned, a container without names has already
+    had its items removed, so a container with items has names. (This
+    avoids rescanning nested containers.)
+    """
+    containers_pruned = 'containers' in ctx.prune
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node_type = node.__class__
+        if node_type in _LITERAL_NODES:
+            continue
+        if node_type is ast_cooked.OpNode:
+            stack.extend(xcast(ast_cooked.OpNode, node).args)
+        elif node_type in _CONTAINER_NODES and not (
+                containers_pruned and
+                xcast(ast_cooked.ListBase, node).items):
+            stack.extend(xcast(ast_cooked.ListBase, node).items)
+        else:
+            return False
+    return True
+
+
+_LITERAL_NODES = frozenset(
+    [ast_cooked.NumberNode, ast_cooked.StringNode, ast_cooked.EllipsisNode])
+
+_CONTAINER_NODES = frozenset([
+    ast_cooked.ListMakerNode, ast_cooked.DictSetMakerNode,
+    ast_cooked.ExprListNode])
+
+
 def parse(src_bytes: bytes, python_version: int) -> pytree.Base:
     """Parse a byte string."""
     # See lib2to3.refactor.RefactoringTool._read_python_source
@@ -1515,45 +1728,89 @@ def parse(src_bytes: bytes, python_version: int) -> pytree.Base:
     # TODO: (non-ascii testcase) 網目錦蛇=1
     with io.BytesIO(src_bytes) as src_f:
         encoding, _ = tokenize.detect_encoding(src_f.readline)  # type: ignore
-    src_str = codecs.decode(src_bytes, encoding)
-    lib2to3_logger = logging.getLogger('pykythe')
-    grammar = pygram.python_grammar
-    if python_version == 3:
-        # TODO: why doesn't lib2to3.pygram do this for "exec"?
-        del grammar.keywords["print"]
-        del grammar.keywords["exec"]
-    parser_driver = driver.Driver(
-        grammar, convert=_convert, logger=lib2to3_logger)
+    return parse_str(codecs.decode(src_bytes, encoding), python_version)
+
+
+def parse_str(src_str: Text, python_version: int,
+              first_lineno: int = 1) -> pytree.Base:
+    """Parse a (decoded) string.
+
+    If `first_lineno` isn't 1, `src_str` is a sequence of whole lines
+    from a file, starting at line `first_lineno`, and the resulting
+    leaves have the file's line numbers (the lines before
+    `first_lineno` are treated as empty lines).
+    """
+    if '\r' in src_str:
+        # lib2to3 handles '\r\n' but not a lone '\r' (old Mac style);
+        # changing it to '\n' doesn't change any offsets.
+        src_str = _LONE_CR_RE.sub('\n', src_str)
     if not src_str.endswith('\n'):  # pragma: no cover
         src_str += '\n'  # work around bug in lib2to3
-    return parser_driver.parse_string(src_str)
+    # tokenizer.generate_tokens gives the same tokens as lib2to3's
+    # tokenizer (which parser_driver.parse_string uses), but faster.
+    return _parser_driver(python_version).parse_tokens(
+        tokenizer.generate_tokens(src_str, first_lineno))
+
+
+def _parser_driver(python_version: int) -> driver.Driver:
+    """Get the lib2to3 driver for a Python version (created once).
+
+    Each Python version gets its own copy of lib2to3's grammar, which
+    isn't modified after the driver is created; the driver creates a
+    new parser for each parse, so it can be shared by multiple parses
+    and multiple threads.
+    """
+    try:
+        return _PARSER_DRIVERS[python_version]
+    except KeyError:
+        pass
+    with _PARSER_DRIVERS_LOCK:
+        if python_version not in _PARSER_DRIVERS:
+            grammar = pygram.python_grammar.copy()
+            if python_version == 3:
+                # TODO: why doesn't lib2to3.pygram do this for "exec"?
+                del grammar.keywords["print"]
+                del grammar.keywords["exec"]
+            _PARSER_DRIVERS[python_version] = driver.Driver(
+                grammar,
+                convert=_convert,
+                logger=logging.getLogger('pykythe'))
+        return _PARSER_DRIVERS[python_version]
+
+
+_PARSER_DRIVERS = {}  # type: Dict[int, driver.Driver]
+_PARSER_DRIVERS_LOCK = threading.Lock()
+
+_LONE_CR_RE = re.compile(r'\r(?!\n)')
 
 
 # Node types that get removed if there's only one child. This does not
 # include expr, test, yield_expr and a few others ... the intent is to
 # reduce the number of AST nodes without increasing the complexity of
-# analyzing the AST.
+# analyzing the AST. With these, a simple name in an expression is
+# test -> expr -> NAME, instead of a chain of 14 nodes. The cvt_XXX
+# functions therefore mustn't depend on the type of a child that could
+# be one of these (e.g., the `factor` in `power`).
 # pylint: disable=no-member
 _EXPR_NODES = typing.cast(
     FrozenSet[int],
     frozenset([
-        # TODO: uncomment (for performance) -- needs more test cases first:
-        # syms.and_expr,
-        # syms.and_test,
-        # syms.arith_expr,
-        # # syms.atom,  # TODO: reinstate?
-        # syms.comparison,
-        # syms.factor,
-        # syms.not_test,
-        # syms.old_test,
-        # syms.or_test,
-        # # syms.power,  # TODO: reinstate?
-        # syms.shift_expr,
-        # # syms.star_expr,   # Always '*' expr; also needed for call arg
-        # syms.term,
-        # syms.xor_expr,
-        # syms.comp_iter,  # Not an expr, but also not needed
-        # syms.compound_stmt,  # Not an expr, but also not needed
+        syms.and_expr,
+        syms.and_test,
+        syms.arith_expr,
+        syms.atom,  # Only NAME, NUMBER, STRING (see cvt_atom)
+        syms.comparison,
+        syms.factor,
+        syms.not_test,
+        syms.old_test,
+        syms.or_test,
+        syms.power,
+        syms.shift_expr,
+        # syms.star_expr,   # Always '*' expr; also needed for call arg
+        syms.term,
+        syms.xor_expr,
+        syms.comp_iter,  # Not an expr, but also not needed
+        syms.compound_stmt,  # Not an expr, but also not needed
     ]))
 
 # pylint: enable=no-member
@@ -0,0 +1,240 @@
+% -*- mode: Prolog -*-
+
+:- module(fqn_expr_json, [read_fqn_expr_json/2]).
+
+%% Reader for the JSON items in the fqn_expr output of pykythe (see
+%% pod.PlainOldDataExtended.write_json and read_nodes/4 in
+%% pykythe.pl), which produces the simplified terms that pykythe.pl
+%% processes, in a single pass over the input:
+%%     {"kind": "str", "value": V}             str(V)
+%%     {"kind": "int", "value": V}             int(V)
+%%     {"kind": "bool", "value": V}            bool(V)  (V is "True" or "False")
+%%     {"kind": "None"}                        none
+%%     {"kind": "dict", "items": {K: V, ...}}  dict{K: V2, ...}
+%%     {"kind": Kind, "slots": {K: V, ...}}    Kind{K: V2, ...}
+%%     [V, ...]                                [V2, ...]
+%% where V2 is the simplified V. JSON strings are Prolog strings; dict
+%% keys and tags are atoms. A "kind" must be the first key of its
+%% object, as pod.py writes it.
+%%
+%% This replaces json_read_dict/2 followed by a walk over the result
+%% to set the dicts' tags and another walk to simplify it: there are
+%% no intermediate dicts, and it doesn't change any Prolog flags
+%% (json_read_dict/2 needs the "autoload" flag, which pykythe.pl
+%% turns off), so it can be used by multiple threads.
+
+:- use_module(library(error), [syntax_error/1]).
+
+%! read_fqn_expr_json(+Stream, -Term) is det.
+%% Read a JSON value from Stream, skipping any leading white space,
+%% and simplify it (see above). Nothing after the value is read (in
+%% particular, not the newline that follows each fqn_expr item).
+read_fqn_expr_json(Stream, Term) :-
+    get_code(Stream, C0),
+    skip_ws(Stream, C0, C),
+    value(C, Stream, Term).
+
+%! value(+C:code, +Stream, -Term) is det.
+%% Read a value, whose first character C has already been read.
+value(0'{, Stream, Term) :- !,
+    get_code(Stream, C0),
+    skip_ws(Stream, C0, C),
+    (  C == 0'}
+    -> Pairs = []
+    ;  members(C, Stream, Pairs)
+    ),
+    object_term(Pairs, Term).
+value(0'[, Stream, Term) :- !,
+    get_code(Stream, C0),
+    skip_ws(Stream, C0, C),
+    (  C == 0']
+    -> Term = []
+    ;  elements(C, Stream, Term)
+    ).
+value(0'", Stream, Term) :- !,
+    json_string_codes(Stream, Codes),
+    string_codes(Term, Codes).
+value(C, Stream, Term) :-
+    number_code(C), !,
+    json_number_codes(Stream, Codes),
+    number_codes(Term, [C|Codes]).
+value(0't, Stream, true) :- !,
+    literal(`rue`, Stream).
+value(0'f, Stream, false) :- !,
+    literal(`alse`, Stream).
+value(0'n, Stream, null) :- !,
+    literal(`ull`, Stream).
+value(C, _Stream, _Term) :-
+    syntax_error(fqn_expr_json_unexpected_char(C)).
+
+%! members(+C:code, +Stream, -Pairs:list(pair)) is det.
+%% Read the "key": value members of an object up to the closing '}',
+%% starting with C (the first character of the first key).
+members(C0, Stream, [Key-Value|Pairs]) :-
+    expect(0'", C0),
+    json_string_codes(Stream, KeyCodes),
+    atom_codes(Key, KeyCodes),
+    get_code(Stream, C1),
+    skip_ws(Stream, C1, C2),
+    expect(0':, C2),
+    get_code(Stream, C3),
+    skip_ws(Stream, C3, C4),
+    value(C4, Stream, Value),
+    get_code(Stream, C5),
+    skip_ws(Stream, C5, C6),
+    (  C6 == 0',
+    -> get_code(Stream, C7),
+       skip_ws(Stream, C7, C8),
+       members(C8, Stream, Pairs)
+    ;  expect(0'}, C6),
+       Pairs = []
+    ).
+
+%! elements(+C:code, +Stream, -Values:list) is det.
+%% Read the values of a list up to the closing ']', starting with C
+%% (the first character of the first value).
+elements(C0, Stream, [Value|Values]) :-
+    value(C0, Stream, Value),
+    get_code(Stream, C1),
+    skip_ws(Stream, C1, C2),
+    (  C2 == 0',
+    -> get_code(Stream, C3),
+       skip_ws(Stream, C3, C4),
+       elements(C4, Stream, Values)
+    ;  expect(0'], C2),
+       Values = []
+    ).
+
+%! object_term(+Pairs:list(pair), -Term) is det.
+%% Simplify an object (see the table at the top). An object without
+%% a "kind" (the "slots" or "items" of another object) is left as
+%% pairs(Pairs), for its containing object.  The check for a string
+%% distinguishes "kind" from a slot or item that happens to be called
+%% "kind" (whose value has already been simplified).
+object_term([kind-Kind|Pairs], Term) :-
+    string(Kind), !,
+    kind_term(Kind, Pairs, Term).
+object_term(Pairs, pairs(Pairs)).
+
+%! kind_term(+Kind:string, +Pairs:list(pair), -Term) is det.
+kind_term("str", [value-Value], str(Value)) :- !.
+kind_term("int", [value-Value], int(Value)) :- !.
+kind_term("bool", [value-Value], bool(Value)) :- !.
+kind_term("None", [], none) :- !.
+kind_term("dict", [items-pairs(Items)], Term) :- !,
+    dict_pairs(Term, dict, Items).
+kind_term(Kind, [slots-pairs(Slots)], Term) :- !,
+    atom_string(Tag, Kind),
+    dict_pairs(Term, Tag, Slots).
+kind_term(Kind, Pairs, _Term) :-
+    syntax_error(fqn_expr_json_kind(Kind, Pairs)).
+
+%! json_string_codes(+Stream, -Codes:list(code)) is det.
+%% Read the rest of a string (after the opening '"') and its closing '"'.
+json_string_codes(Stream, Codes) :-
+    get_code(Stream, C),
+    json_string_codes(C, Stream, Codes).
+
+%! json_string_codes(+C:code, +Stream, -Codes:list(code)) is det.
+json_string_codes(0'", _Stream, Codes) :- !,
+    Codes = [].
+json_string_codes(0'\\, Stream, [C|Codes]) :- !,
+    get_code(Stream, Escape),
+    escape(Escape, Stream, C),
+    json_string_codes(Stream, Codes).
+json_string_codes(-1, _Stream, _Codes) :- !,
+    syntax_error(fqn_expr_json_eof_in_string).
+json_string_codes(C, Stream, [C|Codes]) :-
+    json_string_codes(Stream, Codes).
+
+%! escape(+Escape:code, +Stream, -C:code) is det.
+%% The character for the escape sequence "\" Escape ... (for "\u",
+%% the hex digits are read from Stream).
+escape(0'", _, 0'") :- !.
+escape(0'\\, _, 0'\\) :- !.
+escape(0'/, _, 0'/) :- !.
+escape(0'b, _, 0'\b) :- !.
+escape(0'f, _, 0'\f) :- !.
+escape(0'n, _, 0'\n) :- !.
+escape(0'r, _, 0'\r) :- !.
+escape(0't, _, 0'\t) :- !.
+escape(0'u, Stream, C) :- !,
+    hex4(Stream, C0),
+    (  C0 >= 0xD800, C0 =< 0xDBFF
+    -> %% A surrogate pair (as written by Python's json module for
+       %% characters outside the Basic Multilingual Plane).
+       get_code(Stream, Backslash),
+       expect(0'\\, Backslash),
+       get_code(Stream, U),
+       expect(0'u, U),
+       hex4(Stream, C1),
+       C is 0x10000 + ((C0 - 0xD800) << 10) + (C1 - 0xDC00)
+    ;  C = C0
+    ).
+escape(Escape, _, _) :-
+    syntax_error(fqn_expr_json_escape(Escape)).
+
+%! hex4(+Stream, -Value:integer) is det.
+%% Read 4 hex digits.
+hex4(Stream, Value) :-
+    hex_digit(Stream, D1),
+    hex_digit(Stream, D2),
+    hex_digit(Stream, D3),
+    hex_digit(Stream, D4),
+    Value is D1*0x1000 + D2*0x100 + D3*0x10 + D4.
+
+hex_digit(Stream, Digit) :-
+    get_code(Stream, C),
+    (  code_type(C, xdigit(Digit))
+    -> true
+    ;  syntax_error(fqn_expr_json_hex_digit(C))
+    ).
+
+%! json_number_codes(+Stream, -Codes:list(code)) is det.
+%% Read the rest of a number (without reading the character after it).
+json_number_codes(Stream, Codes) :-
+    peek_code(Stream, C),
+    (  number_code(C)
+    -> get_code(Stream, C),
+       Codes = [C|Codes1],
+       json_number_codes(Stream, Codes1)
+    ;  Codes = []
+    ).
+
+%! number_code(+C:code) is semidet.
+%% C can be part of a JSON number.
+number_code(C) :-
+    (  between(0'0, 0'9, C)
+    -> true
+    ;  memberchk(C, `-+.eE`)
+    ).
+
+%! literal(+Codes:list(code), +Stream) is det.
+%% Read the rest of a literal (true, false, null).
+literal([], _Stream).
+literal([C|Cs], Stream) :-
+    get_code(Stream, C0),
+    expect(C, C0),
+    literal(Cs, Stream).
+
+%! skip_ws(+Stream, +C0:code, -C:code) is det.
+%% Skip white space, starting at C0, giving the next character C.
+skip_ws(Stream, C0, C) :-
+    (  ws(C0)
+    -> get_code(Stream, C1),
+       skip_ws(Stream, C1, C)
+    ;  C = C0
+    ).
+
+ws(0'\s).
+ws(0'\t).
+ws(0'\n).
+ws(0'\r).
+
+%! expect(+Expected:code, +C:code) is det.
+%% Check that C is the Expected character.
+expect(Expected, C) :-
+    (  C == Expected
+    -> true
+    ;  syntax_error(fqn_expr_json_expected(Expected, C))
+    ).
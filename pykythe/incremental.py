@@ -0,0 +1,330 @@
+"""Incremental reparsing of a file after edits.
+
+Reparsing a large file with lib2to3 takes seconds; for an editor that
+re-indexes a file after each edit, most of that work is wasted,
+because an edit typically changes only one top-level statement.
+
+A `Parsed` object keeps the ast_cooked nodes of each top-level
+statement (a child of `file_input`), together with the names that the
+statement binds at module level. `Parsed.edit` applies a list of
+edits to the source, re-tokenizes and re-parses only the top-level
+statements that the edits touch, reuses the ast_cooked nodes of the
+other statements (shifting the Astn offsets of the statements after
+the edit) and recomputes the module's scope bindings from the
+per-statement bindings. `Parsed.cooked_nodes` gives the same result
+as ast_raw.cvt_parse_tree on the whole edited file, so it can be
+passed to add_fqns as usual:
+
+    parsed = incremental.parse(src_file, python_version)
+    cooked_nodes = parsed.cooked_nodes()
+    ...
+    parsed = parsed.edit([incremental.Edit(start=120, end=123, text=b'foo')])
+    cooked_nodes = parsed.cooked_nodes()
+
+The lib2to3 parse tree isn't kept: it's not needed after conversion
+to ast_cooked nodes and it's much larger than them.
+"""
+
+import bisect
+import codecs
+import collections
+from dataclasses import dataclass
+import io
+from lib2to3.pgen2 import parse as pgen2_parse, tokenize
+from typing import Any, Dict, Generator, List, Sequence, Text
+
+from . import ast, ast_cooked, ast_raw, pod
+
+# pylint: disable=too-few-public-methods
+
+
+@dataclass(frozen=True)
+class Edit(pod.PlainOldData):
+    """Replace the bytes content[start:end] by `text`.
+
+    The offsets are relative to the content after all the preceding
+    edits in the same list have been applied (as with an editor's list
+    of changes).
+    """
+
+    start: int
+    end: int
+    text: bytes
+
+    __slots__ = ['start', 'end', 'text']
+
+
+@dataclass(frozen=True)
+class _Stmt(pod.PlainOldData):
+    """A top-level statement.
+
+    Attributes:
+      lineno: the line of the statement's first token. The statement
+          "owns" the lines from `lineno` up to the next statement's
+          `lineno` (the first statement also owns any lines before
+          it).
+      items: the ast_cooked nodes for the statement (a simple statement
+          with ';'s can result in more than one node).
+      scope_bindings: the names that the statement adds to the
+          module's scope_bindings, in order.
+      global_vars: the names that the statement declares as `global`
+          at module level.
+      nonlocal_vars: the names that the statement declares as
+          `nonlocal` at module level.
+    """
+
+    lineno: int
+    items: Sequence[ast_cooked.Base]
+    scope_bindings: Dict[Text, None]
+    global_vars: Dict[Text, None]
+    nonlocal_vars: Dict[Text, None]
+
+    __slots__ = [
+        'lineno', 'items', 'scope_bindings', 'global_vars', 'nonlocal_vars'
+    ]
+
+
+@dataclass(frozen=True)
+class Parsed(pod.PlainOldData):
+    """A file's ast_cooked nodes, split into top-level statements.
+
+    Attributes:
+      src_file: the source file
+      python_version: 2 or 3
+      encoding: the encoding for decoding the source (from its coding
+          declaration, as in ast_raw.parse)
+      stmts: the top-level statements, in order
+    """
+
+    src_file: ast.File
+    python_version: int
+    encoding: Text
+    stmts: Sequence[_Stmt]
+
+    __slots__ = ['src_file', 'python_version', 'encoding', 'stmts']
+
+    def cooked_nodes(self) -> ast_cooked.FileInput:
+        """Get the ast_cooked nodes for the whole file.
+
+        The result is the same as from ast_raw.cvt_parse_tree.
+        """
+        scope_bindings = collections.OrderedDict()  # type: Dict[Text, None]
+        for stmt in self.stmts:
+            for name in stmt.scope_bindings:
+                scope_bindings.setdefault(name, None)
+        return ast_cooked.FileInput(
+            path=self.src_file.path,
+            stmts=[item for stmt in self.stmts for item in stmt.items],
+            scope_bindings=scope_bindings)
+
+    def edit(self, edits: Sequence[Edit]) -> 'Parsed':
+        """Apply edits to the source, reparsing only what's needed.
+
+        Raises the same exceptions as ast_raw.parse if the edited
+        source can't be parsed.
+        """
+        parsed = self
+        for edit in edits:
+            parsed = parsed._edit(edit)  # pylint: disable=protected-access
+        return parsed
+
+    def _edit(self, edit: Edit) -> 'Parsed':
+        """Apply a single edit."""
+        old_file = self.src_file
+        old_content = old_file.content
+        if not 0 <= edit.start <= edit.end <= len(old_content):
+            raise ValueError('Edit %r out of range for %r (%d bytes)' %
+                             (edit, old_file.path, len(old_content)))
+        content = (
+            old_content[:edit.start] + edit.text + old_content[edit.end:])
+        src_file = ast.make_file(
+            path=old_file.path, content=content, encoding=old_file.encoding)
+        if (not self.stmts or
+                edit.start < old_file.line_offsets[min(3, old_file.numlines +
+                                                       2)]):
+            # The first two lines can have a coding declaration, which
+            # affects the whole file.
+            return parse(src_file, self.python_version)
+        # The statements in self.stmts[first:last] are replaced by
+        # reparsing their (edited) lines. The preceding statement is
+        # included because the edit can make a line part of it (e.g.,
+        # by indenting the line).
+        starts = [old_file.line_offsets[stmt.lineno] for stmt in self.stmts]
+        starts[0] = 0
+        first = max(0, bisect.bisect_right(starts, edit.start) - 2)
+        last = bisect.bisect_right(starts, edit.end)
+        byte_delta = len(edit.text) - (edit.end - edit.start)
+        line_delta = src_file.numlines - old_file.numlines
+        first_lineno = 1 if first == 0 else self.stmts[first].lineno
+        region_start = old_file.line_offsets[first_lineno]
+        while True:
+            if last < len(self.stmts):
+                region_end = starts[last] + byte_delta
+            else:
+                region_end = len(content)
+            try:
+                new_stmts = _parse_region(src_file, self.python_version,
+                                          self.encoding, first_lineno,
+                                          region_start, region_end,
+                                          self.stmts[:first])
+                break
+            except (pgen2_parse.ParseError, tokenize.TokenError,
+                    IndentationError):
+                if last >= len(self.stmts):
+                    # Let a full parse produce the error (or a result,
+                    # if the error is an artifact of splitting the file).
+                    return parse(src_file, self.python_version)
+                # The edit might have, e.g., opened a bracket that
+                # continues into the next statement.
+                last += 1
+        if (_declared_vars(new_stmts) !=
+                _declared_vars(self.stmts[first:last])):
+            # A module-level `global` or `nonlocal` changed, which can
+            # change the bindings of any following statement.
+            return parse(src_file, self.python_version)
+        return Parsed(
+            src_file=src_file,
+            python_version=self.python_version,
+            encoding=self.encoding,
+            stmts=(list(self.stmts[:first]) + new_stmts + [
+                _shift_stmt(stmt, line_delta, byte_delta)
+                for stmt in self.stmts[last:]
+            ]))
+
+
+def parse(src_file: ast.File, python_version: int) -> Parsed:
+    """Parse a whole file, keeping the information for `Parsed.edit`."""
+    with io.BytesIO(src_file.content) as src_f:
+        encoding, _ = tokenize.detect_encoding(src_f.readline)  # type: ignore
+    return Parsed(
+        src_file=src_file,
+        python_version=python_version,
+        encoding=encoding,
+        stmts=_parse_region(src_file, python_version, encoding, 1, 0,
+                            len(src_file.content), []))
+
+
+def _parse_region(src_file: ast.File, python_version: int, encoding: Text,
+                  first_lineno: int, region_start: int, region_end: int,
+                  preceding_stmts: Sequence[_Stmt]) -> List[_Stmt]:
+    """Parse and convert the top-level statements in a range of lines.
+
+    The region content[region_start:region_end] must consist of whole
+    lines, starting at line `first_lineno`.
+    """
+    region_str = codecs.decode(
+        src_file.content[region_start:region_end], encoding)
+    parse_tree = ast_raw.parse_str(region_str, python_version, first_lineno)
+    global_vars, nonlocal_vars = _declared_vars(preceding_stmts)
+    stmts = []  # type: List[_Stmt]
+    for node in parse_tree.children:
+        if node.type != ast_raw.SYMS_STMT:
+            continue
+        ctx = ast_raw.Ctx(
+            name_ctx=ast_raw.NameCtx.REF,
+            scope_bindings=collections.OrderedDict(),
+            global_vars=collections.OrderedDict(global_vars),
+            nonlocal_vars=collections.OrderedDict(nonlocal_vars),
+            python_version=python_version,
+            src_file=src_file,
+            prune=frozenset())
+        cooked_stmt = ast_raw.cvt(node, ctx)
+        stmts.append(
+            _Stmt(
+                lineno=node.get_lineno(),
+                items=ast_cooked.make_stmts([cooked_stmt]).items,
+                scope_bindings=ctx.scope_bindings,
+                global_vars=collections.OrderedDict(
+                    (name, None)
+                    for name in ctx.global_vars
+                    if name not in global_vars),
+                nonlocal_vars=collections.OrderedDict(
+                    (name, None)
+                    for name in ctx.nonlocal_vars
+                    if name not in nonlocal_vars)))
+        global_vars.update(stmts[-1].global_vars)
+        nonlocal_vars.update(stmts[-1].nonlocal_vars)
+    return stmts
+
+
+def _declared_vars(stmts: Sequence[_Stmt]) -> Any:
+    """Get the module-level global and nonlocal names from statements."""
+    global_vars = collections.OrderedDict()  # type: Dict[Text, None]
+    nonlocal_vars = collections.OrderedDict()  # type: Dict[Text, None]
+    for stmt in stmts:
+        global_vars.update(stmt.global_vars)
+        nonlocal_vars.update(stmt.nonlocal_vars)
+    return global_vars, nonlocal_vars
+
+
+def _shift_stmt(stmt: _Stmt, line_delta: int, byte_delta: int) -> _Stmt:
+    """Move a statement by line_delta lines and byte_delta bytes."""
+    if not line_delta and not byte_delta:
+        return stmt
+    return _Stmt(
+        lineno=stmt.lineno + line_delta,
+        items=[_shift(item, byte_delta) for item in stmt.items],
+        scope_bindings=stmt.scope_bindings,
+        global_vars=stmt.global_vars,
+        nonlocal_vars=stmt.nonlocal_vars)
+
+
+def _shift(value: Any, byte_delta: int) -> Any:
+    """Add byte_delta to all the Astn offsets in a tree of nodes.
+
+    As with ast_cooked.Base.add_fqns, subtrees without any Astns are
+    reused. The tree can be very deep, so this uses an explicit stack
+    of _shift_children generators instead of recursion (as
+    ast_cooked.Base._add_fqns_stack does).
+    """
+    stack = [_shift_children(value, byte_delta)]
+    result = None  # type: Any
+    while stack:
+        try:
+            child = stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            result = stop.value
+        else:
+            stack.append(_shift_children(child, byte_delta))
+            result = None
+    return result
+
+
+def _shift_children(value: Any,
+                    byte_delta: int) -> Generator[Any, Any, Any]:
+    """Shift one list or node, for _shift.
+
+    Each child list or node is yielded and its shifted value is sent
+    back (Astns are shifted here); the generator's value is the
+    shifted list or node.
+    """
+    # pylint: disable=unidiomatic-typecheck,protected-access
+    if type(value) is list:
+        items = value
+    elif isinstance(value, ast_cooked.Base):
+        items = [getattr(value, attr) for attr in value._all_slots]
+    elif type(value) is ast.Astn:
+        return _shift_astn(value, byte_delta)
+    else:
+        return value
+    shifted_items = []  # type: List[Any]
+    for item in items:
+        if type(item) is ast.Astn:
+            shifted_items.append(_shift_astn(item, byte_delta))
+        elif type(item) is list or isinstance(item, ast_cooked.Base):
+            shifted_items.append((yield item))
+        else:
+            shifted_items.append(item)
+    if all(item is orig for item, orig in zip(shifted_items, items)):
+        return value
+    if type(value) is list:
+        return shifted_items
+    return type(value)(**dict(zip(value._all_slots, shifted_items)))
+
+
+def _shift_astn(astn: ast.Astn, byte_delta: int) -> ast.Astn:
+    return ast.Astn(
+        value=astn.value,
+        start=astn.start + byte_delta,
+        end=astn.end + byte_delta)
@@ -0,0 +1,185 @@
+% -*- mode: Prolog -*-
+
+:- module(kythe_entries, [write_kythe_entry/2, read_kythe_entry/2]).
+
+%% Writer and reader for Kythe entries in the "delimited" stream format
+%% (the default format of Kythe's entrystream, write_entries and
+%% verifier): each kythe.proto.storage.Entry message is preceded by its
+%% length as a varint. There are only two messages, whose fields are
+%% all length-delimited (wire type 2), so they're encoded here by hand,
+%% without protoc or library(protobufs):
+%%     message VName {string signature = 1; string corpus = 2;
+%%                    string root = 3; string path = 4;
+%%                    string language = 5;}
+%%     message Entry {VName source = 1; string edge_kind = 2;
+%%                    VName target = 3; string fact_name = 4;
+%%                    bytes fact_value = 5;}
+%% As in proto3, empty fields aren't written.
+%%
+%% An entry is a dict with the same keys as the fields (the same dict
+%% that pykythe.pl writes as JSON, with json_write_dict/3). A string
+%% field's value can be an atom, string or number (it's written as
+%% UTF-8). The fact_value is either text (also written as UTF-8) or
+%% base64(Base64), for bytes that are already base64-encoded (such as
+%% the source file contents from the parser); the base64 encoding that
+%% JSON needs is not used.
+
+:- use_module(library(apply), [maplist/2]).
+:- use_module(library(base64), [base64//1]).
+:- use_module(library(error), [syntax_error/1]).
+:- use_module(library(utf8), [utf8_codes//1]).
+
+%! write_kythe_entry(+Stream, +Entry:dict) is det.
+%% Write Entry (see above) to Stream, which must be binary.
+write_kythe_entry(Stream, Entry) :-
+    phrase(message(entry, Entry), Bytes),
+    length(Bytes, Length),
+    phrase(varint(Length), LengthAndBytes, Bytes),
+    maplist(put_byte(Stream), LengthAndBytes).
+
+%! read_kythe_entry(+Stream, -Entry:dict) is semidet.
+%% Read an entry from Stream, which must be binary; fails at end of
+%% file.  The dicts in Entry have the tag 'json' (as when reading the
+%% JSON form), the strings are Prolog strings, and the fact_value is a
+%% list of bytes.
+read_kythe_entry(Stream, Entry) :-
+    get_byte(Stream, B0),
+    B0 \== -1,
+    read_varint_bytes(B0, Stream, LengthBytes),
+    phrase(varint_value(Length), LengthBytes),
+    length(Bytes, Length),
+    maplist(get_byte(Stream), Bytes),
+    (  memberchk(-1, Bytes)
+    -> syntax_error(kythe_entry_eof)
+    ;  true
+    ),
+    parse_message(entry, Bytes, Entry).
+
+%! fields(?Message:atom, -Fields:list) is semidet.
+%% The fields of a message, as Number-Key-Type, in the order that
+%% they're written.
+fields(entry, [1-source-vname,
+               2-edge_kind-string,
+               3-target-vname,
+               4-fact_name-string,
+               5-fact_value-bytes]).
+fields(vname, [1-signature-string,
+               2-corpus-string,
+               3-root-string,
+               4-path-string,
+               5-language-string]).
+
+%! message(+Message:atom, +Dict:dict)// is det.
+message(Message, Dict) -->
+    { fields(Message, Fields) },
+    message_fields(Fields, Dict).
+
+message_fields([], _Dict) --> [].
+message_fields([Number-Key-Type|Fields], Dict) -->
+    (  { get_dict(Key, Dict, Value),
+         value_bytes(Type, Value, Bytes),
+         Bytes \== []
+       }
+    -> { Tag is (Number << 3) \/ 2,
+         length(Bytes, Length)
+       },
+       varint(Tag),
+       varint(Length),
+       bytes(Bytes)
+    ;  []
+    ),
+    message_fields(Fields, Dict).
+
+%! value_bytes(+Type:atom, +Value, -Bytes:list(integer)) is det.
+%% The encoding of a field's value.
+value_bytes(vname, VName, Bytes) :-
+    phrase(message(vname, VName), Bytes).
+value_bytes(string, Text, Bytes) :-
+    text_utf8(Text, Bytes).
+value_bytes(bytes, Value, Bytes) :-
+    (  Value = base64(Base64)
+    -> atom_codes(Base64, Base64Codes),
+       phrase(base64(Bytes), Base64Codes)
+    ;  text_utf8(Value, Bytes)
+    ).
+
+%! text_utf8(+Text, -Bytes:list(integer)) is det.
+text_utf8(Text, Bytes) :-
+    atom_codes(Text, Codes),
+    phrase(utf8_codes(Codes), Bytes).
+
+%! parse_message(+Message:atom, +Bytes:list(integer), -Dict:dict) is det.
+parse_message(Message, Bytes, Dict) :-
+    fields(Message, Fields),
+    (  phrase(message_pairs(Fields, Pairs), Bytes)
+    -> dict_pairs(Dict, json, Pairs)
+    ;  syntax_error(kythe_entry_message(Message, Bytes))
+    ).
+
+message_pairs(Fields, [Key-Value|Pairs]) -->
+    varint_value(Tag), !,
+    { Number is Tag >> 3,
+      WireType is Tag /\ 7,
+      (  WireType == 2,
+         memberchk(Number-Key-Type, Fields)
+      -> true
+      ;  syntax_error(kythe_entry_field(Number, WireType))
+      )
+    },
+    varint_value(Length),
+    { length(Bytes, Length) },
+    bytes(Bytes),
+    { bytes_value(Type, Bytes, Value) },
+    message_pairs(Fields, Pairs).
+message_pairs(_Fields, []) --> [].
+
+%! bytes_value(+Type:atom, +Bytes:list(integer), -Value) is det.
+%% The inverse of value_bytes/3 (a bytes field is left as bytes).
+bytes_value(vname, Bytes, VName) :-
+    parse_message(vname, Bytes, VName).
+bytes_value(string, Bytes, String) :-
+    phrase(utf8_codes(Codes), Bytes), !,
+    string_codes(String, Codes).
+bytes_value(bytes, Bytes, Bytes).
+
+%! read_varint_bytes(+B0:integer, +Stream, -Bytes:list(integer)) is det.
+%% Read the rest of a varint whose first byte B0 has been read.
+read_varint_bytes(B0, Stream, [B0|Bytes]) :-
+    (  B0 < 0x80
+    -> Bytes = []
+    ;  get_byte(Stream, B1),
+       (  B1 == -1
+       -> syntax_error(kythe_entry_eof)
+       ;  read_varint_bytes(B1, Stream, Bytes)
+       )
+    ).
+
+%! varint(+Value:integer)// is det.
+%% Encode a non-negative integer as a varint: 7 bits per byte, least
+%% significant first, with the high bit set on all but the last byte.
+varint(Value) -->
+    (  { Value < 0x80 }
+    -> [Value]
+    ;  { Byte is (Value /\ 0x7f) \/ 0x80,
+         Value1 is Value >> 7
+       },
+       [Byte],
+       varint(Value1)
+    ).
+
+%! varint_value(-Value:integer)// is semidet.
+%% Decode a varint (the inverse of varint//1).
+varint_value(Value) -->
+    varint_value(0, 0, Value).
+
+varint_value(Shift, Value0, Value) -->
+    [Byte],
+    { Value1 is Value0 \/ ((Byte /\ 0x7f) << Shift) },
+    (  { Byte < 0x80 }
+    -> { Value = Value1 }
+    ;  { Shift1 is Shift + 7 },
+       varint_value(Shift1, Value1, Value)
+    ).
+
+bytes([]) --> [].
+bytes([Byte|Bytes]) --> [Byte], bytes(Bytes).
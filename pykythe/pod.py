@@ -10,10 +10,16 @@ mixin class for adding a few common methods for dealing with JSON.
 # pylint: disable=too-few-public-methods
 
 import collections
+import dataclasses
+import io
 import json
+import re
+import types
+from json.encoder import encode_basestring_ascii
 from lib2to3 import pytree  # For PlainOldDataExtended
 from typing import (  # pylint: disable=unused-import
-    Any, Mapping, MutableMapping, Sequence, Text, TypeVar)
+    TYPE_CHECKING, Any, Callable, Dict, IO, List, Mapping, Match,
+    MutableMapping, Sequence, Text, Tuple, Type, TypeVar)
 
 
 class PlainOldData:
@@ -21,6 +27,18 @@ class PlainOldData:
 
     __slots__ = []  # Subclass *must* define its own __slots__
 
+    # All the slots, including inherited ones (a subclass that adds no
+    # fields defines `__slots__ = []`, so that its instances don't get
+    # a __dict__, which means that its __slots__ isn't the complete
+    # list). Set by __init_subclass__.
+    _all_slots = ()  # type: Sequence[Text]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._all_slots = tuple(
+            slot for base in reversed(cls.__mro__)
+            for slot in base.__dict__.get('__slots__', ()))
+
     def as_json_dict(self) -> Mapping[Text, Any]:
         # TODO: -> collections.OrderedDict[Text, Any]
         """Return an OrderedDict for all non-None fields.
@@ -31,7 +49,7 @@ class PlainOldData:
         """
         result = collections.OrderedDict(
         )  # type: collections.OrderedDict[Text, Any]
-        for attr in self.__slots__:
+        for attr in self._all_slots:
             value = getattr(self, attr)
             if value is not None:
                 result[attr] = value
@@ -44,6 +62,8 @@ class PlainOldData:
 class PlainOldDataExtended(PlainOldData):
     """PlainOlData that can JSON-ify certain types."""
 
+    __slots__ = []
+
     def as_json_dict(self) -> Mapping[Text, Any]:
         """Recursively turn a node into a dict for JSON-ification."""
         return self.make_json_dict(self.__class__.__name__)
@@ -51,24 +71,188 @@ class PlainOldDataExtended(PlainOldData):
     def make_json_dict(self, name: Text) -> MutableMapping[Text, Any]:
         result = collections.OrderedDict(
         )  # type: collections.OrderedDict[Text, Any]
-        for slot in self.__slots__:
+        for slot in self._all_slots:
             try:  # TODO: delete (it's for debugging)
                 value = getattr(self, slot)
             except AttributeError as exc:
                 raise RuntimeError('%r not in %r slots for %r' %
-                                   (slot, self.__slots__, self)) from exc
+                                   (slot, self._all_slots, self)) from exc
             if value is not None:
                 result[slot] = _as_json_dict_full(value)
         return collections.OrderedDict(kind=name, slots=result)
 
+    def as_json_str(self) -> Text:
+        with io.StringIO() as out:
+            self.write_json(out)
+            return out.getvalue()
+
+    def write_json(self, out: IO[Text]) -> None:
+        """Write the JSON-ified node to out.
+
+        The output is the same as `json.dumps(self.as_json_dict())`,
+        but it's written directly from the node, without creating
+        the intermediate dicts (see _json_writer).
+        """
+        parts = []  # type: List[Text]
+        _write_json_value(self, parts, out)
+        out.write(''.join(parts))
+
+    def as_prolog_str(self) -> Text:
+        with io.StringIO() as out:
+            self.write_prolog(out)
+            return out.getvalue()
+
+    def write_prolog(self, out: IO[Text]) -> None:
+        """Write the node to out as a Prolog term (without a full stop).
+
+        The term is what pykythe.pl makes from the JSON (see
+        fqn_expr_json.pl), so it can be read with read_term/3:
+        str("...") for a str, int(N), bool("True") or bool("False"),
+        none, a list, dict{'key':Value,...} for a dict, and
+        'Kind'{'slot':Value,...} for a node (omitting None slots). The
+        output is ASCII (see _prolog_quote).
+        """
+        parts = []  # type: List[Text]
+        _write_prolog_value(self, parts, out)
+        out.write(''.join(parts))
+
+
+_PodClass = TypeVar('_PodClass', bound=type)
+
+
+def _frozen_class(cls: _PodClass) -> _PodClass:
+    """Class decorator: like @dataclass(frozen=True), but faster to apply.
+
+    @dataclass generates and exec()s the source of several methods for
+    each class, which made importing ast_cooked (with its dozens of
+    classes) the largest part of start-up time. This generates __init__,
+    __eq__ and __hash__ with a single exec(), reusing them for classes
+    with the same fields; __repr__, __setattr__ and __delattr__ are
+    shared by all the classes. The fields are _all_slots (no defaults);
+    as with @dataclass, __init__ calls __post_init__ if it's defined.
+
+    The result behaves like a frozen dataclass, except that
+    dataclasses.fields() and dataclasses.replace() can't be used.
+    """
+    has_post_init = hasattr(cls, '__post_init__')
+    key = (cls._all_slots, has_post_init)  # type: ignore
+    try:
+        methods = _FROZEN_METHODS[key]
+    except KeyError:
+        methods = _FROZEN_METHODS[key] = _make_frozen_methods(*key)
+    template = methods['__init__']
+    init = types.FunctionType(template.__code__, template.__globals__)
+    init.__qualname__ = cls.__qualname__ + '.__init__'  # for error messages
+    cls.__init__ = init  # type: ignore
+    cls.__eq__ = methods['__eq__']  # type: ignore
+    cls.__hash__ = methods['__hash__']  # type: ignore
+    cls.__repr__ = _frozen_repr  # type: ignore
+    cls.__setattr__ = _frozen_setattr  # type: ignore
+    cls.__delattr__ = _frozen_delattr  # type: ignore
+    return cls
+
+
+if TYPE_CHECKING:
+    # mypy doesn't know about the methods that _frozen_class adds, so
+    # for type checking, frozen_class is the same as
+    # @dataclass(frozen=True).
+    from typing_extensions import dataclass_transform
+
+    @dataclass_transform(frozen_default=True)
+    def frozen_class(cls: _PodClass) -> _PodClass:
+        return cls
+else:
+    frozen_class = _frozen_class
+
+_FROZEN_METHODS = {
+}  # type: Dict[Tuple[Sequence[Text], bool], Dict[Text, Callable[..., Any]]]
+
+
+def _make_frozen_methods(fields: Sequence[Text], has_post_init: bool
+                         ) -> Dict[Text, Callable[..., Any]]:
+    """Generate __init__, __eq__, __hash__ for frozen_class."""
+    self_tuple = '({})'.format(''.join('self.{}, '.format(field)
+                                       for field in fields))
+    other_tuple = self_tuple.replace('self.', 'other.')
+    lines = ['def __init__(self{}):'.format(''.join(', ' + field
+                                                   for field in fields))]
+    lines.extend('    _setattr(self, {!r}, {})'.format(field, field)
+                 for field in fields)
+    if has_post_init:
+        lines.append('    self.__post_init__()')
+    if not fields and not has_post_init:
+        lines.append('    pass')
+    lines.extend([
+        'def __eq__(self, other):',
+        '    if other.__class__ is self.__class__:',
+        '        return {} == {}'.format(self_tuple, other_tuple),
+        '    return NotImplemented',
+        'def __hash__(self):',
+        '    return hash({})'.format(self_tuple),
+    ])
+    namespace = {'_setattr': object.__setattr__}  # type: Dict[Text, Any]
+    exec('\n'.join(lines), namespace)  # pylint: disable=exec-used
+    return {
+        name: namespace[name]
+        for name in ('__init__', '__eq__', '__hash__')
+    }
+
+
+def _frozen_repr(self: Any) -> Text:
+    return '{}({})'.format(
+        self.__class__.__qualname__,
+        ', '.join('{}={!r}'.format(field, getattr(self, field))
+                  for field in self._all_slots))
+
+
+def _frozen_setattr(self: Any, name: Text, value: Any) -> None:
+    raise dataclasses.FrozenInstanceError(
+        'cannot assign to field {!r}'.format(name))
+
+
+def _frozen_delattr(self: Any, name: Text) -> None:
+    raise dataclasses.FrozenInstanceError(
+        'cannot delete field {!r}'.format(name))
+
 
 def _as_json_dict_full(value: Any) -> Any:
-    """Recursively turn an object into a dict for JSON-ification."""
+    """Recursively turn an object into a dict for JSON-ification.
+
+    To avoid exceeding the recursion limit for deeply nested values
+    (e.g., from a long chain of `+`), the recursion stops at
+    _MAX_JSON_DEPTH: the value at that depth is pushed onto a stack,
+    as (container, key, value), with a placeholder in
+    container[key] that's replaced when the stack is processed.
+    """
+    root = [value]  # type: List[Any]
+    stack = [(root, 0, value)]  # type: List[Tuple[Any, Any, Any]]
+    while stack:
+        container, key, item = stack.pop()
+        container[key] = _as_json_dict_item(item, stack, 0)
+    return root[0]
+
+
+def _as_json_dict_item(value: Any, stack: List[Tuple[Any, Any, Any]],
+                       depth: int) -> Any:
+    """Turn an object into a dict, for _as_json_dict_full."""
     # pylint: disable=too-many-return-statements
     if isinstance(value, PlainOldData):
-        return value.as_json_dict()
+        if not _has_default_json_dict(value.__class__):
+            return value.as_json_dict()
+        slots = collections.OrderedDict(
+        )  # type: collections.OrderedDict[Text, Any]
+        for slot in value._all_slots:  # pylint: disable=protected-access
+            slot_value = getattr(value, slot)
+            if slot_value is not None:
+                slots[slot] = _as_json_dict_child(slots, slot, slot_value,
+                                                  stack, depth)
+        return collections.OrderedDict(
+            kind=value.__class__.__name__, slots=slots)
     if isinstance(value, list):
-        return [_as_json_dict_full(v) for v in value]
+        result = list(value)
+        for i, item in enumerate(value):
+            result[i] = _as_json_dict_child(result, i, item, stack, depth)
+        return result
     if isinstance(value, pytree.Leaf):
         return collections.OrderedDict(
             kind='Leaf',
@@ -84,11 +268,452 @@ def _as_json_dict_full(value: Any) -> Any:
     if isinstance(value, str):
         return collections.OrderedDict(kind='str', value=value)
     if isinstance(value, dict):
-        return collections.OrderedDict(
-            kind='dict',
-            items=collections.OrderedDict((key, _as_json_dict_full(value))
-                                          for key, value in value.items()))
+        items = collections.OrderedDict(
+        )  # type: collections.OrderedDict[Text, Any]
+        for key, item in value.items():
+            items[key] = _as_json_dict_child(items, key, item, stack, depth)
+        return collections.OrderedDict(kind='dict', items=items)
     if value is None:
         return collections.OrderedDict(kind='None')
     raise NotImplementedError('{}: Unknown value: {!r}'.format(
         value.__class__.__name__, value))
+
+
+def _as_json_dict_child(container: Any, key: Any, value: Any,
+                        stack: List[Tuple[Any, Any, Any]], depth: int) -> Any:
+    """Turn container[key] into a dict or push it onto the stack."""
+    if depth < _MAX_JSON_DEPTH:
+        return _as_json_dict_item(value, stack, depth + 1)
+    stack.append((container, key, value))
+    return None  # placeholder
+
+
+def _has_default_json_dict(cls: type) -> bool:
+    """Test whether a class uses PlainOldDataExtended's JSON-ification."""
+    return (issubclass(cls, PlainOldDataExtended) and
+            cls.as_json_dict is PlainOldDataExtended.as_json_dict and
+            cls.make_json_dict is PlainOldDataExtended.make_json_dict)
+
+
+# Writers for JSON-ifying a value (see PlainOldDataExtended.write_json
+# and _as_json_dict_full). Each writer appends strings to `parts`;
+# when there are more than _FLUSH_PARTS of them, they're written to
+# `out`. The writers are created on demand, one per class.
+#
+# To avoid exceeding the recursion limit for deeply nested values, the
+# recursion stops at _MAX_JSON_DEPTH: the writer for a list, dict or
+# PlainOldDataExtended at that depth appends the value to `deferred`
+# instead of writing it, and then each of the containing writers
+# appends the rest of its output (values and _Literal punctuation) to
+# `deferred` instead of writing it. Each writer is called with an
+# empty `deferred`; _write_json_value writes anything that was
+# deferred.
+
+_FLUSH_PARTS = 10000
+
+_MAX_JSON_DEPTH = 100
+
+_JsonWriter = Callable[[Any, List[Text], IO[Text], List[Any], int], None]
+
+_JSON_WRITERS = {}  # type: Dict[type, _JsonWriter]
+
+
+class _Literal(str):
+    """A string in `deferred` that's output as-is."""
+
+    __slots__ = []
+
+
+_COMMA = _Literal(', ')
+_CLOSE_LIST = _Literal(']')
+_CLOSE_DICT = _Literal('}}')
+
+
+def _write_json_value(value: Any, parts: List[Text], out: IO[Text]) -> None:
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is _Literal:
+            parts.append(item)
+        else:
+            deferred = []  # type: List[Any]
+            try:
+                writer = _JSON_WRITERS[item.__class__]
+            except KeyError:
+                writer = _new_json_writer(item.__class__)
+            writer(item, parts, out, deferred, 0)
+            stack.extend(reversed(deferred))
+
+
+def _new_json_writer(cls: type) -> _JsonWriter:
+    writer = _JSON_WRITERS[cls] = _json_writer(cls)
+    return writer
+
+
+def _json_writer(cls: type) -> _JsonWriter:
+    """Create the JSON writer for a class; same cases as _as_json_dict_full."""
+    # pylint: disable=too-many-return-statements
+    if issubclass(cls, PlainOldData):
+        if _has_default_json_dict(cls):
+            return _json_pod_writer(cls)
+        return _write_json_as_json_dict
+    if issubclass(cls, list):
+        return _write_json_list
+    if issubclass(cls, pytree.Leaf):
+        return _write_json_full
+    if issubclass(cls, bool):
+        return _write_json_bool
+    if issubclass(cls, int):
+        return _write_json_int
+    if issubclass(cls, str):
+        return _write_json_str
+    if issubclass(cls, dict):
+        return _write_json_dict
+    if cls is type(None):
+        return _write_json_none
+    return _write_json_full  # raises NotImplementedError
+
+
+def _json_pod_writer(cls: Type[PlainOldData]) -> _JsonWriter:
+    """Create the JSON writer for a PlainOldDataExtended class."""
+    head = '{"kind": ' + encode_basestring_ascii(cls.__name__) + ', "slots": {'
+    slot_keys = [(slot, encode_basestring_ascii(slot) + ': ')
+                 for slot in cls._all_slots]
+
+    def write(value: PlainOldDataExtended, parts: List[Text], out: IO[Text],
+              deferred: List[Any], depth: int) -> None:
+        if depth > _MAX_JSON_DEPTH:
+            deferred.append(value)
+            return
+        parts.append(head)
+        sep = ''
+        for slot, key in slot_keys:
+            slot_value = getattr(value, slot)
+            if slot_value is not None:
+                if deferred:
+                    deferred.append(_Literal(sep + key))
+                    deferred.append(slot_value)
+                else:
+                    parts.append(sep + key)
+                    try:
+                        writer = _JSON_WRITERS[slot_value.__class__]
+                    except KeyError:
+                        writer = _new_json_writer(slot_value.__class__)
+                    writer(slot_value, parts, out, deferred, depth + 1)
+                sep = ', '
+        if deferred:
+            deferred.append(_CLOSE_DICT)
+        else:
+            parts.append('}}')
+            if len(parts) > _FLUSH_PARTS:
+                out.write(''.join(parts))
+                parts.clear()
+
+    return write
+
+
+def _write_json_as_json_dict(value: PlainOldData, parts: List[Text],
+                             out: IO[Text], deferred: List[Any],
+                             depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append(json.dumps(value.as_json_dict()))
+
+
+def _write_json_full(value: Any, parts: List[Text], out: IO[Text],
+                     deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append(json.dumps(_as_json_dict_full(value)))
+
+
+def _write_json_list(value: List[Any], parts: List[Text], out: IO[Text],
+                     deferred: List[Any], depth: int) -> None:
+    if depth > _MAX_JSON_DEPTH:
+        deferred.append(value)
+        return
+    parts.append('[')
+    sep = ''
+    for item in value:
+        if deferred:
+            deferred.append(_COMMA)
+            deferred.append(item)
+        else:
+            parts.append(sep)
+            try:
+                writer = _JSON_WRITERS[item.__class__]
+            except KeyError:
+                writer = _new_json_writer(item.__class__)
+            writer(item, parts, out, deferred, depth + 1)
+            sep = ', '
+    if deferred:
+        deferred.append(_CLOSE_LIST)
+    else:
+        parts.append(']')
+
+
+def _write_json_bool(value: bool, parts: List[Text], out: IO[Text],
+                     deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('{"kind": "bool", "value": "True"}'
+                 if value else '{"kind": "bool", "value": "False"}')
+
+
+def _write_json_int(value: int, parts: List[Text], out: IO[Text],
+                    deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('{"kind": "int", "value": ' + int.__repr__(value) + '}')
+
+
+def _write_json_str(value: Text, parts: List[Text], out: IO[Text],
+                    deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('{"kind": "str", "value": ' +
+                 encode_basestring_ascii(value) + '}')
+
+
+def _write_json_dict(value: Mapping[Text, Any], parts: List[Text],
+                     out: IO[Text], deferred: List[Any], depth: int) -> None:
+    if depth > _MAX_JSON_DEPTH:
+        deferred.append(value)
+        return
+    parts.append('{"kind": "dict", "items": {')
+    sep = ''
+    for key, item in value.items():
+        key = _json_key(key)
+        if deferred:
+            deferred.append(_Literal(sep + encode_basestring_ascii(key) + ': '))
+            deferred.append(item)
+        else:
+            parts.append(sep + encode_basestring_ascii(key) + ': ')
+            try:
+                writer = _JSON_WRITERS[item.__class__]
+            except KeyError:
+                writer = _new_json_writer(item.__class__)
+            writer(item, parts, out, deferred, depth + 1)
+        sep = ', '
+    if deferred:
+        deferred.append(_CLOSE_DICT)
+    else:
+        parts.append('}}')
+
+
+def _json_key(key: Any) -> Text:
+    """Convert a dict key to a string, the same way as json.dumps."""
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return json.dumps(key)
+    raise TypeError('keys must be str, int, float, bool or None, not {}'.format(
+        key.__class__.__name__))
+
+
+def _write_json_none(value: None, parts: List[Text], out: IO[Text],
+                     deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('{"kind": "None"}')
+
+
+# Writers for a value as a Prolog term (see
+# PlainOldDataExtended.write_prolog); these work the same way as the
+# JSON writers above, including the handling of deep nesting. Slot
+# values that are str are written directly, because they're the most
+# common.
+
+_PROLOG_WRITERS = {}  # type: Dict[type, _JsonWriter]
+
+_PROLOG_COMMA = _Literal(',')
+_PROLOG_CLOSE_DICT = _Literal('}')
+
+
+def _write_prolog_value(value: Any, parts: List[Text],
+                        out: IO[Text]) -> None:
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is _Literal:
+            parts.append(item)
+        else:
+            deferred = []  # type: List[Any]
+            try:
+                writer = _PROLOG_WRITERS[item.__class__]
+            except KeyError:
+                writer = _new_prolog_writer(item.__class__)
+            writer(item, parts, out, deferred, 0)
+            stack.extend(reversed(deferred))
+
+
+def _new_prolog_writer(cls: type) -> _JsonWriter:
+    writer = _PROLOG_WRITERS[cls] = _prolog_writer(cls)
+    return writer
+
+
+def _prolog_writer(cls: type) -> _JsonWriter:
+    """Create the Prolog writer for a class; same cases as _json_writer."""
+    # pylint: disable=too-many-return-statements
+    if issubclass(cls, PlainOldData) and _has_default_json_dict(cls):
+        return _prolog_pod_writer(cls)
+    if issubclass(cls, list):
+        return _write_prolog_list
+    if issubclass(cls, bool):
+        return _write_prolog_bool
+    if issubclass(cls, int):
+        return _write_prolog_int
+    if issubclass(cls, str):
+        return _write_prolog_str
+    if issubclass(cls, dict):
+        return _write_prolog_dict
+    if cls is type(None):
+        return _write_prolog_none
+    # A PlainOldData with its own as_json_dict, a pytree.Leaf, etc.
+    # don't have the form that pykythe.pl expects.
+    return _write_prolog_unknown
+
+
+def _prolog_pod_writer(cls: Type[PlainOldData]) -> _JsonWriter:
+    """Create the Prolog writer for a PlainOldDataExtended class."""
+    head = _prolog_quote(cls.__name__, "'") + '{'
+    slot_keys = [(slot, _prolog_quote(slot, "'") + ':')
+                 for slot in cls._all_slots]
+
+    def write(value: PlainOldDataExtended, parts: List[Text], out: IO[Text],
+              deferred: List[Any], depth: int) -> None:
+        if depth > _MAX_JSON_DEPTH:
+            deferred.append(value)
+            return
+        parts.append(head)
+        sep = ''
+        for slot, key in slot_keys:
+            slot_value = getattr(value, slot)
+            if slot_value is not None:
+                if deferred:
+                    deferred.append(_Literal(sep + key))
+                    deferred.append(slot_value)
+                elif slot_value.__class__ is str:
+                    parts.append(sep + key + 'str(' +
+                                 _prolog_quote(slot_value, '"') + ')')
+                else:
+                    parts.append(sep + key)
+                    try:
+                        writer = _PROLOG_WRITERS[slot_value.__class__]
+                    except KeyError:
+                        writer = _new_prolog_writer(slot_value.__class__)
+                    writer(slot_value, parts, out, deferred, depth + 1)
+                sep = ','
+        if deferred:
+            deferred.append(_PROLOG_CLOSE_DICT)
+        else:
+            parts.append('}')
+            if len(parts) > _FLUSH_PARTS:
+                out.write(''.join(parts))
+                parts.clear()
+
+    return write
+
+
+def _write_prolog_list(value: List[Any], parts: List[Text], out: IO[Text],
+                       deferred: List[Any], depth: int) -> None:
+    if depth > _MAX_JSON_DEPTH:
+        deferred.append(value)
+        return
+    parts.append('[')
+    sep = ''
+    for item in value:
+        if deferred:
+            deferred.append(_PROLOG_COMMA)
+            deferred.append(item)
+        else:
+            parts.append(sep)
+            try:
+                writer = _PROLOG_WRITERS[item.__class__]
+            except KeyError:
+                writer = _new_prolog_writer(item.__class__)
+            writer(item, parts, out, deferred, depth + 1)
+            sep = ','
+    if deferred:
+        deferred.append(_CLOSE_LIST)
+    else:
+        parts.append(']')
+
+
+def _write_prolog_bool(value: bool, parts: List[Text], out: IO[Text],
+                       deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('bool("True")' if value else 'bool("False")')
+
+
+def _write_prolog_int(value: int, parts: List[Text], out: IO[Text],
+                      deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('int(' + int.__repr__(value) + ')')
+
+
+def _write_prolog_str(value: Text, parts: List[Text], out: IO[Text],
+                      deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('str(' + _prolog_quote(value, '"') + ')')
+
+
+def _write_prolog_dict(value: Mapping[Text, Any], parts: List[Text],
+                       out: IO[Text], deferred: List[Any], depth: int) -> None:
+    if depth > _MAX_JSON_DEPTH:
+        deferred.append(value)
+        return
+    parts.append('dict{')
+    sep = ''
+    for key, item in value.items():
+        key = _json_key(key)
+        if deferred:
+            deferred.append(_Literal(sep + _prolog_quote(key, "'") + ':'))
+            deferred.append(item)
+        else:
+            parts.append(sep + _prolog_quote(key, "'") + ':')
+            try:
+                writer = _PROLOG_WRITERS[item.__class__]
+            except KeyError:
+                writer = _new_prolog_writer(item.__class__)
+            writer(item, parts, out, deferred, depth + 1)
+        sep = ','
+    if deferred:
+        deferred.append(_PROLOG_CLOSE_DICT)
+    else:
+        parts.append('}')
+
+
+def _write_prolog_none(value: None, parts: List[Text], out: IO[Text],
+                       deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    parts.append('none')
+
+
+def _write_prolog_unknown(value: Any, parts: List[Text], out: IO[Text],
+                          deferred: List[Any], depth: int) -> None:
+    # pylint: disable=unused-argument
+    raise NotImplementedError('{}: Unknown value for Prolog: {!r}'.format(
+        value.__class__.__name__, value))
+
+
+def _prolog_quote(text: Text, quote: Text) -> Text:
+    """Quote a Prolog atom (quote is "'") or string (quote is '"').
+
+    Everything other than printable ASCII is written as an escape
+    (\\xHEX\\), as are the quotes and backslash.
+    """
+    return quote + _PROLOG_ESCAPE_RE.sub(_prolog_escape, text) + quote
+
+
+def _prolog_escape(match: Match[Text]) -> Text:
+    char = match.group()
+    if char in '"\'\\':
+        return '\\' + char
+    return '\\x{:x}\\'.format(ord(char))
+
+
+# All characters except printable ASCII other than '"', "'", '\'.
+_PROLOG_ESCAPE_RE = re.compile(r'[^ !#-&(-\[\]-~]')
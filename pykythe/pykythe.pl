@@ -8,11 +8,11 @@
 %% - resolve and process imports
 %% - in future, things like function call references
 
-%% TODO: :- use_module(library(protobufs)).  % instead of input/output JSON
-%%        ... handling JSON seems to be the most expensive thing,
-%%            according to profile/1 (it also seems to be the main
-%%            contributor to garbage collection; base64 manipulation is
-%%            also expensive).
+%% Handling JSON seems to be the most expensive thing, according to
+%% profile/1 (it also seems to be the main contributor to garbage
+%% collection; base64 manipulation is also expensive). So, the input
+%% can be Prolog terms (--parse_format=prolog) and the Kythe output can
+%% be protobufs (--kytheout_format=entries; see kythe_entries.pl).
 
 %% Names and naming conventions:
 %%  'astn' is an AST (Abstract Syntax Tree) node.
@@ -177,12 +177,14 @@
 %% TODO: can we remove the kyfact accumulator from the first pass
 %%       and generate all the Kythe information from the second pass?
 
-%% TODO: Use QLF: http://www.swi-prolog.org/pldoc/man?section=qlf
+%% For faster start-up, this can be run from a saved state (see
+%% scripts/pykythe_qsave.pl and PYKYTHE_USE_SAVED in the Makefile;
+%% this is still experimental).
 
 :- module(pykythe, [pykythe_main/0]).
 
 :- use_module(library(aggregate), [aggregate_all/3, foreach/2]).
-:- use_module(library(apply), [maplist/2, maplist/3, maplist/4, foldl/4, convlist/3]).
+:- use_module(library(apply), [maplist/2, maplist/3, maplist/4, foldl/4, convlist/3, exclude/3]).
 :- use_module(library(assoc), [is_assoc/1]).
 :- use_module(library(base64), [base64/2]).
 :- use_module(library(debug), [assertion/1, debug/3]).
@@ -190,16 +192,21 @@
 :- use_module(library(error), [type_error/2]).
 :- use_module(library(filesex), [make_directory_path/1, directory_file_path/3]).
 :- use_module(library(http/json), [json_read_dict/2, json_write_dict/3]).
-:- use_module(library(lists), [append/3, list_to_set/2, member/2, reverse/2, select/3]).
+:- use_module(library(lazy_lists), [lazy_list/2]).
+:- use_module(library(lists), [append/2, append/3, list_to_set/2, member/2, reverse/2, select/3]).
 :- use_module(library(optparse), [opt_arguments/3]).
 :- use_module(library(ordsets), [list_to_ord_set/2, ord_empty/1, ord_union/3, ord_add_element/3]).
 :- use_module(library(pairs), [pairs_keys/2, pairs_values/2]).
 :- use_module(library(pcre), [re_replace/4, re_match/2, re_matchsub/4]).
 :- use_module(library(pprint), [print_term/2]).
-:- use_module(library(readutil), [read_file_to_string/3]).
+:- use_module(library(process), [process_create/3, process_wait/2]).
+:- use_module(library(readutil), [read_file_to_string/3, read_line_to_string/2]).
+:- use_module(library(utf8), [utf8_codes//1]).
 :- use_module(library(yall)).
 %% :- use_module(library(apply_macros).  % TODO: for performance
 :- use_module(must_once, [must_once/1, must_once_msg/2, must_once_msg/3, fail/1]).
+:- use_module(fqn_expr_json, [read_fqn_expr_json/2]).
+:- use_module(kythe_entries, [write_kythe_entry/2, read_kythe_entry/2]).
 
 :- meta_predicate
        maplist_kyfact(4, +, +, -, +),
@@ -240,12 +247,16 @@
                   base64/2,
                   dict_values/2,
                   directory_file_path/3,
+                  fact_value_base64/2,
                   foreach/2,
                   json_read_dict/2,
                   json_write_dict/3,
                   list_to_ord_set/2,
                   list_to_set/2,
-                  opt_arguments/3
+                  opt_arguments/3,
+                  process_create/3,
+                  process_wait/2,
+                  read_line_to_string/2
                  ]).
 
 %% Deterministic predicates in this module
@@ -341,10 +352,14 @@
                   %% node_astn0/4,
                   opt/2,
                   opts/2,
-                  output_kyfact/2,
+                  output_kyfact/3,
                   parse_and_process_module/6,
                   %% parse_and_process_module_cached/6,
                   parse_and_process_module_fresh/6,
+                  parse_cmd_exe/3,
+                  parse_cmd_exe_args/6,
+                  parse_module/6,
+                  parse_server/3,
                   %% path_expand/3,
                   path_part/2,
                   %% path_to_python_module/2,
@@ -359,24 +374,36 @@
                   pykythe_main2/0,
                   pykythe_opts/2,
                   %% pythonpath_prefix/2,
+                  read_fqn_expr_item/2,
+                  read_fqn_expr_term/2,
+                  read_frame/3,
+                  read_frame_item/3,
                   read_nodes/4,
+                  read_nodes_all/4,
+                  read_nodes_frames/4,
+                  read_nodes_json/4,
+                  read_nodes_stream/4,
+                  read_nodes_terms/4,
+                  read_stmt_frame/3,
+                  read_utf8_bytes/3,
                   ref_import/4,
                   remove_last_component/3,
                   remove_suffix_star/3,
-                  run_parse_cmd/4,
+                  run_parse_cmd/6,
+                  run_parse_server/4,
+                  send_parse_request/5,
                   set_json_dict_tag/2,
                   signature_node/3,
                   signature_node_kyfact/6,
                   signature_node_kyfacts/5,
                   signature_source/3,
                   simple_path_module/2,
-                  simplify_json/2,
-                  simplify_json_slot_pair/2,
                   simplify_meta/3,
                   split_atom/4,
                   split_module_atom/2,
                   split_path_string_and_canonicalize/3,
                   src_base/2,
+                  stop_parse_server/0,
                   symrej_accum/3,
                   symrej_accum_found/7,
                   symtab_as_kyfact/3,
@@ -548,6 +575,8 @@ initial_symtab(Symtab) :-
 %%       pykythe:pykythe_main2.
 %% or from a script:
 %%      echo "pykythe:pykythe_main" | swipl ...
+%% or with swipl -g pykythe:pykythe_main (as does the saved state
+%% created by scripts/pykythe_qsave.pl).
 %% Note that for running in an emacs shell, you might want swipl --no-tty
 %% See https://groups.google.com/forum/#!topic/swi-prolog/WrC9x3vQBBY
 %% :- initialization(pykythe_main, main). % TODO: reinstate this (see comment in Makefile).
@@ -575,7 +604,9 @@ pykythe_main2 :-
     on_signal(int, _, interrupt),
     pykythe_opts(SrcPath, Opts),
     path_to_python_module_or_unknown(SrcPath, SrcFqn),
-    parse_and_process_module(SrcPath, SrcFqn, Opts, _Symtab, modules{}, _Modules).
+    call_cleanup(
+        parse_and_process_module(SrcPath, SrcFqn, Opts, _Symtab, modules{}, _Modules),
+        stop_parse_server).
 
 %! pykythe_opts(-SrcPath:atom, -Opts:list(pair)) is det.
 %% Process the command line, getting the source file and options.
@@ -585,6 +616,14 @@ pykythe_opts(SrcPath, Opts) :-
     OptsSpec = [
         [opt(parsecmd), type(atom), longflags([parsecmd]),
          help('Command for running parser than generates fqn.json file')],
+        [opt(parse_server), type(boolean), default(false), longflags([parse_server]),
+         help('Run --parsecmd once (with --serve) for all modules, instead of once per module')],
+        [opt(parse_stream), type(boolean), default(false), longflags([parse_stream]),
+         help('Have --parsecmd output a record per statement (--stream_stmts), processing statements as they arrive')],
+        [opt(parse_format), type(atom), default(json), longflags([parse_format]),
+         help('Format of the output from --parsecmd (its --out_format): json or prolog')],
+        [opt(keep_parse_output), type(atom), default(''), longflags([keep_parse_output]),
+         help('Directory for keeping the output of --parsecmd (for debugging), instead of reading it through a pipe')],
         [opt(kythe_corpus), type(atom), default(''), longflags(['kythe_corpus']),
         help('Value of "corpus" in Kythe facts')],
         [opt(kythe_root), type(atom), default(''), longflags(['kythe_root']),
@@ -593,8 +632,10 @@ pykythe_opts(SrcPath, Opts) :-
          help('Similar to $PYTHONPATH for resolving imports (":"-separated paths)')],
         [opt(kytheout), type(atom), default(''), longflags(['kytheout']),
          help('Directory for output of imported files (including "main" file)')],
-        [opt(kytheout_suffix), type(atom), default('.kythe.json'), longflags(['kythout-suffix']),
-         help('Suffix (extension including leading ".") for output files')],
+        [opt(kytheout_format), type(atom), default(json), longflags(['kytheout_format']),
+         help('Format of the output files: json (as read by entrystream --read_format=json) or entries (varint-delimited Kythe Entry protobufs, as read by entrystream, write_entries and verifier)')],
+        [opt(kytheout_suffix), type(atom), default(''), longflags(['kythout-suffix']),
+         help('Suffix (extension including leading ".") for output files (default: .kythe.json or .kythe.entries, depending on --kytheout_format)')],
         [opt(python_version), type(integer), default(3), longflags(python_version),
          help('Python major version')]
     ],
@@ -728,13 +769,15 @@ canonical_path(Path, CanonicalPath) :-
 %% '/').
 parse_and_process_module(SrcPath, SrcFqn, Opts, Symtab, Modules0, Modules) :-
     must_once(is_absolute_file_name(SrcPath)),
-    opts(Opts, [kytheout(KytheOutDir), kytheout_suffix(KytheOutSuffix)]),
+    opts(Opts, [kytheout(KytheOutDir), kytheout_format(KytheFormat), kytheout_suffix(KytheOutSuffix0)]),
+    kytheout_suffix(KytheOutSuffix0, KytheFormat, KytheOutSuffix),
     src_base(SrcPath, SrcPathBase),
     atomic_list_concat([KytheOutDir, SrcPathBase, KytheOutSuffix], KythePath),
     directory_file_path(KythePathDir, _, KythePath),
     make_directory_path(KythePathDir),
-    (  setup_call_cleanup(maybe_open_read(KythePath, KytheInputStream),
-                          parse_and_process_module_cached(KytheInputStream, KythePath, SrcPath, Symtab, Modules0, Modules),
+    kytheout_open_options(KytheFormat, OpenOptions),
+    (  setup_call_cleanup(maybe_open_read(KythePath, OpenOptions, KytheInputStream),
+                          parse_and_process_module_cached(KytheFormat, KytheInputStream, KythePath, SrcPath, Symtab, Modules0, Modules),
                           close(KytheInputStream))
     ;  parse_and_process_module_fresh(SrcFqn, KythePath, Opts, Symtab, Modules0, Modules)
     ),
@@ -743,44 +786,54 @@ parse_and_process_module(SrcPath, SrcFqn, Opts, Symtab, Modules0, Modules) :-
     do_if(true,
           dump_term('MODULES', Modules)).
 
-%! maybe_open_read(+Path, -InputStream) is semidet.
-%% Open Path for read or fail.
-maybe_open_read(Path, InputStream) :-
-    catch(open(Path, read, InputStream), _, fail).
+%! kytheout_suffix(+Suffix0:atom, +KytheFormat:atom, -Suffix:atom) is det.
+%% The suffix for output files: Suffix0 (from --kythout-suffix) or
+%% the default for the format.
+kytheout_suffix('', json, '.kythe.json') :- !.
+kytheout_suffix('', entries, '.kythe.entries') :- !.
+kytheout_suffix(Suffix, _KytheFormat, Suffix) :-
+    Suffix \== ''.
+
+%! kytheout_open_options(+KytheFormat:atom, -OpenOptions:list) is det.
+%% The options for open/4 for an output file in KytheFormat.
+kytheout_open_options(json, []).
+kytheout_open_options(entries, [type(binary)]).
+
+%! maybe_open_read(+Path, +Options:list, -InputStream) is semidet.
+%% Open Path for read (with open/4 Options) or fail.
+maybe_open_read(Path, Options, InputStream) :-
+    catch(open(Path, read, InputStream, Options), _, fail).
 
 %! maybe_close(?Stream) is det.
 %% Close Stream, catching any errors (e.g., Stream is uninstantiated).
 maybe_close(Stream) :-
     catch(close(Stream), _, true).
 
-%! parse_and_process_module_cached(+KytheInputStream, +KythePath:atom, +SrcPath:atom, -Symtab, +Modules0, -Modules) is semidet.
+%! parse_and_process_module_cached(+KytheFormat:atom, +KytheInputStream, +KythePath:atom, +SrcPath:atom, -Symtab, +Modules0, -Modules) is semidet.
 %% TODO: needs to set Modules (see parse_and_process_module_fresh/6)
-parse_and_process_module_cached(KytheInputStream, KythePath, SrcPath, Symtab, Modules0, Modules)  :-
+parse_and_process_module_cached(KytheFormat, KytheInputStream, KythePath, SrcPath, Symtab, Modules0, Modules)  :-
     do_if(false, format(user_error, 'Trying to reuse ~q for ~q~n', [KythePath, SrcPath])), % TODO: delete
     %% The following validation depends on what kyfile//1 generates.
     %% Note that the items are sorted by default.
     %% TODO: read in everything, so no need for order dependency?
-    my_json_read_dict(KytheInputStream, JsonSymtab),
-    my_json_read_dict(KytheInputStream, JsonPath),
-    my_json_read_dict(KytheInputStream, JsonEncoding),
-    my_json_read_dict(KytheInputStream, JsonText),
+    read_kyfact(KytheFormat, KytheInputStream, JsonSymtab),
+    read_kyfact(KytheFormat, KytheInputStream, JsonPath),
+    read_kyfact(KytheFormat, KytheInputStream, JsonEncoding),
+    read_kyfact(KytheFormat, KytheInputStream, JsonText),
     %% The following tests can die with cryptic error messages ... we
     %% could make things a bit nicer by first doing, e.g.
     %%     must_once_msg(get_dict(fact_name, JsonSymtab, "/pykythe/symtab"),
     %%         'Invalid JSON, expecting fact_name="/pykythe/symtab": ~q', [JsonSymtab]),
     must_once(JsonSymtab.fact_name == "/pykythe/symtab"),
     must_once(JsonPath.fact_name == "/kythe/node/kind"),
-    base64_string(JsonPath.fact_value, JsonPathFactValue),
-    must_once(JsonPathFactValue == "file"),
+    must_once(JsonPath.fact_value == "file"),
     must_once(JsonEncoding.fact_name == "/kythe/text/encoding"),
     must_once(JsonText.fact_name == "/kythe/text"),
     atom_string(JsonTextSourcePath, JsonText.source.path),
     must_once(JsonTextSourcePath == SrcPath),
-    base64_string(JsonText.fact_value, JsonTextString),
     read_file_to_string(SrcPath, SrcText, [file_errors(fail)]),
-    SrcText == JsonTextString,  % TODO: other conditions, such as pykythe version?
-    base64_string(JsonSymtab.fact_value, SymtabString),
-    term_string(Symtab, SymtabString),
+    SrcText == JsonText.fact_value,  % TODO: other conditions, such as pykythe version?
+    term_string(Symtab, JsonSymtab.fact_value),
     %% TODO: Check the "version" of pykythe.pl against the version
     %%       that created the KythePath file and not reuse if there's
     %%       been a change.
@@ -789,6 +842,19 @@ parse_and_process_module_cached(KytheInputStream, KythePath, SrcPath, Symtab, Mo
     do_if(true,
           format(user_error, 'Reusing ~q for ~q: ~p~n', [KythePath, SrcPath, Symtab])).  % TODO: delete
 
+%! read_kyfact(+KytheFormat:atom, +KytheInputStream, -Fact:json_dict) is semidet.
+%% Read a Kythe fact that was written by output_kyfact/3, with its
+%% fact_value decoded into a string.
+read_kyfact(json, KytheInputStream, Fact) :-
+    my_json_read_dict(KytheInputStream, Fact0),
+    base64_string(Fact0.fact_value, FactValue),
+    put_dict(fact_value, Fact0, FactValue, Fact).
+read_kyfact(entries, KytheInputStream, Fact) :-
+    read_kythe_entry(KytheInputStream, Fact0),
+    phrase(utf8_codes(FactValueCodes), Fact0.fact_value), !,
+    string_codes(FactValue, FactValueCodes),
+    put_dict(fact_value, Fact0, FactValue, Fact).
+
 %! parse_and_process_module_fresh(+SrcFqn:atom, +KythePath:atom, -Symtab, +Modules0, -Modules) is det.
 parse_and_process_module_fresh(SrcFqn, KythePath, Opts, Symtab, Modules0, Modules) :-
     opts(Opts, [pythonpath(Pythonpaths)]),
@@ -796,8 +862,7 @@ parse_and_process_module_fresh(SrcFqn, KythePath, Opts, Symtab, Modules0, Module
     lookup_module(SrcFqn, SrcPath),
     do_if(true,
           format(user_error, 'Processing ~q (~q) to ~q~n', [SrcPath, SrcFqn, KythePath])),
-    run_parse_cmd(Opts, SrcPath, SrcFqn, ParsedPath),
-    read_nodes(ParsedPath, Pythonpaths, Nodes, Meta),
+    parse_module(Opts, SrcPath, SrcFqn, Pythonpaths, Nodes, Meta),
     do_if(false,
           dump_term('NODES', Nodes)),
     process_nodes(Nodes, src{src_fqn: SrcFqn, src: SrcPath},
@@ -806,12 +871,14 @@ parse_and_process_module_fresh(SrcFqn, KythePath, Opts, Symtab, Modules0, Module
           dump_term('EXPRS', Exprs, [indent_arguments(auto),
                                      right_margin(72)])),
     assign_exprs(Exprs, Meta, SrcFqn, Symtab, KytheFacts2, Modules0, Modules),
-    open(KythePath, write, KytheStream),
+    opts(Opts, [kytheout_format(KytheFormat)]),
+    kytheout_open_options(KytheFormat, OpenOptions),
+    open(KythePath, write, KytheStream, OpenOptions),
     % write(KytheStream, "%% === Kythe ==="), nl(KytheStream),
     symtab_as_kyfact(Symtab, Meta, SymtabKytheFact),
-    output_kyfact(KytheStream, SymtabKytheFact),
-    maplist(output_kyfact(KytheStream), KytheFacts),
-    maplist(output_kyfact(KytheStream), KytheFacts2),
+    output_kyfact(KytheFormat, KytheStream, SymtabKytheFact),
+    maplist(output_kyfact(KytheFormat, KytheStream), KytheFacts),
+    maplist(output_kyfact(KytheFormat, KytheStream), KytheFacts2),
     close(KytheStream).
 
 %! src_base(+SrcPath: atom, -SrcPathBase) is det.
@@ -824,71 +891,328 @@ src_base(SrcPath, SrcPathBase) :-
     ;  type_error(file_name_not_ending_in_py_or_pyi, SrcPath)
     ).
 
-%! run_parse_cmd(+Opts, +SrcPath, +SrcFqn, -OutPath) is det.
-%% Run the parse command into a temporary file. (The temp file is
-%% automatically deleted on graceful termination.)
-%% An alternative would be to run the parse command as a process, into
-%% a a pipe. This needs more memory, is more complicated to manage,
-%% and is a bit more difficult to debug.
-run_parse_cmd(Opts, SrcPath, SrcFqn, OutPath) :-
+%! parse_module(+Opts, +SrcPath, +SrcFqn, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Run the parser on SrcPath, either by running --parsecmd for just
+%% this module or by sending a request to the parse server (if
+%% --parse_server), and read the resulting nodes and meta-data.
+%% With --parse_server and --parse_stream, the statements are read
+%% directly from the server as process_nodes/5 needs them (see
+%% read_nodes_frames/4), so Nodes must be processed before the next
+%% request to the server.
+parse_module(Opts, SrcPath, SrcFqn, Pythonpaths, Nodes, Meta) :-
+    opts(Opts, [parse_server(ParseServer), parse_stream(ParseStream)]),
+    (  ParseServer == true, ParseStream == true
+    -> send_parse_request(Opts, SrcPath, SrcFqn, true, FromServer),
+       read_nodes_stream(FromServer, Pythonpaths, Nodes, Meta)
+    ;  ParseServer == true
+    -> run_parse_server(Opts, SrcPath, SrcFqn, FqnExpr),
+       setup_call_cleanup(open_string(FqnExpr, FqnExprStream),
+                          read_nodes_stream(FqnExprStream, Pythonpaths, Nodes, Meta),
+                          close(FqnExprStream))
+    ;  run_parse_cmd(Opts, SrcPath, SrcFqn, Pythonpaths, Nodes, Meta)
+    ).
+
+%! run_parse_cmd(+Opts, +SrcPath, +SrcFqn, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Run the parse command as a process (without a shell) and read its
+%% output (see read_nodes_all/4) through a pipe, as it's produced.
+%% With --keep_parse_output, the parse command instead writes its
+%% output to a file in that directory (SrcPath with ".fqn-json"
+%% appended to its path), which is kept for debugging, and the
+%% output is read from there.
+run_parse_cmd(Opts, SrcPath, SrcFqn, Pythonpaths, Nodes, Meta) :-
+    opts(Opts, [keep_parse_output(KeepDir)]),
+    (  KeepDir == ''
+    -> parse_cmd_exe_args(Opts, SrcPath, SrcFqn, '-', Exe, Args),
+       process_create(Exe, Args, [stdout(pipe(FqnExprStream)), process(Pid)]),
+       set_stream(FqnExprStream, encoding(utf8)),
+       (  catch(read_nodes_all(FqnExprStream, Pythonpaths, Nodes, Meta), Error, true)
+       -> true
+       ;  Error = read_nodes_failed
+       ),
+       close(FqnExprStream),
+       process_wait(Pid, Status),
+       must_once_msg(Status == exit(0), 'Parse failed: ~q', [Status]),
+       must_once_msg(var(Error), 'Invalid output from parser: ~q', [Error])
+    ;  atomic_list_concat([KeepDir, SrcPath, '.fqn-json'], OutPath),
+       directory_file_path(OutPathDir, _, OutPath),
+       make_directory_path(OutPathDir),
+       parse_cmd_exe_args(Opts, SrcPath, SrcFqn, OutPath, Exe, Args),
+       process_create(Exe, Args, [process(Pid)]),
+       process_wait(Pid, Status),
+       must_once_msg(Status == exit(0), 'Parse failed: ~q', [Status]),
+       read_nodes(OutPath, Pythonpaths, Nodes, Meta)
+    ).
+
+%! parse_cmd_exe_args(+Opts, +SrcPath, +SrcFqn, +OutPath, -Exe, -Args:list) is det.
+%% The executable and arguments for running --parsecmd on SrcPath,
+%% with the output going to OutPath ('-' for stdout). Each option
+%% value is a single argument (--opt=Value), so it doesn't need any
+%% quoting.
+parse_cmd_exe_args(Opts, SrcPath, SrcFqn, OutPath, Exe, Args) :-
     must_once_msg(ground(Opts), 'Invalid command line options', []),
-    opts(Opts, [python_version(PythonVersion), parsecmd(ParseCmd), kythe_corpus(KytheCorpus), kythe_root(KytheRoot)]),
+    opts(Opts, [python_version(PythonVersion), kythe_corpus(KytheCorpus), kythe_root(KytheRoot), parse_stream(ParseStream), parse_format(ParseFormat)]),
     must_once_msg(memberchk(PythonVersion, [2, 3]), 'Invalid Python version: ~q', [PythonVersion]),
-    tmp_file_stream(OutPath, OutPathStream, [encoding(binary), extension('fqn-json')]),
-    close(OutPathStream),
-    atomic_list_concat(
-            [ParseCmd,
-             " --kythe_corpus='", KytheCorpus, "'",
-             " --kythe_root='", KytheRoot, "'",
-             " --python_version='", PythonVersion, "'",
-             " --srcpath='", SrcPath, "'",
-             " --module='", SrcFqn, "'",
-             " --out_fqn_expr='", OutPath, "'"],
-            Cmd),
-    do_if(false, dump_term('CMD', Cmd)),
-    must_once_msg(shell(Cmd, 0), 'Parse failed', []).
+    parse_cmd_exe(Opts, Exe, Args0),
+    (  ParseStream == true
+    -> StreamStmtsArgs = ['--stream_stmts']
+    ;  StreamStmtsArgs = []
+    ),
+    maplist([Name-Value, Arg]>>atomic_list_concat(['--', Name, '=', Value], Arg),
+            [kythe_corpus-KytheCorpus,
+             kythe_root-KytheRoot,
+             python_version-PythonVersion,
+             srcpath-SrcPath,
+             module-SrcFqn,
+             out_fqn_expr-OutPath,
+             out_format-ParseFormat],
+            OptArgs),
+    append([Args0, OptArgs, StreamStmtsArgs], Args),
+    do_if(false, dump_term('CMD', [Exe|Args])).
+
+%! parse_cmd_exe(+Opts, -Exe, -Args:list) is det.
+%% Split --parsecmd (e.g., "python3.7 -B -m pykythe") into the
+%% executable (for process_create/3) and its arguments.
+parse_cmd_exe(Opts, Exe, Args) :-
+    opts(Opts, [parsecmd(ParseCmd)]),
+    atomic_list_concat(ParseCmdParts, ' ', ParseCmd),
+    exclude(==(''), ParseCmdParts, [Exe0|Args]),
+    (  is_absolute_file_name(Exe0)
+    -> Exe = Exe0
+    ;  Exe = path(Exe0)
+    ).
+
+%! run_parse_server(+Opts, +SrcPath, +SrcFqn, -FqnExpr:string) is det.
+%% Send a request to the parse server (see parse_server/3) and return
+%% the result, which has the same contents as the output from
+%% run_parse_cmd/6.  The request is a line of JSON; the response is a
+%% header line ("fqn_expr <length>" or "error <length>") followed by
+%% <length> bytes of UTF-8 (see pykythe/__main__.py).
+run_parse_server(Opts, SrcPath, SrcFqn, FqnExpr) :-
+    send_parse_request(Opts, SrcPath, SrcFqn, false, FromServer),
+    read_line_to_string(FromServer, Header),
+    must_once_msg(split_string(Header, " ", "", [Status, LengthStr]),
+                  'Invalid response from parse server: ~q', [Header]),
+    number_string(Length, LengthStr),
+    read_utf8_bytes(FromServer, Length, FqnExpr),
+    must_once_msg(Status == "fqn_expr", 'Parse failed: ~s', [FqnExpr]).
+
+%! send_parse_request(+Opts, +SrcPath, +SrcFqn, +StreamStmts:boolean, -FromServer) is det.
+%% Send a request to the parse server (see parse_server/3), returning
+%% the stream for reading the response. If StreamStmts is true, the
+%% response is framed records (see read_nodes_frames/4); otherwise
+%% it's a single frame (see run_parse_server/4).
+send_parse_request(Opts, SrcPath, SrcFqn, StreamStmts, FromServer) :-
+    must_once_msg(ground(Opts), 'Invalid command line options', []),
+    opts(Opts, [python_version(PythonVersion), kythe_corpus(KytheCorpus), kythe_root(KytheRoot), parse_format(ParseFormat)]),
+    must_once_msg(memberchk(PythonVersion, [2, 3]), 'Invalid Python version: ~q', [PythonVersion]),
+    parse_server(Opts, ToServer, FromServer),
+    Request0 = json{srcpath: SrcPath,
+                    module: SrcFqn,
+                    kythe_corpus: KytheCorpus,
+                    kythe_root: KytheRoot,
+                    python_version: PythonVersion,
+                    out_format: ParseFormat},
+    (  StreamStmts == true
+    -> put_dict(stream_stmts, Request0, true, Request)
+    ;  Request = Request0
+    ),
+    json_write_dict(ToServer, Request, [width(0)]),
+    nl(ToServer),
+    flush_output(ToServer).
+
+%! parse_server(+Opts, -ToServer, -FromServer) is det.
+%% Get the streams for sending requests to the parse server and
+%% reading the results, starting the server if it isn't already
+%% running. The server is --parsecmd with --serve added; it is
+%% started only once and then used for all modules (the Python
+%% interpreter startup and loading the grammar often take longer than
+%% parsing a single file).
+parse_server(Opts, ToServer, FromServer) :-
+    (  nb_current(pykythe_parse_server, parse_server(_Pid, ToServer0, FromServer0))
+    -> ToServer = ToServer0,
+       FromServer = FromServer0
+    ;  parse_cmd_exe(Opts, Exe, Args0),
+       append(Args0, ['--serve'], Args),
+       process_create(Exe, Args,
+                      [stdin(pipe(ToServer)), stdout(pipe(FromServer)), process(Pid)]),
+       set_stream(ToServer, encoding(utf8)),
+       set_stream(FromServer, encoding(utf8)),
+       nb_setval(pykythe_parse_server, parse_server(Pid, ToServer, FromServer))
+    ).
+
+%! stop_parse_server is det.
+%% If the parse server was started (see parse_server/3), stop it by
+%% closing its input and waiting for it to finish.
+stop_parse_server :-
+    (  nb_current(pykythe_parse_server, parse_server(Pid, ToServer, FromServer))
+    -> nb_delete(pykythe_parse_server),
+       close(ToServer),
+       close(FromServer),
+       process_wait(Pid, Status),
+       must_once_msg(Status == exit(0), 'Parse server failed: ~q', [Status])
+    ;  true
+    ).
 
 %! symtab_as_kyfact(+Symtab, +Meta, -KytheFactAsJsonDict) is det.
 %% Convert the symtab into a Kythe fact.
 symtab_as_kyfact(Symtab, Meta,
                  json{source: Source,
                       fact_name: '/pykythe/symtab',
-                      fact_value: SymtabStr64}) :-
+                      fact_value: SymtabStr}) :-
     term_string(Symtab, SymtabStr),
     % TODO: the following is dup-ed from kyfile//0 but
     %       with Language specified
-    base64(SymtabStr, SymtabStr64),
     Source = json{path: Meta.path, language: Meta.language}.
 
 %! read_nodes(+FqnExprPath:atom, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
-%% Read the JSON node tree (with FQNs) into Nodes and file meta-data into Meta.
+%% Read the JSON node tree (with FQNs) into Nodes and file meta-data
+%% into Meta, from a file (see read_nodes_all/4).
 read_nodes(FqnExprPath, Pythonpaths, Nodes, Meta) :-
-    open(FqnExprPath, read, FqnExprStream),
-    my_json_read_dict(FqnExprStream, MetaDict),
-    my_json_read_dict(FqnExprStream, JsonDict),
-    simplify_meta(MetaDict, Pythonpaths, Meta),
-    % json_read_dict doesn't consume the final '\n'
+    setup_call_cleanup(open(FqnExprPath, read, FqnExprStream),
+                       read_nodes_all(FqnExprStream, Pythonpaths, Nodes, Meta),
+                       close(FqnExprStream)).
+
+%! read_nodes_all(+FqnExprStream, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Read the JSON node tree (with FQNs) into Nodes and file meta-data
+%% into Meta (see read_nodes_stream/4), reading all the statements,
+%% so that the stream can be closed (for --stream_stmts output, they
+%% would otherwise be read lazily; see read_nodes_frames/4).
+read_nodes_all(FqnExprStream, Pythonpaths, Nodes, Meta) :-
+    read_nodes_stream(FqnExprStream, Pythonpaths, Nodes, Meta),
+    get_dict(stmts, Nodes, Stmts),
+    length(Stmts, _).
+
+%! read_nodes_stream(+FqnExprStream, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Read the JSON node tree (with FQNs) from a stream (see read_nodes/4).
+%% The stream has either two JSON items (meta-data and node tree), or
+%% the same as two Prolog terms (from --out_format=prolog, starting
+%% with the quoted tag of 'Meta'{...}), or framed records (from
+%% --stream_stmts; see read_nodes_frames/4).
+read_nodes_stream(FqnExprStream, Pythonpaths, Nodes, Meta) :-
+    peek_char(FqnExprStream, FirstChar),
+    (  FirstChar == '{'
+    -> read_nodes_json(FqnExprStream, Pythonpaths, Nodes, Meta)
+    ;  FirstChar == '\''
+    -> read_nodes_terms(FqnExprStream, Pythonpaths, Nodes, Meta)
+    ;  read_nodes_frames(FqnExprStream, Pythonpaths, Nodes, Meta)
+    ).
+
+%! read_nodes_json(+FqnExprStream, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Read the meta-data and the JSON node tree, each as a single JSON item.
+read_nodes_json(FqnExprStream, Pythonpaths, Nodes, Meta) :-
+    read_fqn_expr_json(FqnExprStream, MetaTerm),
+    read_fqn_expr_json(FqnExprStream, Nodes),
+    simplify_meta(MetaTerm, Pythonpaths, Meta),
+    % read_fqn_expr_json doesn't consume the final '\n'
     read_string(FqnExprStream, 1, LastChar),
     must_once(LastChar == "\n"),
     must_once(
-        at_end_of_stream(FqnExprStream)),
-    do_if(false,
-        dump_term('JSON_DICT', JsonDict)),
-    simplify_json(JsonDict, Nodes).
-
-%! simplify_meta(+MetaDictJson:dict, +Pythonpaths:list, -Meta:dict) is det.
-%% Simplify the file meta-data. The argument is the Prolog dict form
-%% of the first JSON item (see ast_cooked.Meta).
-simplify_meta(MetaDictJson, Pythonpaths, Meta) :-
-    %% Note that my_json_read_dict/2 sets the tag to 'json'.
-    MetaDictJson = json{kind: "Meta",
-        slots: json{
-            kythe_corpus: json{kind: "str", value: KytheCorpus},
-            kythe_root: json{kind: "str", value: KytheRoot},
-            path: json{kind: "str", value: Path},
-            language: json{kind: "str", value: Language},
-            contents_b64: json{kind: "str", value: ContentsB64},
-            encoding: json{kind: "str", value: Encoding}}},
+        at_end_of_stream(FqnExprStream)).
+
+%! read_nodes_terms(+FqnExprStream, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Read the meta-data and the node tree, each as a Prolog term that's
+%% already in the form that read_fqn_expr_json/2 produces (see
+%% pod.PlainOldDataExtended.write_prolog).
+read_nodes_terms(FqnExprStream, Pythonpaths, Nodes, Meta) :-
+    read_fqn_expr_term(FqnExprStream, MetaTerm),
+    read_fqn_expr_term(FqnExprStream, Nodes),
+    simplify_meta(MetaTerm, Pythonpaths, Meta),
+    read_term(FqnExprStream, EndOfFile, []),
+    must_once(EndOfFile == end_of_file).
+
+%! read_fqn_expr_term(+FqnExprStream, -Term) is det.
+%% Read an item of --out_format=prolog output. The strings in it are
+%% read as strings, regardless of the double_quotes flag.
+read_fqn_expr_term(FqnExprStream, Term) :-
+    read_term(FqnExprStream, Term, [double_quotes(string)]),
+    must_once_msg(Term \== end_of_file, 'Unexpected end of output from parser', []).
+
+%! read_nodes_frames(+FqnExprStream, +Pythonpaths:list, -Nodes, -Meta:dict) is det.
+%% Read the framed records from --stream_stmts (see _fqn_expr_frames
+%% in pykythe/__main__.py): the meta-data, the FileInput node (with
+%% empty stmts), one record per top-level statement, and "end".  The
+%% statements are a lazy list, which is read as process_nodes/5 needs
+%% it, so that processing can start while the parser is still
+%% converting the rest of the file; the list must be completely
+%% consumed before anything else is read from FqnExprStream.
+read_nodes_frames(FqnExprStream, Pythonpaths, Nodes, Meta) :-
+    read_frame_item(FqnExprStream, meta, MetaTerm),
+    simplify_meta(MetaTerm, Pythonpaths, Meta),
+    read_frame_item(FqnExprStream, file_input, Nodes0),
+    lazy_list(read_stmt_frame(FqnExprStream), Stmts),
+    put_dict(stmts, Nodes0, Stmts, Nodes).
+
+%! read_stmt_frame(+FqnExprStream, -List, -Tail) is det.
+%% Callback for lazy_list/2: read the next statement record, or the
+%% "end" record, which ends the list.
+read_stmt_frame(FqnExprStream, List, Tail) :-
+    read_frame(FqnExprStream, Kind, Payload),
+    (  Kind == stmt
+    -> setup_call_cleanup(open_string(Payload, PayloadStream),
+                          read_fqn_expr_item(PayloadStream, Stmt),
+                          close(PayloadStream)),
+       List = [Stmt|Tail]
+    ;  must_once_msg(Kind == end, 'Unexpected record from parser: ~q', [Kind]),
+       List = [],
+       Tail = []
+    ).
+
+%! read_frame_item(+FqnExprStream, +Kind:atom, -Term) is det.
+%% Read a record, which must be of the given Kind (see
+%% read_fqn_expr_item/2).
+read_frame_item(FqnExprStream, Kind, Term) :-
+    read_frame(FqnExprStream, Kind0, Payload),
+    must_once_msg(Kind0 == Kind, 'Expected ~q record from parser, got: ~q', [Kind, Kind0]),
+    setup_call_cleanup(open_string(Payload, PayloadStream),
+                       read_fqn_expr_item(PayloadStream, Term),
+                       close(PayloadStream)).
+
+%! read_fqn_expr_item(+PayloadStream, -Term) is det.
+%% Read the payload of a record: JSON (simplified by
+%% read_fqn_expr_json/2) or, from --out_format=prolog, a term.
+read_fqn_expr_item(PayloadStream, Term) :-
+    peek_char(PayloadStream, FirstChar),
+    (  FirstChar == '{'
+    -> read_fqn_expr_json(PayloadStream, Term)
+    ;  read_fqn_expr_term(PayloadStream, Term)
+    ).
+
+%! read_frame(+FqnExprStream, -Kind:atom, -Payload:string) is det.
+%% Read a record: a header line "<kind> <length>" followed by <length>
+%% bytes of UTF-8. An "error" record (the parser failed) is an error here.
+read_frame(FqnExprStream, Kind, Payload) :-
+    read_line_to_string(FqnExprStream, Header),
+    must_once_msg(split_string(Header, " ", "", [KindStr, LengthStr]),
+                  'Invalid record from parser: ~q', [Header]),
+    number_string(Length, LengthStr),
+    read_utf8_bytes(FqnExprStream, Length, Payload),
+    atom_string(Kind, KindStr),
+    must_once_msg(Kind \== error, 'Parse failed: ~s', [Payload]).
+
+%! read_utf8_bytes(+Stream, +Length:integer, -String) is det.
+%% Read Length bytes from Stream (a UTF-8 text stream) and decode them.
+%% The frame lengths from pykythe/__main__.py are in bytes, which
+%% aren't the same as characters if there's any non-ASCII text, so
+%% the bytes are read with the stream's encoding set to octet.
+read_utf8_bytes(Stream, Length, String) :-
+    setup_call_cleanup(set_stream(Stream, encoding(octet)),
+                       read_string(Stream, Length, Octets),
+                       set_stream(Stream, encoding(utf8))),
+    string_codes(Octets, Bytes),
+    phrase(utf8_codes(Codes), Bytes), !,
+    string_codes(String, Codes).
+
+%! simplify_meta(+MetaTerm:dict, +Pythonpaths:list, -Meta:dict) is det.
+%% Simplify the file meta-data. The argument is the first JSON item
+%% (see ast_cooked.Meta), as read by read_fqn_expr_json/2.
+simplify_meta(MetaTerm, Pythonpaths, Meta) :-
+    MetaTerm = 'Meta'{
+        kythe_corpus: str(KytheCorpus),
+        kythe_root: str(KytheRoot),
+        path: str(Path),
+        language: str(Language),
+        contents_b64: str(ContentsB64),
+        encoding: str(Encoding)},
     canonical_path(Path, CanonicalPath),
     %% For debugging, might want to use the value "LS0t", derived from:
     %%     base64('---', 'LS0t').
@@ -901,31 +1225,6 @@ simplify_meta(MetaDictJson, Pythonpaths, Meta) :-
         file_contents_b64: ContentsB64,
         pythonpaths: Pythonpaths}.
 
-%! simplify_json(+Json, -Prolog) is det.
-%% Simplify the JSON term into more specific dicts, each one
-%% distinguished by its tag. The input dicts for base types (str, int,
-%% etc.) are turned into simpler functors.
-simplify_json([], []).
-simplify_json([V|Vs], Values) :-
-    maplist(simplify_json, [V|Vs], Values).
-simplify_json(json{kind: "str", value: Value}, str(Value)).
-simplify_json(json{kind: "int", value: Value}, int(Value)).
-simplify_json(json{kind: "bool", value: Value}, bool(Value)).
-simplify_json(json{kind: "None"}, none).  % Shouldn't be generated by pod.PlainOldDataExtended.make_json_dict
-simplify_json(json{kind: "dict", items: Items}, Value) :-
-    dict_pairs(Items, _, ItemPairs),
-    maplist(simplify_json_slot_pair, ItemPairs, ItemPairs2),
-    dict_pairs(Value, dict, ItemPairs2).
-simplify_json(json{kind: Kind, slots: Slots}, Value) :-
-    dict_pairs(Slots, _, SlotPairs),
-    maplist(simplify_json_slot_pair, SlotPairs, SlotPairs2),
-    atom_string(KindAtom, Kind),
-    dict_pairs(Value, KindAtom, SlotPairs2).
-
-%! simplify_json_slot_pair(+KeyValue:pair, -KeyValue2:pair) is det.
-simplify_json_slot_pair(Key-Value, Key-Value2) :-
-    simplify_json(Value, Value2).
-
 %! process_nodes(+Nodes, +SrcInfo:dict, -KytheFacts:list, -Exprs:list, +Meta:dict) is det.
 %% Wrapper for process_nodes//[kyfact, expr, file_meta].
 %% TODO: separate KytheFacts into those that require de-duping and
@@ -1646,20 +1945,20 @@ kyfacts(Vname, [FactName-FactValue|FactValues]) -->>
 
 %! kyfact(+Source, +FactName, +FactValue)//[kyfact, file_meta] is det.
 %% Low-level create a Kythe fact or edge -- for Source, corpus and root
-%% are filled in from file_meta.
+%% are filled in from file_meta. The fact value is encoded (base64 or
+%% UTF-8) when it's output (see output_kyfact/3).
+%% The accumulator takes care of duplicate removal.
 kyfact(Source, FactName, FactValue) -->>
-    { base64(FactValue, FactBase64) },
-    kyfact_b64(Source, FactName, FactBase64).
+    Meta/file_meta,
+    { put_dict([corpus=Meta.kythe_corpus, root=Meta.kythe_root],
+               Source, Source2) },
+    [ json{source: Source2, fact_name: FactName, fact_value: FactValue} ]:kyfact.
 
 %! kyfact_64(+Source, +FactName, +FactBase64)//[kyfact, file_meta] is det.
 %% Low-level create a Kythe fact or edge inputting the base64 of the
-%% fact value -- for Source, corpus and root are filled in from file_meta.
-%% The accumulator takes care of duplicate removal.
+%% fact value (e.g., the file contents from the parser).
 kyfact_b64(Source, FactName, FactBase64) -->>
-    Meta/file_meta,
-    { put_dict([corpus=Meta.kythe_corpus, root=Meta.kythe_root],
-               Source, Source2) },
-    [ json{source: Source2, fact_name: FactName, fact_value: FactBase64} ]:kyfact.
+    kyfact(Source, FactName, base64(FactBase64)).
 
 %! signature_source(+Signature:string, -Source)//[file_meta] is det.
 %% Create a Kythe "source" tuple from a Signature string.
@@ -1683,14 +1982,27 @@ signature_node(Signature, Vname) -->>
     Meta/file_meta,
     { Vname = json{signature: Signature, language: Meta.language} }.
 
-%! output_kyfact(+KytheStream:stream, +AnchorAsDict:json_dict) is det.
-%% Output a single Kythe fact.
-output_kyfact(KytheStream, AnchorAsDict) :-
+%! output_kyfact(+KytheFormat:atom, +KytheStream:stream, +AnchorAsDict:json_dict) is det.
+%% Output a single Kythe fact, in the format given by --kytheout_format.
+output_kyfact(json, KytheStream, AnchorAsDict) :-
+    (  get_dict(fact_value, AnchorAsDict, FactValue)
+    -> fact_value_base64(FactValue, FactBase64),
+       put_dict(fact_value, AnchorAsDict, FactBase64, AnchorAsDict2)
+    ;  AnchorAsDict2 = AnchorAsDict
+    ),
     %% The tags are ignored unless option tag(type) is specified
     %% (which it isn't). All dicts should have the tag 'json', for
     %% simplicity.
-    json_write_dict(KytheStream, AnchorAsDict, [width(0)]),
+    json_write_dict(KytheStream, AnchorAsDict2, [width(0)]),
     nl(KytheStream).
+output_kyfact(entries, KytheStream, AnchorAsDict) :-
+    write_kythe_entry(KytheStream, AnchorAsDict).
+
+%! fact_value_base64(+FactValue, -FactBase64) is det.
+%% The base64 of a fact value (see kyfact//3 and kyfact_b64//3).
+fact_value_base64(base64(FactBase64), FactBase64) :- !.
+fact_value_base64(FactValue, FactBase64) :-
+    base64(FactValue, FactBase64).
 
 %%%%%%        %%%%%%%
 %%%%%% Pass 2 %%%%%%%
@@ -0,0 +1,335 @@
+"""A faster replacement for lib2to3.pgen2.tokenize.generate_tokens.
+
+lib2to3's tokenizer reads the source a line at a time and, for each
+token, runs its `pseudoprog` regexp and then a chain of tests on the
+token's text to find out what kind of token it is, yielding each token
+from a generator. This is a large part of the time that ast_raw.parse
+takes (e.g., over a third for ast_raw.py).
+
+generate_tokens here produces exactly the same token stream (the same
+5-tuples, including ERRORTOKEN, the async/await handling and the
+exceptions for bad input), but:
+  - it splits the source into lines with a single regexp;
+  - it matches tokens with one precompiled regexp that is lib2to3's
+    `pseudoprog` with a named group for each alternative, so the
+    kind of token is given by the match's `lastgroup` instead of by
+    testing the token's text, and with extra alternatives in front
+    that quickly match the most common tokens (see _token_re);
+  - it appends the tokens to a list per line (or per multi-line
+    string) and emits the lists, which are flattened by
+    itertools.chain.
+
+The regexps are made from lib2to3's own definitions, so that the
+tokens are the same as with the installed lib2to3 (e.g., the `:=`
+operator is only recognized by newer versions). The differential test
+in tests/test_pykythe.py (TestTokenizer) compares the two tokenizers
+on test_data and the standard library.
+"""
+
+import itertools
+import re
+from lib2to3.pgen2 import tokenize
+from lib2to3.pgen2.token import (ASYNC, AWAIT, COMMENT, DEDENT, ENDMARKER,
+                                 ERRORTOKEN, INDENT, NAME, NEWLINE, NL,
+                                 NUMBER, OP, STRING)
+from typing import (Any, Dict, Iterator, List, Optional, Pattern, Text, Tuple,
+                    cast)
+
+# The same as lib2to3's tokens:
+#   (type, value, (start_row, start_col), (end_row, end_col), line)
+Token = Tuple[int, Text, Tuple[int, int], Tuple[int, int], Text]
+
+# lib2to3.pgen2.tokenize's regexps and tables, which aren't in its
+# typeshed stubs:
+_lib2to3_tokenize = cast(Any, tokenize)
+_ENDPROGS = cast(Dict[Text, Optional[Pattern[Text]]],
+                 _lib2to3_tokenize.endprogs)
+_TABSIZE = cast(int, _lib2to3_tokenize.tabsize)
+
+
+def generate_tokens(src_str: Text, first_lineno: int = 1) -> Iterator[Token]:
+    """Tokenize a string, for driver.Driver.parse_tokens.
+
+    This gives the same tokens as
+    `tokenize.generate_tokens(io.StringIO(src_str).readline)`, except
+    that if `first_lineno` isn't 1, the line numbers (including those
+    in exceptions) are shifted as if `src_str` started at line
+    `first_lineno` (see ast_raw.parse_str).
+    """
+    return itertools.chain.from_iterable(
+        generate_token_batches(src_str, first_lineno))
+
+
+def generate_token_batches(src_str: Text,
+                           first_lineno: int = 1) -> Iterator[List[Token]]:
+    """Tokenize a string, yielding lists of tokens.
+
+    See generate_tokens, which concatenates the lists. This is a
+    transliteration of lib2to3.pgen2.tokenize.generate_tokens; the
+    comments there explain the logic.
+    """
+    # pylint: disable=too-many-branches,too-many-statements,too-many-locals
+    # pylint: disable=too-many-nested-blocks
+    lines = _LINE_RE.findall(src_str)
+    lines.append('')  # EOF, as returned by readline()
+    token_match = _TOKEN_RE.match
+    indent_match = _INDENT_RE.match
+    endprogs = _ENDPROGS
+
+    lnum = first_lineno - 1
+    parenlev = 0
+    continued = False
+    contstr, needcont = '', False
+    contline = ''
+    strstart = (0, 0)
+    endprog: Optional[Pattern[Text]] = None
+    indents = [0]
+
+    # 'stashed' and 'async_*' are used for async/await parsing
+    stashed: Optional[Token] = None
+    async_def = False
+    async_def_indent = 0
+    async_def_nl = False
+
+    for line in lines:
+        lnum += 1
+        pos, max_pos = 0, len(line)
+        batch = []  # type: List[Token]
+        append = batch.append
+
+        if contstr:  # continued string
+            if not line:
+                raise tokenize.TokenError('EOF in multi-line string',
+                                          strstart)
+            endmatch = endprog.match(line)  # type: ignore
+            if endmatch:
+                pos = end = endmatch.end(0)
+                append((STRING, contstr + line[:end], strstart, (lnum, end),
+                        contline + line))
+                contstr, needcont = '', False
+                contline = ''
+            elif (needcont and line[-2:] != '\\\n' and
+                  line[-3:] != '\\\r\n'):
+                append((ERRORTOKEN, contstr + line, strstart,
+                        (lnum, len(line)), contline))
+                contstr = ''
+                contline = ''
+                yield batch
+                continue
+            else:
+                contstr += line
+                contline += line
+                continue
+
+        elif parenlev == 0 and not continued:  # new statement
+            if not line:
+                break
+            indent_m = indent_match(line)
+            assert indent_m  # _INDENT_RE also matches ''
+            indent = indent_m.group()
+            pos = len(indent)
+            if pos == max_pos:
+                break
+            if ' ' * pos == indent:
+                column = pos
+            else:
+                column = 0
+                for char in indent:
+                    if char == ' ':
+                        column += 1
+                    elif char == '\t':
+                        column = (column // _TABSIZE + 1) * _TABSIZE
+                    else:  # '\f'
+                        column = 0
+
+            if stashed:
+                append(stashed)
+                stashed = None
+
+            if line[pos] in '#\r\n':  # skip comments or blank lines
+                if line[pos] == '#':
+                    comment_token = line[pos:].rstrip('\r\n')
+                    nl_pos = pos + len(comment_token)
+                    append((COMMENT, comment_token, (lnum, pos),
+                            (lnum, nl_pos), line))
+                    append((NL, line[nl_pos:], (lnum, nl_pos),
+                            (lnum, len(line)), line))
+                else:
+                    append((NL, line[pos:], (lnum, pos), (lnum, len(line)),
+                            line))
+                yield batch
+                continue
+
+            if column > indents[-1]:  # count indents or dedents
+                indents.append(column)
+                append((INDENT, line[:pos], (lnum, 0), (lnum, pos), line))
+            while column < indents[-1]:
+                if column not in indents:
+                    yield batch
+                    raise IndentationError(
+                        'unindent does not match any outer indentation level',
+                        ('<tokenize>', lnum, pos, line))
+                indents = indents[:-1]
+
+                if async_def and async_def_indent >= indents[-1]:
+                    async_def = False
+                    async_def_nl = False
+                    async_def_indent = 0
+
+                append((DEDENT, '', (lnum, pos), (lnum, pos), line))
+
+            if async_def and async_def_nl and async_def_indent >= indents[-1]:
+                async_def = False
+                async_def_nl = False
+                async_def_indent = 0
+
+        else:  # continued statement
+            if not line:
+                raise tokenize.TokenError('EOF in multi-line statement',
+                                          (lnum, 0))
+            continued = False
+
+        while pos < max_pos:
+            match = token_match(line, pos)
+            if not match:
+                append((ERRORTOKEN, line[pos], (lnum, pos), (lnum, pos + 1),
+                        line))
+                pos += 1
+                continue
+            kind = match.lastgroup
+            start = match.start(kind)  # type: ignore  # never None
+            pos = match.end()
+            token = line[start:pos]
+
+            if kind == 'name' or (kind == 'other_name' and
+                                  token[0].isidentifier()):
+                tok = (NAME, token, (lnum, start), (lnum, pos), line)
+                if token in _ASYNC_NAMES:
+                    if token in ('async', 'await'):
+                        if async_def:
+                            append((ASYNC if token == 'async' else AWAIT,
+                                    token, (lnum, start), (lnum, pos), line))
+                            continue
+                        if token == 'async' and not stashed:
+                            stashed = tok
+                            continue
+                    elif (stashed and stashed[0] == NAME and
+                          stashed[1] == 'async'):  # 'def' or 'for'
+                        if token == 'def':
+                            async_def = True
+                            async_def_indent = indents[-1]
+                        append((ASYNC, stashed[1], stashed[2], stashed[3],
+                                stashed[4]))
+                        stashed = None
+                if stashed:
+                    append(stashed)
+                    stashed = None
+                append(tok)
+                continue
+
+            if stashed:
+                append(stashed)
+                stashed = None
+            if kind == 'funny' or kind == 'other_funny':
+                initial = token[0]
+                if initial in '\r\n':
+                    if parenlev > 0:
+                        append((NL, token, (lnum, start), (lnum, pos), line))
+                    else:
+                        if async_def:
+                            async_def_nl = True
+                        append((NEWLINE, token, (lnum, start), (lnum, pos),
+                                line))
+                else:
+                    if initial in '([{':
+                        parenlev += 1
+                    elif initial in ')]}':
+                        parenlev -= 1
+                    append((OP, token, (lnum, start), (lnum, pos), line))
+            elif kind == 'number':
+                # lib2to3 only treats a token as a number if it starts
+                # with an ASCII digit or '.' (not, e.g., '٣.5').
+                append((NUMBER if token[0] in _NUMBER_START else OP, token,
+                        (lnum, start), (lnum, pos), line))
+            elif kind == 'contstr':
+                if token[-1] == '\n':  # continued string
+                    strstart = (lnum, start)
+                    endprog = (endprogs[token[0]] or endprogs[token[1]] or
+                               endprogs[token[2]])
+                    contstr, needcont = line[start:], True
+                    contline = line
+                    break
+                append((STRING, token, (lnum, start), (lnum, pos), line))
+            elif kind == 'comment':
+                append((COMMENT, token, (lnum, start), (lnum, pos), line))
+            elif kind == 'triple':
+                endprog = endprogs[token]
+                endmatch = endprog.match(line, pos)  # type: ignore
+                if endmatch:  # all on one line
+                    pos = endmatch.end(0)
+                    append((STRING, line[start:pos], (lnum, start),
+                            (lnum, pos), line))
+                else:  # multiple lines
+                    strstart = (lnum, start)
+                    contstr = line[start:]
+                    contline = line
+                    break
+            elif kind == 'cont':  # backslash continuation
+                append((NL, token, (lnum, start), (lnum, pos), line))
+                continued = True
+            else:  # 'other_name' that isn't an identifier, e.g., '½'
+                append((OP, token, (lnum, start), (lnum, pos), line))
+        yield batch
+
+    batch = []
+    if stashed:
+        batch.append(stashed)
+    for _ in indents[1:]:  # pop remaining indent levels
+        batch.append((DEDENT, '', (lnum, 0), (lnum, 0), ''))
+    batch.append((ENDMARKER, '', (lnum, 0), (lnum, 0), ''))
+    yield batch
+
+
+def _token_re() -> Pattern[Text]:
+    """Make lib2to3's `pseudoprog`, with a named group per alternative.
+
+    The 'name' and 'funny' alternatives are for the most common tokens
+    (names, operators, brackets and newlines); they're followed by
+    lib2to3's alternatives in the same order as in `pseudoprog`, so the
+    regexp matches the same text as `pseudoprog`, but most tokens are
+    found by the first or second alternative. (The first alternatives
+    exclude the text that one of lib2to3's earlier alternatives could
+    match: 'name' only matches names that start with an ASCII letter
+    or '_' and that aren't a possible string prefix; 'funny' excludes
+    a number such as '.5'.)
+
+    `lastgroup` gives the kind of token. The 'triple' and 'contstr'
+    alternatives only match strings whose prefixes are in
+    `tokenize.triple_quoted` and `tokenize.single_quoted`.
+    """
+    return re.compile(_lib2to3_tokenize.Whitespace + '(?:' + '|'.join(
+        '(?P<{}>{})'.format(name, regexp) for name, regexp in (
+            ('name', r"""(?![uUrRbBfF]{1,2}['"])[A-Za-z_]\w*"""),
+            ('funny', r'(?!\.\d)' + _lib2to3_tokenize.Funny),
+            # lib2to3's alternatives:
+            ('cont', r'\\\r?\n'),
+            ('comment', _lib2to3_tokenize.Comment),
+            ('triple', _lib2to3_tokenize.Triple),
+            ('number', _lib2to3_tokenize.Number),
+            ('other_funny', _lib2to3_tokenize.Funny),
+            ('contstr', _lib2to3_tokenize.ContStr),
+            ('other_name', _lib2to3_tokenize.Name),
+        )) + ')')
+
+
+_TOKEN_RE = _token_re()
+
+_NUMBER_START = frozenset('0123456789.')
+
+_ASYNC_NAMES = frozenset(['async', 'await', 'def', 'for'])
+
+_INDENT_RE = re.compile(r'[ \t\f]*')
+
+# Lines as returned by io.StringIO(src_str).readline, which only
+# splits at '\n' (unlike str.splitlines).
+_LINE_RE = re.compile(r'[^\n]*\n|[^\n]+')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3.7
+"""Benchmark collapsing single-child nodes in ast_raw._convert.
+
+Parses a file with and without the collapsing of the node types in
+ast_raw._EXPR_NODES, and compares the number of parse tree nodes and
+the times for parsing and for converting to ast_cooked nodes
+(ast_raw.cvt_parse_tree). The ast_cooked results are the same either
+way.
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_collapse.py [SRCPATH [REPEAT]]
+"""
+
+import gc
+import os
+import sys
+import time
+from lib2to3 import pytree
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pykythe import ast, ast_raw  # pylint: disable=wrong-import-position
+
+_DEFAULT_SRCPATH = os.path.join(
+    os.path.dirname(__file__), '..', 'test_data', 'py3_test_grammar.py')
+
+
+def _count_nodes(node: pytree.Base) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def main() -> None:
+    srcpath = sys.argv[1] if len(sys.argv) > 1 else _DEFAULT_SRCPATH
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with open(srcpath, 'rb') as src_f:
+        content = src_f.read()
+    src_file = ast.make_file(path=srcpath, content=content, encoding='utf-8')
+    expr_nodes = ast_raw._EXPR_NODES  # pylint: disable=protected-access
+    configs = [('no collapse', frozenset()), ('collapse', expr_nodes)]
+    nodes = {name: 0 for name, _ in configs}
+    cooked_json = {name: '' for name, _ in configs}
+    best = {name: [float('inf')] * 2 for name, _ in configs}
+    # The configurations are alternated, to even out effects such as
+    # garbage collection of the previous parse tree.
+    for _ in range(repeat):
+        for name, collapse in configs:
+            ast_raw._EXPR_NODES = collapse  # pylint: disable=protected-access
+            gc.collect()
+            start_time = time.perf_counter()
+            parse_tree = ast_raw.parse(content, 3)
+            parse_time = time.perf_counter()
+            cooked_nodes = ast_raw.cvt_parse_tree(parse_tree, 3, src_file)
+            cvt_time = time.perf_counter()
+            best[name][0] = min(best[name][0], parse_time - start_time)
+            best[name][1] = min(best[name][1], cvt_time - parse_time)
+            nodes[name] = _count_nodes(parse_tree)
+            cooked_json[name] = cooked_nodes.as_json_str()
+            del parse_tree, cooked_nodes
+    ast_raw._EXPR_NODES = expr_nodes  # pylint: disable=protected-access
+    for name, _ in configs:
+        print('{:12s} nodes: {:7d}  parse: {:7.3f} sec  cvt: {:7.3f} sec'.
+              format(name, nodes[name], *best[name]))
+    assert cooked_json['collapse'] == cooked_json['no collapse']
+
+
+if __name__ == '__main__':
+    main()
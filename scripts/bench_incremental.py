@@ -0,0 +1,53 @@
+#!/usr/bin/env python3.7
+"""Benchmark incremental reparsing of a one-line edit in a large file.
+
+Generates the synthetic module from bench_memory.py with approximately
+the given number of lines, and compares the time for parsing and
+converting the whole file (ast_raw.parse + ast_raw.cvt_parse_tree)
+with the time for incremental.Parsed.edit + cooked_nodes after a
+one-line edit near the start, middle, and end of the file (edits near
+the start are the slowest, because the Astns of all the following
+statements are shifted).
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_incremental.py [LINES]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pykythe import ast, ast_raw, incremental  # pylint: disable=wrong-import-position
+from bench_memory import synthetic_module  # pylint: disable=wrong-import-position
+
+
+def main() -> None:
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    content = synthetic_module(lines)
+    src_file = ast.make_file(
+        path='synthetic.py', content=content, encoding='utf-8')
+    print('{} lines, {:.1f} MB'.format(src_file.numlines, len(content) / 1e6))
+
+    start_time = time.perf_counter()
+    ast_raw.cvt_parse_tree(ast_raw.parse(content, 3), 3, src_file)
+    print('full parse:           {:8.3f} sec'.format(time.perf_counter() -
+                                                     start_time))
+    parsed = incremental.parse(src_file, 3)
+
+    for where in 0.01, 0.5, 0.99:
+        # Change `gamma = alpha + ...` to `gammas = alpha + ...`
+        offset = content.index(b'    gamma = ', int(len(content) * where))
+        edit = incremental.Edit(
+            start=offset + 9, end=offset + 9, text=b's')
+        start_time = time.perf_counter()
+        parsed.edit([edit]).cooked_nodes()
+        print('edit at {:3.0f}% of file: {:8.3f} sec'.format(
+            where * 100,
+            time.perf_counter() - start_time))
+
+
+if __name__ == '__main__':
+    main()
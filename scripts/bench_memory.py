@@ -0,0 +1,115 @@
+#!/usr/bin/env python3.7
+"""Benchmark the memory used by the cooked and FQN trees of a large file.
+
+Generates a synthetic module (classes and functions with a mix of
+names, calls, comprehensions, etc.) with approximately the given
+number of lines, and reports the time and the memory (from
+tracemalloc) for each processing stage, plus the number of
+ast_cooked/ast nodes in the trees. tracemalloc slows things down
+considerably, so the times are only useful for comparison.
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_memory.py [LINES [FRONT_END]]
+where FRONT_END is lib2to3 (the default) or cpython.
+"""
+
+import collections
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Counter  # pylint: disable=unused-import
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pykythe import ast, ast_cooked, ast_cpython, ast_raw, pod  # pylint: disable=wrong-import-position
+
+_CHUNK = '''
+class Widget{i}(Base):
+    """Docstring {i}."""
+    limit = {i}
+
+    def method(self, value, *args, **kwargs):
+        result = [item.name for item in self.items if item.size > value]
+        total = sum(x * 2 for x in range(self.limit))
+        self.cache[value] = (result, total, "label {i}")
+        return helper(result, total, key=value) or self.default
+
+
+def function{i}(alpha, beta=None):
+    gamma = alpha + (beta or 0) * {i}
+    for index, element in enumerate(alpha):
+        if element is not None and index % 2:
+            gamma += element
+    return Widget{i}(gamma).method(gamma)
+'''
+
+
+def synthetic_module(lines: int) -> bytes:
+    """Create a module with approximately `lines` lines."""
+    chunks = ['import os\nfrom helpers import Base, helper\n']
+    for i in range(max(1, lines // _CHUNK.count('\n'))):
+        chunks.append(_CHUNK.format(i=i))
+    return ''.join(chunks).encode('utf-8')
+
+
+def count_nodes(tree: Any) -> 'Counter[str]':
+    """Count the distinct pod.PlainOldData objects in a tree."""
+    counts = collections.Counter()  # type: Counter[str]
+    seen = set()
+    stack = [tree]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, pod.PlainOldData):
+            counts[value.__class__.__name__] += 1
+            stack.extend(
+                getattr(value, slot) for slot in value._all_slots)  # pylint: disable=protected-access
+    return counts
+
+
+def main() -> None:
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    front_end = sys.argv[2] if len(sys.argv) > 2 else 'lib2to3'
+    content = synthetic_module(lines)
+    src_file = ast.make_file(
+        path='synthetic.py', content=content, encoding='utf-8')
+    print('{} lines, {:.1f} MB, front end {}'.format(
+        src_file.numlines, len(content) / 1e6, front_end))
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    if front_end == 'cpython':
+        cooked_nodes = ast_cpython.cvt_file(src_file, 3)
+    else:
+        parse_tree = ast_raw.parse(content, 3)
+        cooked_nodes = ast_raw.cvt_parse_tree(parse_tree, 3, src_file)
+        del parse_tree
+    gc.collect()
+    cooked_time = time.perf_counter()
+    cooked_mem, cooked_peak = tracemalloc.get_traced_memory()
+    fqn_ctx = ast_cooked.FqnCtx.for_module('synthetic', 3)
+    add_fqns = cooked_nodes.add_fqns(fqn_ctx)
+    fqn_time = time.perf_counter()
+    fqn_mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('cooked: {:6.2f} sec {:7.1f} MB (peak while parsing: {:.1f} MB)'.
+          format(cooked_time - start_time, cooked_mem / 1e6,
+                 cooked_peak / 1e6))
+    print('fqn:    {:6.2f} sec {:7.1f} MB (additional)'.format(
+        fqn_time - cooked_time, (fqn_mem - cooked_mem) / 1e6))
+    for name, tree in ('cooked', cooked_nodes), ('fqn', add_fqns):
+        counts = count_nodes(tree)
+        print('{} nodes: {} ({} Astn)'.format(name, sum(counts.values()),
+                                              counts['Astn']))
+
+
+if __name__ == '__main__':
+    main()
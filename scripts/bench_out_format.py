@@ -0,0 +1,202 @@
+#!/usr/bin/env python3.7
+"""Benchmark the fqn_expr output formats: JSON vs Prolog terms.
+
+Processes each source file (by default, test_data/**/*.py) and writes
+its fqn_expr output in both formats (--out_format=json and
+--out_format=prolog), showing the total sizes and writing times. Then
+(if swipl is available; $SWIPL_EXE or swipl on $PATH) it reads all the
+outputs in SWI-Prolog the way pykythe.pl does (read_fqn_expr_json/2
+for JSON, read_term/3 for Prolog terms), REPEAT times, and shows for
+each format the best CPU time, the memory allocated on the global stack
+while reading (including the garbage), and the memory retained by the
+result. It also checks that both formats give identical terms.
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_out_format.py [REPEAT [SRCPATH...]]
+"""
+
+import glob
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pykythe import api, pod  # pylint: disable=wrong-import-position
+
+_TOP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+_FORMATS = api.OUT_FORMATS
+
+# Reads all the files (path/2 facts) in each format, writing a line
+# per format: FORMAT CPU-SECONDS ALLOCATED-BYTES RETAINED-BYTES, and
+# then whether the terms are the same.
+_BENCH_PL = r'''
+:- use_module({fqn_expr_json}, [read_fqn_expr_json/2]).
+:- use_module(library(apply), [maplist/3]).
+:- initialization(main, main).
+
+{paths}
+
+main :-
+    read_all(json, JsonTerms),
+    read_all(prolog, PrologTerms),
+    (  JsonTerms == PrologTerms
+    -> format('same yes~n')
+    ;  format('same no~n')
+    ).
+
+read_all(Format, Terms) :-
+    findall(Path, path(Format, Path), Paths),
+    findall(CpuTime-Terms0,
+            ( between(1, {repeat}, _),
+              read_files(Format, Paths, CpuTime, Allocated, Retained, Terms0),
+              format('~w ~9f ~d ~d~n', [Format, CpuTime, Allocated, Retained])
+            ),
+            [_-Terms|_]).
+
+read_files(Format, Paths, CpuTime, Allocated, Retained, Terms) :-
+    garbage_collect,
+    statistics(globalused, Used0),
+    statistics(garbage_collection, [_, Freed0|_]),
+    statistics(cputime, Time0),
+    maplist(read_file(Format), Paths, Terms),
+    statistics(cputime, Time1),
+    statistics(globalused, Used1),
+    statistics(garbage_collection, [_, Freed1|_]),
+    garbage_collect,
+    statistics(globalused, Used2),
+    CpuTime is Time1 - Time0,
+    Allocated is Used1 - Used0 + Freed1 - Freed0,
+    Retained is Used2 - Used0.
+
+read_file(Format, Path, [Meta, Nodes]) :-
+    setup_call_cleanup(open(Path, read, Stream),
+                       read_items(Format, Stream, Meta, Nodes),
+                       close(Stream)).
+
+read_items(json, Stream, Meta, Nodes) :-
+    read_fqn_expr_json(Stream, Meta),
+    read_fqn_expr_json(Stream, Nodes).
+read_items(prolog, Stream, Meta, Nodes) :-
+    read_term(Stream, Meta, [double_quotes(string)]),
+    read_term(Stream, Nodes, [double_quotes(string)]).
+'''
+
+
+def _write_outputs(srcpaths: List[str], out_dir: str
+                   ) -> Tuple[Dict[str, List[str]], Dict[str, float],
+                              Dict[str, int]]:
+    """Write each source's fqn_expr output in each format.
+
+    Returns:
+      The output paths, total writing times, and total sizes, for each
+      format.
+    """
+    out_paths = {out_format: [] for out_format in _FORMATS
+                }  # type: Dict[str, List[str]]
+    write_times = dict.fromkeys(_FORMATS, 0.0)
+    sizes = dict.fromkeys(_FORMATS, 0)
+    for i, srcpath in enumerate(srcpaths):
+        with open(srcpath, 'rb') as src_f:
+            content = src_f.read()
+        meta, cooked_nodes, fqn_ctx = api.cook_source(
+            content,
+            path=os.path.relpath(srcpath, _TOP_DIR),
+            module=os.path.splitext(os.path.basename(srcpath))[0],
+            corpus='',
+            root='',
+            python_version=3,
+            front_end='lib2to3')
+        add_fqns = cooked_nodes.add_fqns(fqn_ctx)
+        for out_format in _FORMATS:
+            best_time = float('inf')
+            for _ in range(3):
+                with io.StringIO() as out:
+                    start_time = time.perf_counter()
+                    api.write_fqn_expr(meta, add_fqns, out, out_format)
+                    best_time = min(best_time,
+                                    time.perf_counter() - start_time)
+                    output = out.getvalue()
+            write_times[out_format] += best_time
+            sizes[out_format] += len(output)
+            out_path = os.path.join(out_dir, '{}.{}'.format(i, out_format))
+            with open(out_path, 'w') as out_f:
+                out_f.write(output)
+            out_paths[out_format].append(out_path)
+    return out_paths, write_times, sizes
+
+
+def _read_outputs(swipl: str, out_paths: Dict[str, List[str]], out_dir: str,
+                  repeat: int) -> None:
+    """Read the outputs in SWI-Prolog and show the results."""
+    bench_pl = os.path.join(out_dir, 'bench.pl')
+    with open(bench_pl, 'w') as bench_f:
+        bench_f.write(
+            _BENCH_PL.replace(
+                '{fqn_expr_json}',
+                pod._prolog_quote(  # pylint: disable=protected-access
+                    os.path.join(_TOP_DIR, 'pykythe', 'fqn_expr_json'),
+                    "'")).replace(
+                        '{paths}', ''.join(
+                            'path({}, {}).\n'.format(
+                                out_format,
+                                pod._prolog_quote(path, "'"))  # pylint: disable=protected-access
+                            for out_format in _FORMATS
+                            for path in out_paths[out_format])).replace(
+                                '{repeat}', str(repeat)))
+    result = subprocess.run([swipl, '-q', bench_pl],
+                            check=True,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    best = {}  # type: Dict[str, Tuple[float, int, int]]
+    same = None
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if fields[0] == 'same':
+            same = fields[1]
+        else:
+            cpu_time, allocated, retained = (float(fields[1]), int(fields[2]),
+                                             int(fields[3]))
+            best[fields[0]] = min(
+                best.get(fields[0], (cpu_time, allocated, retained)),
+                (cpu_time, allocated, retained))
+    print('Read in SWI-Prolog (best of {}):'.format(repeat))
+    for out_format in _FORMATS:
+        cpu_time, allocated, retained = best[out_format]
+        print('  {:7s} {:7.3f} sec  allocated: {:8.1f} MB  '
+              'retained: {:8.1f} MB'.format(out_format, cpu_time,
+                                            allocated / 1024 / 1024,
+                                            retained / 1024 / 1024))
+    print('  read speed-up: {:.2f}x  identical terms: {}'.format(
+        best['json'][0] / best['prolog'][0], same))
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    srcpaths = sys.argv[2:] or sorted(
+        glob.glob(os.path.join(_TOP_DIR, 'test_data', '**', '*.py'),
+                  recursive=True))
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_paths, write_times, sizes = _write_outputs(srcpaths, out_dir)
+        print('{} files'.format(len(srcpaths)))
+        print('Written by the front end:')
+        for out_format in _FORMATS:
+            print('  {:7s} {:7.3f} sec  size: {:8.1f} KB'.format(
+                out_format, write_times[out_format],
+                sizes[out_format] / 1024))
+        swipl = os.environ.get('SWIPL_EXE') or shutil.which('swipl')
+        if swipl:
+            _read_outputs(swipl, out_paths, out_dir, repeat)
+        else:
+            print('swipl not found: reading not measured')
+
+
+if __name__ == '__main__':
+    main()
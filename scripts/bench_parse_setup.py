@@ -0,0 +1,54 @@
+#!/usr/bin/env python3.7
+"""Benchmark the per-parse setup cost of ast_raw.parse.
+
+Compares creating a new lib2to3 driver for each parse (which is what
+ast_raw.parse used to do) with the cached driver from
+ast_raw._parser_driver, both for the setup alone and for parsing a
+small source.
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_parse_setup.py [REPEAT]
+"""
+
+import logging
+import os
+import sys
+import timeit
+from lib2to3 import pygram
+from lib2to3.pgen2 import driver
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pykythe import ast_raw  # pylint: disable=wrong-import-position
+
+_SRC = 'def f(x):\n    return x + 1\n'
+
+
+def _new_driver() -> driver.Driver:
+    """Create a driver the way ast_raw.parse used to."""
+    return driver.Driver(
+        pygram.python_grammar,
+        convert=ast_raw._convert,  # pylint: disable=protected-access
+        logger=logging.getLogger('pykythe'))
+
+
+def _cached_driver() -> driver.Driver:
+    return ast_raw._parser_driver(3)  # pylint: disable=protected-access
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name, get_driver in (('new driver per parse', _new_driver),
+                             ('cached driver', _cached_driver)):
+        setup_secs = timeit.timeit(get_driver, number=repeat)
+        parse_secs = timeit.timeit(
+            lambda: get_driver().parse_string(_SRC),  # pylint: disable=cell-var-from-loop
+            number=repeat)
+        print('{:22s} setup: {:7.2f} usec/parse  setup+parse: {:7.2f} '
+              'usec/parse'.format(name, setup_secs / repeat * 1e6,
+                                  parse_secs / repeat * 1e6))
+
+
+if __name__ == '__main__':
+    main()
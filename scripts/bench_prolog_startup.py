@@ -0,0 +1,90 @@
+#!/usr/bin/env python3.7
+"""Benchmark the start-up time of pykythe.pl: source vs saved state.
+
+Runs pykythe.pl on an empty file, which is dominated by start-up,
+both from source (`swipl -O pykythe/pykythe.pl`, which compiles it
+each time) and from a saved state (built by scripts/pykythe_qsave.pl,
+as for `make pykythe_saved`). For reference, it also shows the time for
+just the Python front end (--parsecmd) on the same file, and the time
+and size for building the saved state.
+
+Requires swipl ($SWIPL_EXE or swipl on $PATH).
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_prolog_startup.py [REPEAT]
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+_TOP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _run_times(cmd: List[str], repeat: int, kytheout_dir: str) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        # Remove the previous output, so that it isn't reused.
+        shutil.rmtree(kytheout_dir, ignore_errors=True)
+        start_time = time.perf_counter()
+        subprocess.run(cmd, cwd=_TOP_DIR, check=True)
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    swipl = os.environ.get('SWIPL_EXE') or shutil.which('swipl')
+    if not swipl:
+        print('swipl not found')
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        saved_state = os.path.join(tmp_dir, 'pykythe.saved')
+        start_time = time.perf_counter()
+        subprocess.run([
+            swipl, '-O', '-q', '-g',
+            'pykythe_qsave("{}")'.format(saved_state), '-t', 'halt',
+            os.path.join('scripts', 'pykythe_qsave.pl')
+        ],
+                       cwd=_TOP_DIR,
+                       check=True)
+        print('build saved state: {:7.3f} sec  size: {:8.1f} KB'.format(
+            time.perf_counter() - start_time,
+            os.path.getsize(saved_state) / 1024))
+        srcpath = os.path.join(tmp_dir, 'empty.py')
+        with open(srcpath, 'wb'):
+            pass
+        kytheout_dir = os.path.join(tmp_dir, 'KYTHE')
+        parsecmd = '{} -B -m pykythe'.format(sys.executable)
+        args = [
+            '--', '--kytheout=' + kytheout_dir, '--parsecmd=' + parsecmd,
+            '--pythonpath=' + tmp_dir, srcpath
+        ]
+        configs = (
+            ('parsecmd', parsecmd.split() + [
+                '--srcpath', srcpath, '--module', 'empty', '--out_fqn_expr',
+                os.path.join(tmp_dir, 'empty.fqn-expr')
+            ]),
+            ('source', [
+                swipl, '-O', '-q', '-g', 'pykythe:pykythe_main',
+                os.path.join('pykythe', 'pykythe.pl')
+            ] + args),
+            ('saved', [saved_state] + args),
+        )
+        medians = {}
+        for name, cmd in configs:
+            times = _run_times(cmd, repeat, kytheout_dir)
+            medians[name] = statistics.median(times)
+            print('{:8s} min: {:7.3f} sec  median: {:7.3f} sec'.format(
+                name, min(times), medians[name]))
+        print('saved state speed-up (median): {:.2f}x'.format(
+            medians['source'] / medians['saved']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3.7
+"""Benchmark the start-up time of the Python front end.
+
+Runs `python -m pykythe` on an empty file, which is dominated by
+start-up (importing the modules), and compares it with the time for
+just starting Python. Also shows the slowest imports, from
+`python -X importtime`.
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_startup.py [REPEAT]
+"""
+
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+_TOP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Lines from -X importtime look like:
+#   import time:       self [us] |       cumulative | imported package
+_IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (.*)$')
+
+
+def _run_times(cmd: List[str], repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(cmd, cwd=_TOP_DIR, check=True)
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def _import_times() -> List[Tuple[int, int, str]]:
+    """Return (self, cumulative, module) for importing pykythe.__main__."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import pykythe.__main__'],
+        cwd=_TOP_DIR,
+        check=True,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+    times = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            times.append((int(match.group(1)), int(match.group(2)),
+                          match.group(3).strip()))
+    return times
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        srcpath = os.path.join(tmp_dir, 'empty.py')
+        with open(srcpath, 'wb'):
+            pass
+        configs = (
+            ('python', [sys.executable, '-c', 'pass']),
+            ('pykythe', [
+                sys.executable, '-m', 'pykythe', '--srcpath', srcpath,
+                '--module', 'empty', '--out_fqn_expr',
+                os.path.join(tmp_dir, 'empty.fqn-expr')
+            ]),
+        )
+        for name, cmd in configs:
+            times = _run_times(cmd, repeat)
+            print('{:8s} min: {:7.3f} sec  median: {:7.3f} sec'.format(
+                name, min(times), statistics.median(times)))
+    import_times = _import_times()
+    print('import pykythe.__main__: {:7.3f} sec'.format(
+        import_times[-1][1] / 1e6))
+    print('slowest imports (self time):')
+    for self_us, cumulative_us, module in sorted(import_times,
+                                                 reverse=True)[:10]:
+        print('  {:7.3f} sec (cumulative {:7.3f} sec)  {}'.format(
+            self_us / 1e6, cumulative_us / 1e6, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3.7
+"""Benchmark pykythe.tokenizer against lib2to3's tokenizer.
+
+Tokenizes each file with both tokenizers (and parses it with both, using
+the cached lib2to3 driver) and shows the total times.
+
+Usage (from the top-level directory):
+    python3.7 -B scripts/bench_tokenizer.py [FILE...]
+(default: the pykythe/*.py files)
+"""
+
+import glob
+import io
+import os
+import sys
+import time
+from lib2to3.pgen2 import tokenize
+from typing import Any, Callable, Iterable
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pykythe import ast_raw, tokenizer  # pylint: disable=wrong-import-position
+
+
+def _lib2to3_tokens(src_str: str) -> Iterable[Any]:
+    return tokenize.generate_tokens(io.StringIO(src_str).readline)
+
+
+def _time(func: Callable[[], Any], repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def main() -> None:
+    srcpaths = sys.argv[1:] or sorted(
+        glob.glob(
+            os.path.join(os.path.dirname(__file__), '..', 'pykythe', '*.py')))
+    parser_driver = ast_raw._parser_driver(3)  # pylint: disable=protected-access
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for srcpath in srcpaths:
+        with open(srcpath, 'rb') as src_f:
+            src_bytes = src_f.read()
+        with io.BytesIO(src_bytes) as src_f:
+            encoding, _ = tokenize.detect_encoding(src_f.readline)  # type: ignore
+        src_str = src_bytes.decode(encoding)
+        generators = [_lib2to3_tokens, tokenizer.generate_tokens]
+        for i, generate_tokens in enumerate(generators):
+            # pylint: disable=cell-var-from-loop
+            totals[i] += _time(lambda: list(generate_tokens(src_str)))
+            totals[i + 2] += _time(
+                lambda: parser_driver.parse_tokens(generate_tokens(src_str)))
+    print('{} files'.format(len(srcpaths)))
+    for name, tokenize_time, parse_time in (('lib2to3', totals[0], totals[2]),
+                                            ('tokenizer', totals[1],
+                                             totals[3])):
+        print('{:10s} tokenize: {:7.3f} sec  parse: {:7.3f} sec'.format(
+            name, tokenize_time, parse_time))
+    print('tokenize speed-up: {:.2f}x'.format(totals[0] / totals[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+% -*- mode: Prolog -*-
+
+%% Create a saved state of pykythe.pl: a stand-alone executable with
+%% everything preloaded (including the edcg expansion, the rdet/1
+%% declarations and autoloaded predicates), so that it starts without
+%% compiling anything. From the top-level directory:
+%%     swipl -O -q -g 'pykythe_qsave("OUTPUT")' -t halt scripts/pykythe_qsave.pl
+%% (see the pykythe_saved target in the Makefile). OUTPUT takes the same
+%% arguments as pykythe.pl:
+%%     OUTPUT -- --kytheout=... --parsecmd=... SRC_PATH
+%% is the same as
+%%     swipl -O -g pykythe:pykythe_main pykythe/pykythe.pl -- --kytheout=... --parsecmd=... SRC_PATH
+
+:- use_module('../pykythe/pykythe', [pykythe_main/0]).
+
+%! pykythe_qsave(+Output) is det.
+%% Create the saved state Output, which runs pykythe_main/0.
+pykythe_qsave(Output) :-
+    %% pykythe.pl turns off the "autoload" flag, so load everything
+    %% that might be autoloaded now, instead of when the saved state
+    %% runs (the flag is saved with the state).
+    set_prolog_flag(autoload, true),
+    autoload_all,
+    set_prolog_flag(autoload, false),
+    qsave_program(Output, [stand_alone(true),
+                           goal(pykythe:pykythe_main),
+                           toplevel(halt),
+                           autoload(false)]).
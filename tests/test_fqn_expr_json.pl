@@ -0,0 +1,112 @@
+% -*- mode: Prolog -*-
+
+%% Unit tests for fqn_expr_json.pl (run by "make test_fqn_expr_json").
+%%
+%% The JSON in the literal tests is what pod.PlainOldDataExtended.write_json
+%% outputs (non-ASCII characters are written as "\u" escapes, with
+%% surrogate pairs for characters outside the Basic Multilingual Plane).
+%% The round_trip test reads the same fqn_expr output from pykythe
+%% with --out_format=json and --out_format=prolog (the files named by
+%% the environment variables FQN_EXPR_JSON and FQN_EXPR_PROLOG) and
+%% checks that read_fqn_expr_json/2 gives the same terms as
+%% read_term/3 on the Prolog output (see read_nodes_json/4 and
+%% read_nodes_terms/4 in pykythe.pl).
+
+:- use_module(library(plunit)).
+:- use_module('../pykythe/fqn_expr_json', [read_fqn_expr_json/2]).
+
+:- begin_tests(fqn_expr_json).
+
+%! json_term(+Json:string, -Term) is det.
+%% Read a single item from a string, checking that only the newline
+%% after it is left.
+json_term(Json, Term) :-
+    setup_call_cleanup(
+        open_string(Json, Stream),
+        ( read_fqn_expr_json(Stream, Term),
+          read_string(Stream, _, Rest) ),
+        close(Stream)),
+    assertion(Rest == "\n").
+
+test(scalars) :-
+    json_term("{\"kind\": \"str\", \"value\": \"abc\"}\n", Str),
+    assertion(Str == str("abc")),
+    json_term("{\"kind\": \"int\", \"value\": -42}\n", Int),
+    assertion(Int == int(-42)),
+    json_term("{\"kind\": \"bool\", \"value\": \"True\"}\n", True),
+    assertion(True == bool("True")),
+    json_term("{\"kind\": \"bool\", \"value\": \"False\"}\n", False),
+    assertion(False == bool("False")),
+    json_term("{\"kind\": \"None\"}\n", None),
+    assertion(None == none),
+    json_term("[]\n", Empty),
+    assertion(Empty == []).
+
+test(non_bmp) :-
+    json_term("{\"kind\": \"str\", \"value\": \"x\\ud83d\\ude00\\u00e9\\n\\\"\\\\\"}\n",
+              Term),
+    string_codes(Expected, [0'x, 0x1F600, 0xE9, 0'\n, 0'", 0'\\]),
+    assertion(Term == str(Expected)).
+
+test(nested_slots) :-
+    json_term("{\"kind\": \"NameBindsFqn\", \"slots\": {\"name\": {\"kind\": \"Astn\", \"slots\": {\"value\": {\"kind\": \"str\", \"value\": \"x\\ud83d\\ude00\\u00e9\"}, \"start\": {\"kind\": \"int\", \"value\": 0}, \"end\": {\"kind\": \"int\", \"value\": 1}}}, \"fqn\": {\"kind\": \"str\", \"value\": \"m.\\ud83d\\ude00\"}}}\n",
+              Term),
+    string_codes(Value, [0'x, 0x1F600, 0xE9]),
+    string_codes(Fqn, [0'm, 0'., 0x1F600]),
+    assertion(Term == 'NameBindsFqn'{name: 'Astn'{value: str(Value),
+                                                  start: int(0),
+                                                  end: int(1)},
+                                     fqn: str(Fqn)}).
+
+test(dict) :-
+    json_term("{\"kind\": \"FileInput\", \"slots\": {\"path\": {\"kind\": \"str\", \"value\": \"p\"}, \"stmts\": [], \"scope_bindings\": {\"kind\": \"dict\", \"items\": {\"a\": {\"kind\": \"bool\", \"value\": \"True\"}, \"b\": {\"kind\": \"None\"}, \"c\": [{\"kind\": \"int\", \"value\": 1}, {\"kind\": \"bool\", \"value\": \"False\"}], \"\\ud83d\\ude00\": {\"kind\": \"str\", \"value\": \"x\"}}}}}\n",
+              Term),
+    atom_codes(Key, [0x1F600]),
+    dict_pairs(Bindings, dict, [a-bool("True"),
+                                b-none,
+                                c-[int(1), bool("False")],
+                                Key-str("x")]),
+    assertion(Term == 'FileInput'{path: str("p"),
+                                  stmts: [],
+                                  scope_bindings: Bindings}).
+
+test(slot_named_kind) :-
+    %% A slot called "kind" isn't mistaken for the object's kind.
+    json_term("{\"kind\": \"Node\", \"slots\": {\"kind\": {\"kind\": \"str\", \"value\": \"k\"}}}\n",
+              Term),
+    assertion(Term == 'Node'{kind: str("k")}).
+
+test(bad_kind, [error(syntax_error(fqn_expr_json_kind("str", [])))]) :-
+    json_term("{\"kind\": \"str\"}\n", _).
+
+test(round_trip, [condition(( getenv('FQN_EXPR_JSON', _),
+                              getenv('FQN_EXPR_PROLOG', _) ))]) :-
+    getenv('FQN_EXPR_JSON', JsonPath),
+    getenv('FQN_EXPR_PROLOG', PrologPath),
+    setup_call_cleanup(
+        open(JsonPath, read, JsonStream, [encoding(utf8)]),
+        setup_call_cleanup(
+            open(PrologPath, read, PrologStream, [encoding(utf8)]),
+            round_trip_items(JsonStream, PrologStream, 0, Count),
+            close(PrologStream)),
+        close(JsonStream)),
+    assertion(Count == 2).  % Meta and FileInput
+
+%! round_trip_items(+JsonStream, +PrologStream, +Count0, -Count) is det.
+%% Compare the items in the JSON and Prolog fqn_expr outputs.
+round_trip_items(JsonStream, PrologStream, Count0, Count) :-
+    read_term(PrologStream, PrologTerm, [double_quotes(string)]),
+    (  PrologTerm == end_of_file
+    -> peek_char(JsonStream, EndChar),
+       assertion(EndChar == end_of_file),
+       Count = Count0
+    ;  read_fqn_expr_json(JsonStream, JsonTerm),
+       % read_fqn_expr_json doesn't consume the final '\n'
+       read_string(JsonStream, 1, LastChar),
+       assertion(LastChar == "\n"),
+       assertion(JsonTerm == PrologTerm),
+       Count1 is Count0 + 1,
+       round_trip_items(JsonStream, PrologStream, Count1, Count)
+    ).
+
+:- end_tests(fqn_expr_json).
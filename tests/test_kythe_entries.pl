@@ -0,0 +1,123 @@
+% -*- mode: Prolog -*-
+
+%% Unit tests for kythe_entries.pl (run by "make test_kythe_entries").
+%%
+%% The expected bytes in the encoding test were made independently of
+%% kythe_entries.pl, from the protobuf wire format. write_test_entries/1
+%% writes the test entries to a file, so that the Makefile can also
+%% check them with Kythe's entrystream.
+
+:- use_module(library(plunit)).
+:- use_module('../pykythe/kythe_entries', [write_kythe_entry/2,
+                                           read_kythe_entry/2]).
+
+%! test_entry(-Entry:dict, -Expected:dict) is nondet.
+%% An entry to be written, and what read_kythe_entry/2 gives for it.
+test_entry(json{source: json{signature: "s\U0001F600", corpus: c,
+                             path: 'p.py', language: python},
+                fact_name: '/kythe/node/kind', fact_value: anchor},
+           json{source: json{signature: "s\U0001F600", corpus: "c",
+                             path: "p.py", language: "python"},
+                fact_name: "/kythe/node/kind", fact_value: `anchor`}).
+test_entry(json{source: json{signature: "@1:2", path: "p.py",
+                             language: "python"},
+                edge_kind: "/kythe/edge/defines/binding",
+                target: json{signature: "m.f", language: "python"},
+                fact_name: "/"},
+           json{source: json{signature: "@1:2", path: "p.py",
+                             language: "python"},
+                edge_kind: "/kythe/edge/defines/binding",
+                target: json{signature: "m.f", language: "python"},
+                fact_name: "/"}).
+test_entry(json{source: json{path: "p.py"},
+                fact_name: "/kythe/text",
+                fact_value: base64('eMOpCg==')},  % "xé\n"
+           json{source: json{path: "p.py"},
+                fact_name: "/kythe/text",
+                fact_value: [0'x, 0xC3, 0xA9, 0'\n]}).
+test_entry(json{source: json{signature: Long},
+                fact_name: "/kythe/text",
+                fact_value: ""},  % empty fields aren't written
+           json{source: json{signature: Long},
+                fact_name: "/kythe/text"}) :-
+    %% A message longer than 127 bytes has a multi-byte varint length.
+    length(Codes, 300),
+    maplist(=(0'a), Codes),
+    string_codes(Long, Codes).
+
+%! write_test_entries(+Path) is det.
+%% Write all the test entries to a file.
+write_test_entries(Path) :-
+    setup_call_cleanup(
+        open(Path, write, Stream, [type(binary)]),
+        forall(test_entry(Entry, _), write_kythe_entry(Stream, Entry)),
+        close(Stream)).
+
+%! read_entries(+Path, -Entries:list(dict)) is det.
+read_entries(Path, Entries) :-
+    setup_call_cleanup(
+        open(Path, read, Stream, [type(binary)]),
+        read_entries_(Stream, Entries),
+        close(Stream)).
+
+read_entries_(Stream, Entries) :-
+    (  read_kythe_entry(Stream, Entry)
+    -> Entries = [Entry|Entries1],
+       read_entries_(Stream, Entries1)
+    ;  Entries = []
+    ).
+
+%! entry_bytes(+Entry:dict, -Bytes:list(integer)) is det.
+%% The bytes that write_kythe_entry/2 writes for Entry.
+entry_bytes(Entry, Bytes) :-
+    setup_call_cleanup(
+        tmp_file_stream(binary, Path, Out),
+        ( call_cleanup(write_kythe_entry(Out, Entry), close(Out)),
+          read_file_to_codes(Path, Bytes, [type(binary)]) ),
+        delete_file(Path)).
+
+:- begin_tests(kythe_entries).
+
+test(encoding) :-
+    test_entry(Entry, _), !,
+    entry_bytes(Entry, Bytes),
+    assertion(Bytes == [52, 10, 24, 10, 5, 115, 240, 159, 152, 128, 18, 1,
+                        99, 34, 4, 112, 46, 112, 121, 42, 6, 112, 121, 116,
+                        104, 111, 110, 34, 16, 47, 107, 121, 116, 104, 101,
+                        47, 110, 111, 100, 101, 47, 107, 105, 110, 100, 42,
+                        6, 97, 110, 99, 104, 111, 114]).
+
+test(round_trip, [cleanup(delete_file(Path))]) :-
+    tmp_file(kythe_entries, Path),
+    write_test_entries(Path),
+    read_entries(Path, Entries),
+    findall(Expected, test_entry(_, Expected), ExpectedEntries),
+    assertion(Entries == ExpectedEntries).
+
+test(long_length) :-
+    test_entry(Entry, _),
+    get_dict(source, Entry, Source),
+    get_dict(signature, Source, Signature),
+    string_length(Signature, 300), !,
+    entry_bytes(Entry, [Length0, Length1|_]),
+    assertion(Length0 >= 0x80),
+    assertion(Length1 < 0x80).
+
+test(truncated, [error(syntax_error(kythe_entry_eof))]) :-
+    test_entry(Entry, _), !,
+    entry_bytes(Entry, Bytes),
+    append(Truncated, [_], Bytes),
+    setup_call_cleanup(
+        open_codes_stream(Truncated, Stream),
+        read_kythe_entry(Stream, _),
+        close(Stream)).
+
+:- end_tests(kythe_entries).
+
+%! open_codes_stream(+Bytes:list(integer), -Stream) is det.
+%% Open a binary stream on a list of bytes.
+open_codes_stream(Bytes, Stream) :-
+    tmp_file_stream(binary, Path, Out),
+    call_cleanup(maplist(put_byte(Out), Bytes), close(Out)),
+    open(Path, read, Stream, [type(binary)]),
+    delete_file(Path).
@@ -5,22 +5,30 @@ low-level tests that were used early in development.
 """
 
 import collections
+import contextlib
 import dataclasses
 from dataclasses import dataclass
+import io
+import json
 import logging  # pylint: disable=unused-import
 import os
 import pickle
+import subprocess
 import sys
-from typing import Any, List  # pylint: disable=unused-import
+import tempfile
+from typing import IO, Any, Dict, FrozenSet, List, Optional, Set, Tuple  # pylint: disable=unused-import
 import unittest
+import unittest.mock
 from lib2to3 import pytree
-from lib2to3.pgen2 import token
+from lib2to3.pgen2 import token, tokenize
 
 # TODO: get rid of this hack?
 sys.path.insert(0,
                 os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from pykythe import (ast, ast_cooked, ast_raw, typing_debug, pod)  # pylint: disable=wrong-import-position
+import pykythe  # pylint: disable=wrong-import-position
+from pykythe import (api, ast, ast_cooked, ast_cpython, ast_raw, incremental, tokenizer, typing_debug, pod)  # pylint: disable=wrong-import-position
+from pykythe import __main__ as pykythe_main  # pylint: disable=wrong-import-position
 
 
 @dataclass(frozen=True)
@@ -53,10 +61,85 @@ class SomeData2(pod.PlainOldDataExtended):
     __slots__ = ['a', 'b', 'c']
 
 
+@pod.frozen_class
+class SomeFrozenData(pod.PlainOldData):
+    """Like SomeData, but using pod.frozen_class instead of @dataclass."""
+
+    a: int
+    b: int
+    c: int
+
+    __slots__ = ['a', 'b', 'c']
+
+    def __post_init__(self) -> None:
+        if self.a < 0:
+            raise ValueError('a < 0')
+
+
 class EmptyData(pod.PlainOldData):
     """Simple example of subclassing PlainOldData, with no contents."""
 
 
+def _json_to_prolog(value: Any) -> str:
+    """Make the Prolog term that pykythe.pl gets from fqn_expr JSON.
+
+    This is the term that read_fqn_expr_json/2 (in fqn_expr_json.pl)
+    makes from the JSON value (as loaded by json.loads), written as
+    pod.PlainOldDataExtended.write_prolog writes it.
+    """
+
+    def quote(text: str, quote_char: str) -> str:
+        return quote_char + ''.join(
+            '\\' + char if char in '"\'\\' else
+            char if ' ' <= char <= '~' else '\\x{:x}\\'.format(ord(char))
+            for char in text) + quote_char
+
+    if isinstance(value, list):
+        return '[' + ','.join(_json_to_prolog(item) for item in value) + ']'
+    kind = value['kind']
+    if kind in ('str', 'bool'):
+        return '{}({})'.format(kind, quote(value['value'], '"'))
+    if kind == 'int':
+        return 'int({})'.format(value['value'])
+    if kind == 'None':
+        return 'none'
+    if kind == 'dict':
+        tag, pairs = 'dict', value['items']
+    else:
+        tag, pairs = quote(kind, "'"), value['slots']
+    return tag + '{' + ','.join(
+        quote(key, "'") + ':' + _json_to_prolog(item)
+        for key, item in pairs.items()) + '}'
+
+
+def _test_data_srcpaths() -> List[str]:
+    """The .py files in test_data (and its subdirectories)."""
+    test_data_dir = os.path.join(os.path.dirname(__file__), '..', 'test_data')
+    srcpaths = []  # type: List[str]
+    for dirpath, _, filenames in os.walk(test_data_dir):
+        srcpaths.extend(
+            os.path.join(dirpath, filename) for filename in filenames
+            if filename.endswith('.py'))
+    return srcpaths
+
+
+def _main_options(**kwargs: Any) -> Dict[str, Any]:
+    """Keyword args for __main__._process_to_file or _batch.
+
+    The defaults are the same as the command line's; kwargs adds to
+    or overrides them.
+    """
+    options = dict(
+        kythe_corpus='',
+        kythe_root='',
+        python_version=3,
+        front_end='lib2to3',
+        dump_stages=frozenset(),
+        parse_cache_dir=None)  # type: Dict[str, Any]
+    options.update(kwargs)
+    return options
+
+
 class TestPlainOldData(unittest.TestCase):
     """Unit tests for PlainOldData."""
 
@@ -117,13 +200,115 @@ class TestPlainOldData(unittest.TestCase):
         self.assertFalse(c_1 == c_1a)
         self.assertTrue(c_1 != c_1a)
 
+    def test_frozen_class(self) -> None:
+        """Test that pod.frozen_class behaves like @dataclass(frozen=True)."""
+        a_node = SomeFrozenData(1, 2, c=3)
+        self.assertEqual(repr(a_node), 'SomeFrozenData(a=1, b=2, c=3)')
+        self.assertEqual(a_node, SomeFrozenData(a=1, b=2, c=3))
+        self.assertEqual(
+            hash(a_node), hash(SomeFrozenData(a=1, b=2, c=3)))
+        self.assertNotEqual(a_node, SomeFrozenData(a=1, b=2, c=4))
+        self.assertNotEqual(a_node, SomeData(a=1, b=2, c=3))
+        self.assertEqual(a_node.as_json_str(), SomeData(1, 2, 3).as_json_str())
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            a_node.a = 999  # type: ignore
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            del a_node.a
+        with self.assertRaises(TypeError):
+            SomeFrozenData(a=1, b=2)  # type: ignore  # pylint: disable=no-value-for-parameter
+        with self.assertRaises(ValueError):
+            SomeFrozenData(a=-1, b=2, c=3)  # __post_init__ is called
+
+    def test_compact_nodes(self) -> None:
+        """Test that nodes have no __dict__ and that names are interned."""
+        for cls in vars(ast_cooked).values():
+            if (isinstance(cls, type) and
+                    issubclass(cls, pod.PlainOldDataExtended)):
+                with self.subTest(cls=cls):
+                    self.assertFalse(hasattr(object.__new__(cls), '__dict__'))
+        self.assertEqual(ast_cooked.Stmts._all_slots, ('items',))  # pylint: disable=protected-access
+        self.assertEqual(ast.Astn._all_slots, ('value', 'start', 'end'))  # pylint: disable=protected-access
+        content = b'xyz = 1\nprint(xyz)\n'
+        src_file = ast.make_file(
+            path='intern.py', content=content, encoding='utf-8')
+        for cooked_nodes in (ast_raw.cvt_parse_tree(
+                ast_raw.parse(content, 3), 3, src_file),
+                             ast_cpython.cvt_file(src_file, 3)):
+            names = []  # type: List[str]
+            stack = [cooked_nodes]  # type: List[Any]
+            while stack:
+                value = stack.pop()
+                if isinstance(value, list):
+                    stack.extend(value)
+                elif isinstance(value, ast.Astn):
+                    if value.value == 'xyz':
+                        names.append(value.value)
+                elif isinstance(value, pod.PlainOldData):
+                    stack.extend(
+                        getattr(value, slot) for slot in value._all_slots)  # pylint: disable=protected-access
+            self.assertEqual(len(names), 2)
+            self.assertIs(names[0], names[1])
+
+    def test_write_json(self) -> None:
+        """Test that write_json gives the same output as json.dumps."""
+        leaf = pytree.Leaf(token.NAME, 'x', context=(' ', (1, 2)))  # type: ignore
+        nodes = [
+            SomeData2(a=None, b=None, c=None),
+            SomeData2(
+                a=[1, -2, [], [False, None]],
+                b=collections.OrderedDict([('k1', 'v\u00e9"\n'), ('k2', {})]),
+                c=SomeData(a=1, b='\U0001f600', c=None)),  # type: ignore
+            SomeData2(a=leaf, b=SomeData2(a=0, b=None, c=''), c=True),
+            SomeData2(
+                a={1: 'int', False: 'bool', None: 'None', 2.5: 'float'},
+                b=None,
+                c=None),
+        ]
+        for node in nodes:
+            with self.subTest(node=node):
+                expected = json.dumps(node.as_json_dict())
+                self.assertEqual(node.as_json_str(), expected)
+                with io.StringIO() as out:
+                    node.write_json(out)
+                    self.assertEqual(out.getvalue(), expected)
+        with self.assertRaises(NotImplementedError):
+            SomeData2(a=1.5, b=None, c=None).as_json_str()
+        with self.assertRaisesRegex(TypeError, 'keys must be str'):
+            SomeData2(a={(1, 2): 'tuple'}, b=None, c=None).as_json_str()
+
+    def test_write_prolog(self) -> None:
+        """Test that write_prolog gives the terms that pykythe.pl reads."""
+        leaf = pytree.Leaf(token.NAME, 'x', context=(' ', (1, 2)))  # type: ignore
+        nodes = [
+            SomeData2(a=None, b=None, c=None),
+            SomeData2(
+                a=[1, -2, [], [False, None]],
+                b=collections.OrderedDict([('k1', 'v\u00e9"\'\\\n'),
+                                           ("k'2", {})]),
+                c=SomeData2(a=1, b='\U0001f600', c='')),
+        ]
+        for node in nodes:
+            with self.subTest(node=node):
+                expected = _json_to_prolog(json.loads(node.as_json_str()))
+                self.assertEqual(node.as_prolog_str(), expected)
+                with io.StringIO() as out:
+                    node.write_prolog(out)
+                    self.assertEqual(out.getvalue(), expected)
+        self.assertEqual(
+            nodes[1].as_prolog_str(),
+            "'SomeData2'{'a':[int(1),int(-2),[],[bool(\"False\"),none]],"
+            "'b':dict{'k1':str(\"v\\xe9\\\\\"\\'\\\\\\xa\\\"),'k\\'2':dict{}},"
+            "'c':'SomeData2'{'a':int(1),'b':str(\"\\x1f600\\\"),"
+            "'c':str(\"\")}}")
+        for value in (1.5, leaf, SomeData(a=1, b=2, c=3)):
+            with self.subTest(value=value):
+                with self.assertRaises(NotImplementedError):
+                    SomeData2(a=value, b=None, c=None).as_prolog_str()
+
 
 class TestAnchor(unittest.TestCase):
     """Unit tests for anchors."""
 
-    # TODO: repeat these for '\r\n' and '\n'.
-    # TODO: add tests for non-ASCII.
-
     def test_leafs(self) -> None:
         """Simple-minded test for anchors being computed correctly."""
         # pylint: disable=too-many-locals
@@ -167,12 +352,7 @@ class TestAnchor(unittest.TestCase):
                 parse_tree, python_version, src_file)
             logging.debug('RAW= %r', parse_tree)
             logging.debug('COOKED= %r', cooked_nodes)
-            fqn_ctx = ast_cooked.FqnCtx(
-                fqn_dot='testing.',
-                bindings=collections.ChainMap(),
-                class_fqn=None,
-                class_astn=None,
-                python_version=python_version)
+            fqn_ctx = ast_cooked.FqnCtx.for_module('testing', python_version)
             add_fqns = cooked_nodes.add_fqns(fqn_ctx)
             self.assertEqual(
                 typing_debug.cast(
@@ -184,6 +364,937 @@ class TestAnchor(unittest.TestCase):
                     ('y', None),
                     ('bcd', None), ]))
 
+    def test_line_endings_and_non_ascii(self) -> None:
+        """Test anchors with non-ASCII and '\\r\\n', '\\r' line endings."""
+        lines = [
+            '# Ä comment',
+            'a, (b, 網目錦蛇) = y = 1  # Binds `a`, `b`, `網目錦蛇`',
+            '',
+            "s = '''",
+            'ß',
+            "'''; t = 'é', b",
+            '',
+            'if a == 234 and ü:  # Ref `a`',
+            '  bcd = "<br/>"',
+        ]
+        expected_types = (token.NAME, token.NUMBER, token.STRING)
+        expected = [
+            'a', 'b', '網目錦蛇', 'y', '1', 's', "'''\nß\n'''", 't', "'é'",
+            'b', 'if', 'a', '234', 'and', 'ü', 'bcd', '"<br/>"'
+        ]
+        for newline in '\n', '\r\n', '\r':
+            content = newline.join(lines + ['']).encode('utf-8')
+            src_file = ast.make_file('<>', content, 'utf-8')
+            self.assertEqual(src_file.numlines, len(lines))
+            self.assertEqual(
+                list(src_file.line_offsets[1:-1]),
+                [0] + [
+                    len(newline.join(lines[:i] + ['']).encode('utf-8'))
+                    for i in range(1, len(lines) + 1)
+                ])
+            parse_tree = ast_raw.parse(content, 3)
+            leaf_nodes = [
+                node for node in parse_tree.pre_order() if
+                isinstance(node, pytree.Leaf) and node.type in expected_types]
+            self.assertEqual(len(leaf_nodes), len(expected))
+            for node, expected_str in zip(leaf_nodes, expected):
+                anchor = src_file.astn_to_range(node)
+                self.assertEqual(
+                    content[anchor.start:anchor.end],
+                    expected_str.replace('\n', newline).encode('utf-8'))
+
+
+class TestParse(unittest.TestCase):
+    """Unit tests for ast_raw.parse."""
+
+    def test_parse_versions(self) -> None:
+        """Test that repeated parses with mixed versions work."""
+        py2_content = b'print x\nexec "x = 1"\n'
+        py3_content = b'print(x)\nexec = 1\n'
+        for _ in range(2):
+            for python_version, content in ((3, py3_content),
+                                            (2, py2_content)):
+                self.assertEqual(
+                    str(ast_raw.parse(content, python_version)),
+                    content.decode('utf-8'))
+        with self.assertRaises(Exception):
+            ast_raw.parse(py3_content, 2)  # "exec" is a keyword in Python 2
+        with self.assertRaises(Exception):
+            ast_raw.parse(py2_content, 3)  # "print x" isn't allowed
+        self.assertIs(
+            ast_raw._parser_driver(3),  # pylint: disable=protected-access
+            ast_raw._parser_driver(3))  # pylint: disable=protected-access
+
+    def test_collapsed_chains(self) -> None:
+        """Test that single-child expression chains are collapsed.
+
+        The results are compared with the cpython front end, which
+        doesn't have the chains.
+        """
+        expr_nodes = ast_raw._EXPR_NODES  # pylint: disable=protected-access
+        for src in ('x ** y\n', 'x ** -y\n', '-x ** 2\n', 'a ** b ** c\n',
+                    'x.y[1] ** z(2)\n', 'not x\n', 'x < y < z\n',
+                    'a | b ^ c & d << e + f * g // h\n',
+                    'f(x, y=1, *a, **k)\n', 'f(x for x in y if x)\n',
+                    '[x for x in y for z in x if z]\n', 'x[1:2, ...]\n',
+                    'lambda: x\n', 'x = (y)\n', 'x, = y\n', 'x.y = -z\n',
+                    'if x:\n    y = x or z and not w\n'):
+            with self.subTest(src=src):
+                content = src.encode('utf-8')
+                parse_tree = ast_raw.parse(content, 3)
+                stack = [parse_tree]
+                while stack:
+                    node = stack.pop()
+                    self.assertFalse(
+                        node.type in expr_nodes and len(node.children) == 1,
+                        node)
+                    stack.extend(node.children)
+                src_file = ast.make_file(
+                    path='chains.py', content=content, encoding='utf-8')
+                self.assertEqual(
+                    ast_raw.cvt_parse_tree(parse_tree, 3,
+                                           src_file).as_json_str(),
+                    ast_cpython.cvt_file(src_file, 3).as_json_str())
+        # `await` is a name outside `async def` (before Python 3.7)
+        content = b'await(x)\nawait ** 2\n'
+        src_file = ast.make_file(
+            path='chains.py', content=content, encoding='utf-8')
+        cooked_nodes = ast_raw.cvt_parse_tree(
+            ast_raw.parse(content, 3), 3, src_file)  # type: Any
+        stmts = cooked_nodes.stmts
+        self.assertEqual(stmts[0].expr.atom.name.value, 'await')
+        self.assertEqual(stmts[1].expr.args[0].name.value, 'await')
+
+
+class TestTokenizer(unittest.TestCase):
+    """Differential tests for tokenizer against lib2to3's tokenizer."""
+
+    def _assert_same_tokens(self, src_str: str, first_lineno: int = 1) -> None:
+        row_delta = first_lineno - 1
+
+        def tokens(generate_tokens: Any) -> Tuple[Optional[List[Any]], Any]:
+            try:
+                return list(generate_tokens()), None
+            except (tokenize.TokenError, IndentationError) as exc:
+                # The line numbers in exceptions are only shifted by
+                # tokenizer.generate_tokens.
+                return None, (type(exc), None if row_delta else exc.args)
+
+        expected = tokens(lambda: (
+            (tok_type, value, (start_row + row_delta, start_col),
+             (end_row + row_delta, end_col), line)
+            for tok_type, value, (start_row, start_col), (end_row, end_col),
+            line in tokenize.generate_tokens(io.StringIO(src_str).readline)))
+        self.assertEqual(
+            tokens(lambda: tokenizer.generate_tokens(src_str, first_lineno)),
+            expected)
+
+    def test_snippets(self) -> None:
+        """Test unusual tokens, errors and async/await."""
+        for src_str in (
+                '', 'x', '   ', 'x = ²3 + ٣.5 + ٣ + ½ + é\n',
+                '\tif x:\n\t  y\n  \f z\n', 'if 1:\n    x\n  y\n',
+                'async def f():\n  await x\n  async for y in z: pass\n'
+                'async = 1\nawait\n', '(async\n def)\n',
+                'def f():\n  async x\n', "r'abc\nx\n", "uf'x'\n",
+                "s = 'abc\\\ndef'\n", "s = 'abc\\\ndef\n", '"""abc\n',
+                "rb'''x\n'''\nF'''y'''\n", 'x = (1,\n', 'a $ b ? c\n',
+                'x = 1 \\\n + 2\n', 'f(**k) <> 3 != 4 -> :=\n',
+                'x = .5 + 1. + 1e5j + 0x_ff + 0o7 + 0b1 + 09\n',
+                'a\r\nb\r\n', '# c\n  # d\n', '\x0cx\n', 'x.y..z...w\n'):
+            for first_lineno in (1, 5):
+                with self.subTest(src_str=src_str, first_lineno=first_lineno):
+                    self._assert_same_tokens(src_str, first_lineno)
+
+    def test_files(self) -> None:
+        """Test test_data and the top-level modules of the stdlib."""
+        srcpaths = _test_data_srcpaths()
+        stdlib_dir = os.path.dirname(os.__file__)
+        srcpaths.extend(
+            os.path.join(stdlib_dir, filename)
+            for filename in os.listdir(stdlib_dir)
+            if filename.endswith('.py'))
+        for srcpath in sorted(srcpaths):
+            with self.subTest(srcpath=srcpath):
+                with open(srcpath, 'rb') as src_f:
+                    src_bytes = src_f.read()
+                with io.BytesIO(src_bytes) as src_f:
+                    encoding, _ = tokenize.detect_encoding(src_f.readline)  # type: ignore
+                self._assert_same_tokens(src_bytes.decode(encoding))
+
+
+class TestAddFqns(unittest.TestCase):
+    """Unit tests for ast_cooked.Base.add_fqns."""
+
+    def test_shared_subtrees(self) -> None:
+        """Test that subtrees without names are reused, not copied."""
+        content = b'x = [1, (2, "a")]\ny = x + 3\n'
+        src_file = ast.make_file(
+            path='shared.py', content=content, encoding='utf-8')
+        cooked_nodes = ast_raw.cvt_parse_tree(
+            ast_raw.parse(content, 3), 3, src_file)  # type: Any
+        fqn_ctx = ast_cooked.FqnCtx.for_module('shared', 3)
+        add_fqns = cooked_nodes.add_fqns(fqn_ctx)
+        x_stmt, y_stmt = add_fqns.stmts
+        # `[1, (2, "a")]` has no names, so it's the same node
+        self.assertIs(x_stmt.expr, cooked_nodes.stmts[0].expr)
+        self.assertIsInstance(x_stmt.left, ast_cooked.NameBindsFqn)
+        self.assertEqual(x_stmt.left.fqn, 'shared.x')
+        # `x + 3` has a name, so it's a new node
+        self.assertIsNot(y_stmt.expr, cooked_nodes.stmts[1].expr)
+        self.assertIs(y_stmt.expr.args[1], cooked_nodes.stmts[1].expr.args[1])
+        self.assertEqual(y_stmt.expr.args[0].fqn, 'shared.x')
+
+    def test_scope_table(self) -> None:
+        """Test ScopeTable lookups in nested scopes."""
+        module = ast_cooked.ScopeTable({'x': 'm.x', 'f': 'm.f'})
+        func = module.new_child({'y': 'm.f.<local>.y'})
+        comp = func.new_child({})
+        self.assertEqual(comp.get('x'), 'm.x')
+        self.assertEqual(comp.get('y'), 'm.f.<local>.y')
+        self.assertIsNone(comp.get('z'))
+        # Names found in enclosing scopes are remembered in the table
+        self.assertEqual(comp.fqns, {'x': 'm.x', 'y': 'm.f.<local>.y'})
+        self.assertEqual(func.fqns, {'y': 'm.f.<local>.y'})
+        comp['x'] = 'm.f.<local>.<comp_for>.x'
+        self.assertEqual(comp.get('x'), 'm.f.<local>.<comp_for>.x')
+        self.assertEqual(func.get('x'), 'm.x')
+        func.update([('z', 'm.f.<local>.z')])
+        self.assertEqual(comp.get('z'), 'm.f.<local>.z')
+        self.assertIsNone(module.get('z'))
+        # A comprehension variable shadows the outer name only after the
+        # `in` expression
+        content = b'x = 1\ny = [x for x in x]\n'
+        src_file = ast.make_file(
+            path='scopes.py', content=content, encoding='utf-8')
+        fqn_ctx = ast_cooked.FqnCtx.for_module('scopes', 3)
+        json_str = ast_raw.cvt_parse_tree(
+            ast_raw.parse(content, 3), 3,
+            src_file).add_fqns(fqn_ctx).as_json_str()
+        comp_x = 'scopes.<comp_for>[13,16].x'
+        self.assertEqual(json_str.count('"value": "{}"'.format(comp_x)), 2)
+        self.assertEqual(json_str.count('"value": "scopes.x"'), 2)
+
+    def test_node_error(self) -> None:
+        """Test that a conversion error has the innermost node."""
+        content = b'x = 42\ny = [1, (2, 42)]\n'
+        src_file = ast.make_file(
+            path='error.py', content=content, encoding='utf-8')
+        parse_tree = ast_raw.parse(content, 3)
+
+        def cvt_number(node: pytree.Base, ctx: ast_raw.Ctx) -> ast_cooked.Base:
+            if typing_debug.cast(pytree.Leaf, node).value == '42':
+                raise ValueError('bad number')
+            return ast_raw.cvt_token_number(node, ctx)
+
+        with unittest.mock.patch.dict(ast_raw._DISPATCH,  # pylint: disable=protected-access
+                                      {token.NUMBER: cvt_number}):
+            for stmt in parse_tree.children[:2]:
+                with self.subTest(stmt=str(stmt)):
+                    with self.assertRaises(ast_cooked.NodeError) as cm:
+                        ast_raw.cvt_parse_tree(stmt, 3, src_file)
+                    self.assertIsInstance(cm.exception.__cause__, ValueError)
+                    self.assertEqual(
+                        str(cm.exception),
+                        "ValueError('bad number') node=NUMBER '42' line {}"
+                        .format(stmt.get_lineno()))
+
+
+class TestDeepNesting(unittest.TestCase):
+    """Test deeply nested expressions with the default recursion limit."""
+
+    def _process(self, src: str) -> ast_cooked.Base:
+        content = src.encode('utf-8')
+        src_file = ast.make_file(
+            path='deep.py', content=content, encoding='utf-8')
+        fqn_ctx = ast_cooked.FqnCtx.for_module('deep', 3)
+        return ast_raw.cvt_parse_tree(
+            ast_raw.parse(content, 3), 3, src_file).add_fqns(fqn_ctx)
+
+    def test_deep_nesting(self) -> None:
+        """Test cvt, add_fqns and the JSON output of deep expressions."""
+        # Deeper than _MAX_JSON_DEPTH, but shallow enough for json.dumps
+        add_fqns = self._process('x = ' + '[' * 150 + 'a' + ']' * 150 + '\n')
+        self.assertEqual(add_fqns.as_json_str(),
+                         json.dumps(add_fqns.as_json_dict()))
+        depth = 3 * sys.getrecursionlimit()
+        # The last one is nested 50,000 deep in both the parse tree and
+        # the cooked nodes, far beyond what recursion could handle
+        # (only one shape is this deep because each takes seconds,
+        # mostly in lib2to3's parser).
+        for src in ('x = ' + ' + '.join(['a'] * depth) + '\n',
+                    'x = ' + '(' * depth + 'a' + ')' * depth + '\n',
+                    'x = ' + '[' * depth + 'a' + ']' * depth + '\n',
+                    'x = ' + 'f(' * depth + 'a' + ')' * depth + '\n',
+                    'x = ' + '-' * depth + 'a\n', 'x = ' + 'a.' * depth + 'b\n',
+                    'x = ' + '-' * 50000 + 'a\n'):
+            with self.subTest(src=src[:10], length=len(src)):
+                add_fqns = self._process(src)
+                json_str = add_fqns.as_json_str()
+                self.assertEqual(json_str.count('{'), json_str.count('}'))
+                self.assertEqual(json_str.count('['), json_str.count(']'))
+                self.assertTrue(json_str.endswith('}'))
+                add_fqns.as_json_dict()
+                prolog_str = add_fqns.as_prolog_str()
+                self.assertEqual(prolog_str.count('{'), prolog_str.count('}'))
+                self.assertEqual(prolog_str.count('['), prolog_str.count(']'))
+
+    def test_deep_node_error(self) -> None:
+        """Test that an error under a deep subtree isn't a RecursionError."""
+        depth = 3 * sys.getrecursionlimit()
+        with self.assertRaises(ast_cooked.NodeError) as cm:
+            api.index_source(
+                b'*b[' + b'-' * depth + b'a], = c\n',
+                path='deep.py',
+                module='deep')
+        self.assertIsInstance(cm.exception.__cause__, AssertionError)
+        self.assertEqual(
+            str(cm.exception), 'AssertionError(...) node=star_expr line 1')
+
+    def test_deep_incremental(self) -> None:
+        """Test an edit that moves a statement nested 50,000 deep."""
+        content = (b'p = 0\nq = 0\nr = 0\nx = 0\ny = ' +
+                   b' + '.join([b'a'] * 50000) + b'\n')
+        src_file = ast.make_file(
+            path='deep.py', content=content, encoding='utf-8')
+        parsed = incremental.parse(src_file, 3)
+        start = content.index(b'x = 0')
+        edited = parsed.edit(
+            [incremental.Edit(start=start, end=start, text=b'\n')])
+        edited_content = content[:start] + b'\n' + content[start:]
+        self.assertEqual(
+            edited.cooked_nodes().as_json_str(),
+            ast_raw.cvt_parse_tree(
+                ast_raw.parse(edited_content, 3), 3,
+                ast.make_file(
+                    path='deep.py', content=edited_content,
+                    encoding='utf-8')).as_json_str())
+
+
+class TestPrune(unittest.TestCase):
+    """Unit tests for pruning subtrees without names (ast_raw.PRUNE_KINDS)."""
+
+    _SRC = (b'"""Docstring."""\n'
+            b'TABLE = {1: "one", 2: ("two", -2.0), 3: [[3, 4], 5 * 6]}\n'
+            b'NAMES = [1, [2, TABLE], "x" + "y", None]\n'
+            b'PAIR = 1, 2\n'
+            b'a, b = PAIR\n'
+            b'def f(x=(1, 2)):\n'
+            b'    """Docstring."""\n'
+            b'    ...\n'
+            b'    "%s" % x\n'
+            b'    return [x, "f"]\n')
+
+    def test_prune(self) -> None:
+        """Test that pruning keeps all the names, with smaller output."""
+        unpruned = self._fqn_tree(frozenset())
+        unpruned_size = len(json.dumps(unpruned))
+        unpruned_names = self._name_astns(unpruned)
+        self.assertTrue(any('"TABLE"' in astn for astn in unpruned_names))
+        for prune in ast_raw.PRUNE_KINDS + ('', ):
+            prune_kinds = (frozenset(ast_raw.PRUNE_KINDS)
+                           if prune == '' else frozenset([prune]))
+            with self.subTest(prune=prune_kinds):
+                pruned = self._fqn_tree(prune_kinds)
+                self.assertEqual(self._name_astns(pruned), unpruned_names)
+                self.assertLess(len(json.dumps(pruned)), unpruned_size)
+        kinds = self._kinds(self._fqn_tree(frozenset(ast_raw.PRUNE_KINDS)))
+        # Only the literals in expressions with names are left: 1, 2,
+        # "x", "y" in NAMES; "%s" in `"%s" % x`; "f" in `[x, "f"]`.
+        self.assertEqual((kinds['NumberNode'], kinds['StringNode']), (2, 4))
+        self.assertEqual(kinds['ExprStmt'], 1)  # `"%s" % x`
+
+    @staticmethod
+    def _fqn_tree(prune: FrozenSet[str]) -> Any:
+        return json.loads(
+            api.index_source(
+                TestPrune._SRC,
+                path='prune_test.py',
+                module='prune_test',
+                prune=prune).decode('utf-8').split('\n')[1])
+
+    @staticmethod
+    def _walk(node: Any) -> Any:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                yield node
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+
+    @staticmethod
+    def _name_astns(tree: Any) -> List[str]:
+        """Get the Astns for names (i.e., excluding literals and operators)."""
+        excluded = set()  # type: Set[int]
+        for node in TestPrune._walk(tree):
+            if node.get('kind') in ('NumberNode', 'StringNode', 'OpNode'):
+                for slot in ('astn', 'astns', 'op_astns'):
+                    excluded.update(
+                        id(astn) for astn in TestPrune._walk(
+                            node['slots'].get(slot, [])))
+        return sorted(
+            json.dumps(astn['slots'], sort_keys=True)
+            for astn in TestPrune._walk(tree)
+            if astn.get('kind') == 'Astn' and id(astn) not in excluded)
+
+    @staticmethod
+    def _kinds(tree: Any) -> Dict[str, int]:
+        return collections.Counter(
+            node['kind'] for node in TestPrune._walk(tree) if 'kind' in node)
+
+
+class TestIncremental(unittest.TestCase):
+    """Unit tests for incremental.Parsed.edit."""
+
+    CONTENT = (b'import os\n'
+               b'x = 1\n'
+               b'\n'
+               b'def f(a):\n'
+               b'    global y\n'
+               b'    return a + x\n'
+               b'\n'
+               b'class C:\n'
+               b'    z = f(1)\n'
+               b'\n'
+               b'w = C.z + x\n')
+
+    def _cooked_json(self, content: bytes) -> str:
+        src_file = ast.make_file(
+            path='incr.py', content=content, encoding='utf-8')
+        return ast_raw.cvt_parse_tree(
+            ast_raw.parse(content, 3), 3, src_file).as_json_str()
+
+    def test_edits(self) -> None:
+        """Test that edits give the same result as a full parse."""
+        src_file = ast.make_file(
+            path='incr.py', content=self.CONTENT, encoding='utf-8')
+        parsed = incremental.parse(src_file, 3)
+        self.assertEqual(parsed.cooked_nodes().as_json_str(),
+                         self._cooked_json(self.CONTENT))
+        for old, new in ((b'return a + x', b'return a + x + 1'),
+                         (b'z = f(1)', b'zz = f(1)\n    q = 2'),
+                         (b'w = C', b'ww = C'),
+                         (b'class C:\n', b'class C:\n    pass\n'),
+                         (b'x = 1\n', b'')):
+            with self.subTest(old=old, new=new):
+                start = self.CONTENT.index(old)
+                edited = parsed.edit([
+                    incremental.Edit(
+                        start=start, end=start + len(old), text=new)
+                ])
+                content = (self.CONTENT[:start] + new +
+                           self.CONTENT[start + len(old):])
+                self.assertEqual(edited.src_file.content, content)
+                self.assertEqual(edited.cooked_nodes().as_json_str(),
+                                 self._cooked_json(content))
+
+    def test_reuse(self) -> None:
+        """Test that statements before an edit are reused."""
+        src_file = ast.make_file(
+            path='incr.py', content=self.CONTENT, encoding='utf-8')
+        parsed = incremental.parse(src_file, 3)
+        start = self.CONTENT.index(b'w = C')
+        edited = parsed.edit(
+            [incremental.Edit(start=start, end=start + 1, text=b'ww')])
+        self.assertIs(edited.stmts[0], parsed.stmts[0])
+        self.assertIs(edited.stmts[1], parsed.stmts[1])
+        with self.assertRaises(Exception):
+            parsed.edit([incremental.Edit(start=start, end=start, text=b'(')])
+
+
+class TestMain(unittest.TestCase):
+    """Unit tests for the main program."""
+
+    def test_startup_imports(self) -> None:
+        """Test that slow-to-import modules aren't imported at start-up.
+
+        See also scripts/bench_startup.py.
+        """
+        modules = ['mypy_extensions', 'pykythe.ast_cpython', 'tempfile']
+        result = subprocess.run(
+            [
+                sys.executable, '-c',
+                'import sys, pykythe.__main__; '
+                'print([m for m in {!r} if m in sys.modules])'.format(modules)
+            ],
+            cwd=os.path.join(os.path.dirname(__file__), '..'),
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(result.stdout, '[]\n')
+
+    def test_out_fqn_expr_stdout(self) -> None:
+        """Test --out_fqn_expr=- (as run by pykythe.pl's run_parse_cmd)."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcpath = os.path.join(tmp_dir, 'stdout_test.py')
+            with open(srcpath, 'w') as src_f:
+                src_f.write('x = 1\nprint(x)\n')
+
+            def run(out_fqn_expr: str, *args: str) -> bytes:
+                return subprocess.run(
+                    [
+                        sys.executable, '-B', '-m', 'pykythe',
+                        '--srcpath=' + srcpath, '--module=stdout_test',
+                        '--out_fqn_expr=' + out_fqn_expr
+                    ] + list(args),
+                    cwd=os.path.join(os.path.dirname(__file__), '..'),
+                    check=True,
+                    stdout=subprocess.PIPE).stdout
+
+            for args in ([], ['--stream_stmts']):
+                with self.subTest(args=args):
+                    out_fqn_expr = os.path.join(tmp_dir, 'out.fqn-json')
+                    self.assertEqual(run(out_fqn_expr, *args), b'')
+                    with open(out_fqn_expr, 'rb') as out_f:
+                        expected = out_f.read()
+                    self.assertEqual(run('-', *args), expected)
+                    cache_arg = '--parse_cache_dir=' + os.path.join(
+                        tmp_dir, 'cache')
+                    self.assertEqual(run('-', cache_arg, *args), expected)
+                    self.assertEqual(run('-', cache_arg, *args), expected)
+
+    def test_serve(self) -> None:
+        """Test that --serve handles multiple requests and failures."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcpath = os.path.join(tmp_dir, 'serve_test.py')
+            with open(srcpath, 'w') as src_f:
+                src_f.write('x = 1\nprint(x)\n')
+            request = {'srcpath': srcpath, 'module': 'serve_test'}
+            requests = [
+                request,
+                dict(request, srcpath=os.path.join(tmp_dir, 'missing.py')),
+                request,
+            ]
+            in_f = io.BytesIO(b''.join(
+                json.dumps(req).encode('utf-8') + b'\n' for req in requests))
+            out_f = io.BytesIO()
+            self.assertEqual(pykythe_main._serve(in_f, out_f, frozenset(), None), 0)  # pylint: disable=protected-access
+            out_f.seek(0)
+            frames = []
+            for _ in requests:
+                status, length = out_f.readline().split()
+                frames.append((status, out_f.read(int(length))))
+            self.assertEqual(out_f.read(), b'')
+            self.assertEqual([status for status, _ in frames],
+                             [b'fqn_expr', b'error', b'fqn_expr'])
+            self.assertEqual(frames[0], frames[2])
+            self.assertIn(b'FileNotFoundError', frames[1][1])
+            meta_line, fqn_line, last_line = frames[0][1].split(b'\n')
+            self.assertEqual(json.loads(meta_line)['kind'], 'Meta')
+            self.assertEqual(json.loads(fqn_line)['kind'], 'FileInput')
+            self.assertEqual(last_line, b'')
+
+    def test_batch(self) -> None:
+        """Test that --batch_manifest processes files independently."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_lines = []
+            for i in range(3):
+                srcpath = os.path.join(tmp_dir, 'batch{}.py'.format(i))
+                if i != 1:  # batch1.py doesn't exist, so fails
+                    with open(srcpath, 'w') as src_f:
+                        src_f.write('x{} = 1\nprint(x{})\n'.format(i, i))
+                manifest_lines.append('\t'.join([
+                    srcpath, 'batch{}'.format(i), srcpath + '.fqn-json']))
+            manifest_path = os.path.join(tmp_dir, 'manifest')
+            with open(manifest_path, 'w') as manifest_f:
+                manifest_f.write('# comment\n')
+                manifest_f.write('\n'.join(manifest_lines) + '\n')
+            self.assertEqual(
+                pykythe_main._batch(  # pylint: disable=protected-access
+                    manifest_path, **_main_options(jobs=2)), 1)
+            for i in 0, 2:
+                srcpath = os.path.join(tmp_dir, 'batch{}.py'.format(i))
+                with open(srcpath + '.fqn-json') as fqn_expr_f:
+                    batch_fqn_expr = fqn_expr_f.read()
+                pykythe_main._process_to_file(  # pylint: disable=protected-access
+                    **_main_options(
+                        srcpath=srcpath,
+                        module='batch{}'.format(i),
+                        out_fqn_expr=srcpath + '.expected'))
+                with open(srcpath + '.expected') as fqn_expr_f:
+                    self.assertEqual(batch_fqn_expr, fqn_expr_f.read())
+            self.assertFalse(
+                os.path.exists(os.path.join(tmp_dir, 'batch1.py.fqn-json')))
+
+    def test_parse_cache(self) -> None:
+        """Test that --parse_cache_dir reuses outputs for unchanged inputs."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            srcpath = os.path.join(tmp_dir, 'cached.py')
+            out_fqn_expr = os.path.join(tmp_dir, 'cached.fqn-json')
+
+            def process(parse_cache_dir: Optional[str],
+                        dump_stages: FrozenSet[str] = frozenset()) -> bytes:
+                pykythe_main._process_to_file(  # pylint: disable=protected-access
+                    srcpath=srcpath,
+                    module='cached',
+                    out_fqn_expr=out_fqn_expr,
+                    kythe_corpus='',
+                    kythe_root='',
+                    python_version=3,
+                    front_end='lib2to3',
+                    dump_stages=dump_stages,
+                    parse_cache_dir=parse_cache_dir)
+                with open(out_fqn_expr, 'rb') as out_f:
+                    return out_f.read()
+
+            def cache_entries() -> List[str]:
+                return sorted(
+                    os.path.join(dirpath, filename)
+                    for dirpath, _, filenames in os.walk(cache_dir)
+                    for filename in filenames)
+
+            with open(srcpath, 'w') as src_f:
+                src_f.write('x = 1\n')
+            expected = process(None)
+            self.assertEqual(process(cache_dir), expected)
+            entries = cache_entries()
+            self.assertEqual(len(entries), 1)
+            self.assertTrue(entries[0].endswith('.fqn-json'))
+            # Show that the output comes from the cache, by changing it
+            with open(entries[0], 'wb') as cache_f:
+                cache_f.write(b'from cache\n')
+            self.assertEqual(process(cache_dir), b'from cache\n')
+            # The cache isn't used when dumping stages
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(process(cache_dir, frozenset(['fqn'])),
+                                 expected)
+            # A changed source gets a new entry
+            with open(srcpath, 'w') as src_f:
+                src_f.write('x = 2\n')
+            expected = process(cache_dir)
+            self.assertNotEqual(expected, b'from cache\n')
+            self.assertEqual(len(cache_entries()), 2)
+
+            # --serve uses the same cache
+            request = json.dumps({'srcpath': srcpath, 'module': 'cached'})
+            in_f = io.BytesIO((request + '\n').encode('utf-8'))
+            out_f = io.BytesIO()
+            self.assertEqual(
+                pykythe_main._serve(in_f, out_f, frozenset(), cache_dir), 0)  # pylint: disable=protected-access
+            self.assertEqual(out_f.getvalue(),
+                             b'fqn_expr %d\n' % len(expected) + expected)
+            self.assertEqual(len(cache_entries()), 2)
+
+    def test_stream_stmts(self) -> None:
+        """Test that --stream_stmts writes one record per statement."""
+
+        def read_frames(frames_f: IO[bytes]) -> List[Tuple[bytes, Any]]:
+            frames = []  # type: List[Tuple[bytes, Any]]
+            while True:
+                kind, length = frames_f.readline().split()
+                if kind == b'end':
+                    return frames
+                payload = frames_f.read(int(length))
+                frames.append((kind, json.loads(payload.decode('ascii'))))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcpath = os.path.join(tmp_dir, 'stream_test.py')
+            with open(srcpath, 'w') as src_f:
+                src_f.write('x = 1\nprint(x)\ndef f(): return x\n')
+            options = _main_options(srcpath=srcpath, module='stream_test')
+            pykythe_main._process_to_file(  # pylint: disable=protected-access
+                out_fqn_expr=srcpath + '.fqn-json', **options)
+            pykythe_main._process_to_file(  # pylint: disable=protected-access
+                out_fqn_expr=srcpath + '.fqn-stream',
+                stream_stmts=True,
+                **options)
+            with open(srcpath + '.fqn-json') as fqn_expr_f:
+                meta, file_input = map(json.loads, fqn_expr_f)
+            with open(srcpath + '.fqn-stream', 'rb') as fqn_stream_f:
+                frames = read_frames(fqn_stream_f)
+                self.assertEqual(fqn_stream_f.read(), b'')
+            self.assertEqual([kind for kind, _ in frames],
+                             [b'meta', b'file_input'] + [b'stmt'] * 3)
+            self.assertEqual(frames[0][1], meta)
+            stmts = file_input['slots']['stmts']
+            file_input['slots']['stmts'] = []
+            self.assertEqual(frames[1][1], file_input)
+            self.assertEqual([stmt for _, stmt in frames[2:]], stmts)
+
+            request = {'srcpath': srcpath, 'module': 'stream_test',
+                       'stream_stmts': True}
+            in_f = io.BytesIO((json.dumps(request) + '\n').encode('utf-8'))
+            out_f = io.BytesIO()
+            self.assertEqual(pykythe_main._serve(in_f, out_f, frozenset(), None), 0)  # pylint: disable=protected-access
+            out_f.seek(0)
+            self.assertEqual(read_frames(out_f), frames)
+            self.assertEqual(out_f.read(), b'')
+
+    def test_frame_length(self) -> None:
+        """Test that a record's header has the payload's length in bytes."""
+        node = ast_cooked.NameBindsFqn(
+            name=ast.Astn(value='é\U0001F600', start=0, end=6),
+            fqn='m.é\U0001F600')
+        for out_format in api.OUT_FORMATS:
+            frame = pykythe_main._frame('stmt', node, out_format)  # pylint: disable=protected-access
+            header, payload = frame.split(b'\n', 1)
+            self.assertEqual(header, b'stmt %d' % len(payload))
+            with io.StringIO() as out:
+                api.write_fqn_expr_item(node, out, out_format)
+                self.assertEqual(payload.decode('utf-8'), out.getvalue())
+
+    def test_low_memory(self) -> None:
+        """Test that --low_memory gives the same output."""
+        base64_chunk = pykythe_main._BASE64_CHUNK  # pylint: disable=protected-access
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcpath = os.path.join(tmp_dir, 'low_memory_test.py')
+            with open(srcpath, 'w') as src_f:
+                src_f.write('x = 1\nprint(x)\ndef f(y): return [x + y]\n\n')
+            options = _main_options(
+                srcpath=srcpath, module='low_memory_test')
+            for stream_stmts in (False, True):
+                with self.subTest(stream_stmts=stream_stmts):
+                    pykythe_main._process_to_file(  # pylint: disable=protected-access
+                        out_fqn_expr=srcpath + '.fqn-expr',
+                        stream_stmts=stream_stmts,
+                        **options)
+                    # Use a small chunk size, to test the concatenation
+                    # of the chunks' base64 encodings
+                    pykythe_main._BASE64_CHUNK = 6  # pylint: disable=protected-access
+                    try:
+                        with contextlib.redirect_stderr(
+                                io.StringIO()) as stderr:
+                            pykythe_main._process_to_file(  # pylint: disable=protected-access
+                                out_fqn_expr=srcpath + '.fqn-low',
+                                stream_stmts=stream_stmts,
+                                low_memory=True,
+                                memory_stats=True,
+                                **options)
+                    finally:
+                        pykythe_main._BASE64_CHUNK = base64_chunk  # pylint: disable=protected-access
+                    with open(srcpath + '.fqn-expr', 'rb') as fqn_expr_f:
+                        with open(srcpath + '.fqn-low', 'rb') as fqn_low_f:
+                            self.assertEqual(fqn_low_f.read(),
+                                             fqn_expr_f.read())
+                    self.assertEqual([
+                        line.split()[2]
+                        for line in stderr.getvalue().splitlines()
+                    ], ['read', 'parse', 'cvt'] +
+                                     ([] if stream_stmts else ['meta']) +
+                                     ['fqn+write', 'done'])
+
+    def test_dump_stages(self) -> None:
+        """Test that --dump_stage dumps are only computed when requested."""
+        srcpath = os.path.join(
+            os.path.dirname(__file__), '..', 'test_data',
+            'py3_test_grammar.py')
+
+        def process(dump_stages: FrozenSet[str]) -> Tuple[int, str]:
+            """Return the number of JSON serializations, and the dumps."""
+            with io.StringIO() as err_f:
+                with contextlib.redirect_stderr(err_f), \
+                     unittest.mock.patch.object(
+                         pod.PlainOldDataExtended, 'as_json_str',
+                         autospec=True,
+                         side_effect=pod.PlainOldDataExtended.as_json_str
+                     ) as as_json_str:
+                    pykythe_main._process(  # pylint: disable=protected-access
+                        srcpath=srcpath,
+                        module='py3_test_grammar',
+                        kythe_corpus='',
+                        kythe_root='',
+                        python_version=3,
+                        front_end='lib2to3',
+                        dump_stages=dump_stages)
+                return as_json_str.call_count, err_f.getvalue()
+
+        # Serializing the cooked nodes is a substantial part of the
+        # processing, so it mustn't be done unless it's dumped.
+        json_count, dumps = process(frozenset())
+        self.assertEqual(dumps, '')
+        self.assertEqual(json_count, 0)
+        json_count, dumps = process(frozenset(['json']))
+        self.assertTrue(dumps.startswith('JSON= {"kind": "FileInput", '))
+        self.assertEqual(dumps.count('\n'), 1)
+        self.assertEqual(json_count, 1)
+        _, dumps = process(frozenset(pykythe_main._DUMP_STAGES))  # pylint: disable=protected-access
+        self.assertEqual(
+            [line.split('=', 1)[0] for line in dumps.splitlines()],
+            ['RAW', 'COOKED', 'JSON', 'FQN'])
+
+    def test_write_json_test_data(self) -> None:
+        """Test that streamed JSON matches json.dumps for test_data."""
+        srcpath = os.path.join(
+            os.path.dirname(__file__), '..', 'test_data',
+            'py3_test_grammar.py')
+        _, add_fqns = pykythe_main._process(  # pylint: disable=protected-access
+            srcpath=srcpath,
+            module='py3_test_grammar',
+            kythe_corpus='',
+            kythe_root='',
+            python_version=3,
+            front_end='lib2to3',
+            dump_stages=frozenset())
+        with io.StringIO() as out:
+            add_fqns.write_json(out)
+            self.assertEqual(out.getvalue(),
+                             json.dumps(add_fqns.as_json_dict()))
+
+    def test_out_format_prolog(self) -> None:
+        """Test that --out_format=prolog gives the same terms as the JSON."""
+        srcpath = os.path.join(
+            os.path.dirname(__file__), '..', 'test_data',
+            'py3_test_grammar.py')
+        options = _main_options(srcpath=srcpath, module='py3_test_grammar')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_fqn_expr = os.path.join(tmp_dir, 'out.fqn-expr')
+
+            def process(**kwargs: Any) -> str:
+                with contextlib.redirect_stderr(io.StringIO()):
+                    pykythe_main._process_to_file(  # pylint: disable=protected-access
+                        out_fqn_expr=out_fqn_expr, **options, **kwargs)
+                with open(out_fqn_expr) as out_f:
+                    return out_f.read()
+
+            for stream_stmts in (False, True):
+                with self.subTest(stream_stmts=stream_stmts):
+                    json_out = process(stream_stmts=stream_stmts)
+                    prolog_out = process(
+                        stream_stmts=stream_stmts, out_format='prolog')
+                    if stream_stmts:
+                        # Each record's header and payload are on
+                        # separate lines; the "end" record has none.
+                        json_lines = json_out.splitlines()
+                        prolog_lines = prolog_out.splitlines()
+                        self.assertEqual(
+                            [line.split()[0] for line in json_lines[::2]],
+                            [line.split()[0] for line in prolog_lines[::2]])
+                        json_items = json_lines[1::2]
+                        prolog_out = ''.join(
+                            line + '\n' for line in prolog_lines[1::2])
+                    else:
+                        json_items = json_out.splitlines()
+                    self.assertEqual(
+                        prolog_out, ''.join(
+                            _json_to_prolog(json.loads(item)) + '.\n'
+                            for item in json_items))
+                    self.assertEqual(
+                        process(
+                            stream_stmts=stream_stmts,
+                            out_format='prolog',
+                            low_memory=True),
+                        process(
+                            stream_stmts=stream_stmts, out_format='prolog'))
+        with self.assertRaises(ValueError):
+            api.index_source(
+                b'x = 1\n', path='x.py', module='x', out_format='xml')
+
+
+class TestApi(unittest.TestCase):
+    """Unit tests for the in-process API."""
+
+    def test_index_source(self) -> None:
+        """Test that index_source gives the same output as the command line."""
+        self.assertIs(pykythe.index_source, api.index_source)
+        content = b'import os\nx = os.path\ndef f(y): return [x + y]\n'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcpath = os.path.join(tmp_dir, 'api_test.py')
+            with open(srcpath, 'wb') as src_f:
+                src_f.write(content)
+            for front_end in ('lib2to3', 'cpython'):
+                with self.subTest(front_end=front_end):
+                    pykythe_main._process_to_file(  # pylint: disable=protected-access
+                        **_main_options(
+                            srcpath=srcpath,
+                            module='api_test',
+                            out_fqn_expr=srcpath + '.fqn-expr',
+                            kythe_corpus='CORPUS',
+                            kythe_root='ROOT',
+                            front_end=front_end))
+                    with open(srcpath + '.fqn-expr', 'rb') as fqn_expr_f:
+                        expected = fqn_expr_f.read()
+                    options = dict(
+                        path=srcpath,
+                        module='api_test',
+                        corpus='CORPUS',
+                        root='ROOT',
+                        front_end=front_end)  # type: Dict[str, Any]
+                    self.assertEqual(
+                        pykythe.index_source(content, **options), expected)
+                    with io.StringIO() as out:
+                        out.write('prefix\n')
+                        pykythe.index_source_to(out, content, **options)
+                        self.assertEqual(out.getvalue().encode('utf-8'),
+                                         b'prefix\n' + expected)
+        with self.assertRaises(Exception):
+            pykythe.index_source(b'print x\n', path='bad.py', module='bad')
+
+
+class TestCpythonFrontEnd(unittest.TestCase):
+    """Differential tests for ast_cpython against ast_raw."""
+
+    # Files that lib2to3 accepts but aren't valid Python 3.
+    INVALID_PYTHON3 = frozenset(['bindings.py', 'simple.py'])
+
+    def _fqn_expr_str(self, srcpath: str, front_end: str) -> str:
+        _, fqn_expr = pykythe_main._process(  # pylint: disable=protected-access
+            srcpath=srcpath,
+            module='test_module',
+            kythe_corpus='',
+            kythe_root='',
+            python_version=3,
+            front_end=front_end,
+            dump_stages=frozenset())
+        return fqn_expr.as_json_str()
+
+    def test_test_data(self) -> None:
+        """Test that both front ends give identical output for test_data."""
+        srcpaths = _test_data_srcpaths()
+        self.assertTrue(srcpaths)
+        for srcpath in sorted(srcpaths):
+            with self.subTest(srcpath=srcpath):
+                if os.path.basename(srcpath) in self.INVALID_PYTHON3:
+                    with self.assertRaises(SyntaxError):
+                        self._fqn_expr_str(srcpath, 'cpython')
+                else:
+                    self.assertEqual(
+                        self._fqn_expr_str(srcpath, 'cpython'),
+                        self._fqn_expr_str(srcpath, 'lib2to3'))
+
+    def test_positions(self) -> None:
+        """Test constructs whose ast positions aren't their first token."""
+        content = (
+            '# -*- coding: utf-8 -*-\n'
+            '@decorator(1)\n'
+            'class C(object):\n'
+            '    def f(self, a: "ünï" = (1, 2), *b, **c) -> int:\n'
+            '        return [(x) for x in a if x] + [{"k": v} for v in b]\n'
+            's = (\'\'\'multi\n'
+            'line\'\'\' "more")\n'
+            'if s.a is not s.b: pass\n'
+            'elif (s)[0]: pass\n'
+            'else: t = (s, s), (s) + 1, s ** -s\n'
+            'from . import (aa as bb, cc)\n')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcpath = os.path.join(tmp_dir, 'positions.py')
+            with open(srcpath, 'wb') as src_f:
+                src_f.write(content.encode('utf-8'))
+            self.assertEqual(
+                self._fqn_expr_str(srcpath, 'cpython'),
+                self._fqn_expr_str(srcpath, 'lib2to3'))
+
+    def test_python2(self) -> None:
+        """Test that the cpython front end rejects Python 2."""
+        src_file = ast.make_file(
+            path='py2.py', content=b'print x\n', encoding='utf-8')
+        with self.assertRaises(ValueError):
+            ast_cpython.cvt_file(src_file, 2)
+
+    def test_unsupported_version(self) -> None:
+        """Test that the cpython front end rejects other Pythons' ast."""
+        src_file = ast.make_file(
+            path='x.py', content=b'x = 1\n', encoding='utf-8')
+        with unittest.mock.patch.object(ast_cpython, '_SUPPORTED_VERSIONS',
+                                        ((3, 6),)):
+            if sys.version_info[:2] == (3, 6):
+                ast_cpython.cvt_file(src_file, 3)
+            else:
+                with self.assertRaisesRegex(ValueError, 'requires Python 3.6'):
+                    ast_cpython.cvt_file(src_file, 3)
+
 
 if __name__ == '__main__':
     unittest.main()